@@ -0,0 +1,249 @@
+"""
+流式统计累加器
+O(1)内存的在线统计：Welford均值/方差、最小/最大值，以及对数分桶的分位数草图
+"""
+
+import math
+from typing import Dict, Iterable, Optional
+
+
+class RunningStats:
+    """Welford在线均值/方差"""
+
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float):
+        """加入一个样本"""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def variance(self) -> float:
+        """样本方差"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        """样本标准差"""
+        return math.sqrt(self.variance)
+
+    def merge(self, other: 'RunningStats'):
+        """合并另一个累加器（并行算法）"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+class QuantileSketch:
+    """
+    对数分桶分位数草图（DDSketch思路）
+    桶数只与数值范围和相对精度有关，与样本数无关；分位数估计的相对误差不超过 relative_accuracy
+    """
+
+    __slots__ = ('relative_accuracy', '_gamma', '_log_gamma', '_buckets',
+                 'zero_count', 'count')
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: Dict[int, int] = {}
+        self.zero_count = 0  # 非正值（如零排队时间）单独计数
+        self.count = 0
+
+    def add(self, x: float):
+        """加入一个样本（仅支持非负值）"""
+        self.count += 1
+        if x <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(x) / self._log_gamma)
+        buckets = self._buckets
+        buckets[key] = buckets.get(key, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """估计q分位数"""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen > rank:
+                # 桶的代表值，保证相对误差
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, float]:
+        """一次遍历估计多个分位数"""
+        qs = sorted(qs)
+        result = {q: 0.0 for q in qs}
+        if self.count == 0:
+            return result
+        keys = sorted(self._buckets)
+        seen = self.zero_count
+        i = 0
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < self.zero_count:
+                continue
+            while i < len(keys) and seen + self._buckets[keys[i]] <= rank:
+                seen += self._buckets[keys[i]]
+                i += 1
+            key = keys[min(i, len(keys) - 1)]
+            result[q] = 2 * self._gamma ** key / (self._gamma + 1)
+        return result
+
+    def merge(self, other: 'QuantileSketch'):
+        """合并另一个草图（需相同精度）"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for key, n in other._buckets.items():
+            self._buckets[key] = self._buckets.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+
+class StreamingStats:
+    """均值/方差/极值 + P50/P95/P99 的组合累加器"""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    __slots__ = ('moments', 'sketch')
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.moments = RunningStats()
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, x: float):
+        """加入一个样本"""
+        self.moments.add(x)
+        self.sketch.add(x)
+
+    @property
+    def count(self) -> int:
+        return self.moments.count
+
+    @property
+    def mean(self) -> float:
+        return self.moments.mean
+
+    def merge(self, other: 'StreamingStats'):
+        """合并另一个累加器"""
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+
+    def summary(self, quantiles: Optional[Iterable[float]] = None) -> Dict[str, float]:
+        """统计摘要（与样本数无关的常数时间）"""
+        m = self.moments
+        result = {
+            'count': m.count,
+            'mean': m.mean,
+            'std': m.std,
+            'min': m.min if m.count else 0.0,
+            'max': m.max if m.count else 0.0,
+        }
+        for q, value in self.sketch.quantiles(quantiles or self.QUANTILES).items():
+            result[f"p{q * 100:g}"] = value
+        return result
+
+
+class TimeWeightedValue:
+    """
+    时间加权均值
+    只在数值变化时更新，按持续时间累积面积
+    """
+
+    __slots__ = ('value', 'since', 'start', 'area', 'max')
+
+    def __init__(self, value: float = 0.0, now: float = 0.0):
+        self.value = value
+        self.since = now
+        self.start = now
+        self.area = 0.0
+        self.max = value
+
+    def update(self, now: float, value: float):
+        """记录数值在now时刻变为value"""
+        self.area += self.value * (now - self.since)
+        self.value = value
+        self.since = now
+        if value > self.max:
+            self.max = value
+
+    def integral(self, now: float) -> float:
+        """截至now的时间积分（面积）"""
+        return self.area + self.value * (now - self.since)
+
+    def mean(self, now: float) -> float:
+        """截至now的时间加权均值"""
+        elapsed = now - self.start
+        if elapsed <= 0:
+            return self.value
+        return (self.area + self.value * (now - self.since)) / elapsed
+
+
+class StateTimer:
+    """
+    离散状态计时
+    只在状态切换时累计上一状态的持续时间
+    """
+
+    __slots__ = ('state', 'since', 'start', 'durations')
+
+    def __init__(self, states: Iterable[str], initial: str, now: float = 0.0):
+        self.durations = {state: 0.0 for state in states}
+        if initial not in self.durations:
+            raise ValueError(f"Unknown state: {initial}")
+        self.state = initial
+        self.since = now
+        self.start = now
+
+    def set(self, now: float, state: str):
+        """在now时刻切换到state"""
+        if state == self.state:
+            return
+        self.durations[self.state] += now - self.since
+        self.state = state
+        self.since = now
+
+    def totals(self, now: float) -> Dict[str, float]:
+        """截至now各状态的累计时间"""
+        totals = dict(self.durations)
+        totals[self.state] += now - self.since
+        return totals
+
+    def fractions(self, now: float) -> Dict[str, float]:
+        """截至now各状态的时间占比"""
+        elapsed = now - self.start
+        totals = self.totals(now)
+        if elapsed <= 0:
+            return {state: 0.0 for state in totals}
+        return {state: t / elapsed for state, t in totals.items()}
@@ -0,0 +1,507 @@
+"""
+WebSocket连接管理
+每个客户端拥有有界发送队列和独立的发送任务，广播只负责入队，
+慢客户端按策略丢弃旧消息（或按物料合并），超时或出错的连接自动剔除；
+订阅状态同步的客户端连接时先收到当前状态快照，之后定期收到关键帧；
+客户端可订阅逐条事件流、按仿真时间窗口聚合的KPI流或两者，
+并可设置视口范围，只接收视口内的物料事件；
+订阅移动段的客户端以每跳一条的移动段代替逐条物料事件，按路线表在本地插值
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from fastapi import WebSocket
+
+from kpi import DEFAULT_KPI_WINDOW, KpiAggregator, STREAM_BOTH, STREAM_KPI, STREAM_RAW, STREAMS
+from live_state import FINAL_EVENTS, LiveState, MSG_KEYFRAME, TERMINAL_EVENTS
+from metrics import Histogram
+from protocol import BinaryEncoder, PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOLS
+from spatial import MSG_VIEWPORT, SpatialIndex, Viewport, parse_bbox
+from trajectory import RoutePlanner, TrajectoryTracker
+
+# 队列满时的处理策略
+POLICY_DROP_OLDEST = 'drop_oldest'   # 丢弃最早的消息
+POLICY_CONFLATE = 'conflate'         # 积压时同一物料只保留最新事件，仍满时丢弃最早的消息
+POLICIES = (POLICY_DROP_OLDEST, POLICY_CONFLATE)
+
+# 客户端编号（指标标签）
+_client_ids = itertools.count(1)
+
+
+class ClientConnection:
+    """单个WebSocket客户端：协商的推送协议 + 有界发送队列"""
+
+    def __init__(self, websocket: WebSocket, protocol: str = PROTOCOL_JSON,
+                 batch_ms: float = 50, compress: bool = False,
+                 max_queue: int = 1000, policy: str = POLICY_DROP_OLDEST,
+                 send_timeout: float = 5.0, max_overflow: Optional[int] = None,
+                 sync_state: bool = False, stream: str = STREAM_RAW, moves: bool = False,
+                 conflate_after: Optional[int] = None):
+        """
+        :param max_queue: 发送队列上限
+        :param policy: 队列满时的策略（见 POLICIES）
+        :param send_timeout: 单次发送超时（秒），超时视为慢客户端并剔除
+        :param max_overflow: 两次成功发送之间允许丢弃的消息数，超过即剔除，默认为队列上限的10倍
+        :param sync_state: 是否接收连接时的状态快照和周期性关键帧
+        :param stream: 订阅的推送流：raw（逐条事件）、kpi（窗口聚合）或 both
+        :param moves: 物料事件以移动段代替（连接时先收到路线表）
+        :param conflate_after: 合并策略下队列积压到该深度后才合并同一物料的事件，默认为队列上限的一半
+        """
+        self.websocket = websocket
+        self.id = next(_client_ids)
+        self.protocol = protocol
+        self.batch_interval = max(batch_ms, 1) / 1000
+        self.encoder = BinaryEncoder(compress=compress) if protocol == PROTOCOL_BINARY else None
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.conflate_after = max(0, conflate_after if conflate_after is not None
+                                  else self.max_queue // 2)
+        self.send_timeout = send_timeout
+        self.max_overflow = max_overflow if max_overflow is not None else self.max_queue * 10
+        self.sync_state = sync_state
+        self.stream = stream
+        self.wants_raw = stream in (STREAM_RAW, STREAM_BOTH)
+        self.wants_kpi = stream in (STREAM_KPI, STREAM_BOTH)
+        self.moves = moves
+        # 视口，None表示接收全部物料事件
+        self.viewport: Optional[Viewport] = None
+
+        # 发送队列：键为递增序号；合并策略下记录每个物料最新一条消息的序号
+        self._queue: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._latest: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._notified = False
+        self._overflow = 0
+        # 队列中最早一条消息的入队时刻（用于统计推送延迟）
+        self._pending_since: Optional[float] = None
+        self._batch_since: Optional[float] = None
+
+        self.closed = False
+        self.close_reason: Optional[str] = None
+        # 服务端主动关闭时使用的关闭码（见 close），None表示因慢或断开被剔除
+        self.close_code: Optional[int] = None
+        self.connected_at = time.time()
+
+        # 计数器
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.filtered = 0
+        self.frames = 0
+        # 入队到发送完成的延迟（按批次中最早的消息计）
+        self.send_latency = Histogram()
+
+    @classmethod
+    def from_query(cls, websocket: WebSocket) -> "ClientConnection":
+        """
+        根据连接URL参数协商协议和队列策略，如
+        /ws?protocol=binary&batch_ms=50&compress=1&max_queue=2000&policy=conflate&conflate_after=500
+            &state=1&stream=kpi&moves=1
+        """
+        params = websocket.query_params
+        protocol = params.get("protocol", PROTOCOL_JSON)
+        if protocol not in PROTOCOLS:
+            protocol = PROTOCOL_JSON
+        policy = params.get("policy", POLICY_DROP_OLDEST)
+        if policy not in POLICIES:
+            policy = POLICY_DROP_OLDEST
+        stream = params.get("stream", STREAM_RAW)
+        if stream not in STREAMS:
+            stream = STREAM_RAW
+
+        def number(name, default, cast=float):
+            try:
+                return cast(params.get(name, default))
+            except ValueError:
+                return default
+
+        def flag(name):
+            return params.get(name, "0").lower() in ("1", "true", "yes")
+
+        return cls(websocket, protocol,
+                   batch_ms=number("batch_ms", 50),
+                   compress=flag("compress"),
+                   max_queue=number("max_queue", 1000, int),
+                   policy=policy,
+                   sync_state=flag("state"),
+                   stream=stream,
+                   moves=flag("moves"),
+                   conflate_after=(number("conflate_after", 0, int)
+                                   if "conflate_after" in params else None))
+
+    def describe(self) -> dict:
+        """协议确认消息"""
+        return {
+            "type": "protocol",
+            "data": {
+                "protocol": self.protocol,
+                "batch_ms": self.batch_interval * 1000,
+                "compress": bool(self.encoder and self.encoder.compress),
+                "max_queue": self.max_queue,
+                "policy": self.policy,
+                "conflate_after": self.conflate_after,
+                "state": self.sync_state,
+                "stream": self.stream,
+                "moves": self.moves
+            }
+        }
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """绑定到连接所在的事件循环（发送任务在该循环中运行）"""
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    # ------------------------------------------------------------------
+    # 入队（可在任意线程调用，不阻塞）
+    # ------------------------------------------------------------------
+    def enqueue(self, message: Dict[str, Any]):
+        if self.closed:
+            return
+
+        with self._lock:
+            key = next(self._seq)
+            if self.policy == POLICY_CONFLATE:
+                data = message.get('data')
+                if isinstance(data, dict) and 'part_id' in data:
+                    part_id = data['part_id']
+                    # 客户端跟得上时逐条发送，积压后才以最新事件替换同一物料的旧事件
+                    previous = self._latest.get(part_id)
+                    if previous is not None and len(self._queue) >= self.conflate_after \
+                            and self._queue.pop(previous, None) is not None:
+                        self.conflated += 1
+                    self._latest[part_id] = key
+
+            if len(self._queue) >= self.max_queue:
+                self._queue.popitem(last=False)
+                self.dropped += 1
+                self._overflow += 1
+
+            if not self._queue:
+                self._pending_since = time.monotonic()
+            self._queue[key] = message
+            self.queued += 1
+
+            notify = not self._notified
+            self._notified = True
+
+        if notify and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def close(self, code: int, reason: str):
+        """请求关闭连接（可在任意线程调用）：发送任务随即结束，由 serve 以 code 关闭WebSocket"""
+        self.close_code = code
+        self.close_reason = reason
+        self.closed = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._notified = False
+            batch = list(self._queue.values())
+            self._queue.clear()
+            self._latest.clear()
+            self._batch_since, self._pending_since = self._pending_since, None
+        return batch
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def overflowing(self) -> bool:
+        """两次成功发送之间丢弃过多消息"""
+        return self._overflow > self.max_overflow
+
+    # ------------------------------------------------------------------
+    # 发送任务
+    # ------------------------------------------------------------------
+    async def _send_batch(self, batch: List[Dict[str, Any]]):
+        if self.encoder is None:
+            for message in batch:
+                await asyncio.wait_for(self.websocket.send_json(message), self.send_timeout)
+        else:
+            frame = self.encoder.encode(batch)
+            await asyncio.wait_for(self.websocket.send_bytes(frame), self.send_timeout)
+        self.frames += 1 if self.encoder is not None else len(batch)
+        self.sent += len(batch)
+        self._overflow = 0
+        if self._batch_since is not None:
+            self.send_latency.observe(time.monotonic() - self._batch_since)
+
+    async def run_writer(self):
+        """持续取出队列并发送，慢或断开时结束并记录原因"""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self.closed:
+                    break
+                if self.overflowing:
+                    self.close_reason = "slow"
+                    break
+                batch = self._drain()
+                if not batch:
+                    continue
+                await self._send_batch(batch)
+                if self.encoder is not None:
+                    # 二进制协议按批量间隔合帧
+                    await asyncio.sleep(self.batch_interval)
+        except asyncio.TimeoutError:
+            self.close_reason = "slow"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.close_reason = f"dead: {e}"
+        finally:
+            self.closed = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "protocol": self.protocol,
+            "policy": self.policy,
+            "queue_depth": self.queue_depth,
+            "queued": self.queued,
+            "sent": self.sent,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "filtered": self.filtered,
+            "viewport": list(self.viewport.bbox) if self.viewport is not None else None,
+            "send_latency": self.send_latency.summary(),
+            "closed": self.closed,
+            "close_reason": self.close_reason,
+            "connected_seconds": time.time() - self.connected_at
+        }
+
+
+class ConnectionManager:
+    def __init__(self, keyframe_interval: float = 2.0, kpi_window: float = DEFAULT_KPI_WINDOW):
+        """
+        :param keyframe_interval: 向订阅状态同步的客户端发送关键帧的间隔（秒）
+        :param kpi_window: KPI聚合窗口长度（仿真秒）
+        """
+        self.active_connections: List[ClientConnection] = []
+        self._lock = threading.Lock()
+        self.evicted = 0
+        # 已断开连接的累计计数
+        self._closed_totals = {"queued": 0, "sent": 0, "dropped": 0, "conflated": 0,
+                               "filtered": 0}
+        self._closed_latency = Histogram()
+        # 单条事件更新状态并入队到所有客户端的耗时
+        self.publish_latency = Histogram()
+
+        # 由推送的事件增量维护的当前状态
+        self.state = LiveState()
+        self.keyframe_interval = keyframe_interval
+        self._last_keyframe = time.monotonic()
+        self.keyframes = 0
+        # 按仿真时间窗口聚合的KPI
+        self.kpi = KpiAggregator(kpi_window)
+        # 当前拓扑的空间索引（视口过滤），未知拓扑时按坐标过滤
+        self.spatial: Optional[SpatialIndex] = None
+        # 当前拓扑的物料移动轨迹，未知拓扑时订阅移动段的客户端收到原始事件
+        self.trajectories: Optional[TrajectoryTracker] = None
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection.from_query(websocket)
+        client.bind(asyncio.get_running_loop())
+        if "protocol" in websocket.query_params:
+            # 仅对显式协商的客户端发送确认，旧客户端收到的消息格式保持不变
+            await websocket.send_json(client.describe())
+        bbox = websocket.query_params.get("bbox")
+        if bbox:
+            # 连接时指定初始视口，如 bbox=0,0,50,40（格式不对时忽略）
+            try:
+                client.viewport = Viewport(parse_bbox(bbox.split(",")), self.spatial)
+            except ValueError:
+                pass
+        with self._lock:
+            if client.moves and self.trajectories is not None:
+                client.enqueue(self.trajectories.planner.describe())
+            if client.sync_state:
+                # 快照与加入广播列表在同一把锁内完成，之后的事件恰好从快照之后开始
+                snapshot = self.state.snapshot()
+                client.enqueue(snapshot if client.viewport is None
+                               else client.viewport.filter_snapshot(snapshot))
+            self.active_connections = self.active_connections + [client]
+        return client
+
+    def disconnect(self, client: ClientConnection):
+        with self._lock:
+            if client not in self.active_connections:
+                return
+            self.active_connections = [c for c in self.active_connections if c is not client]
+            for key in self._closed_totals:
+                self._closed_totals[key] += getattr(client, key)
+            self._closed_latency.merge(client.send_latency)
+        client.closed = True
+
+    async def serve(self, client: ClientConnection):
+        """运行客户端发送任务；因慢或断开结束时剔除连接，被主动关闭时以指定的关闭码断开"""
+        await client.run_writer()
+        if client.close_reason is not None:
+            code = client.close_code
+            if code is None:
+                print(f"Evicting WebSocket client ({client.close_reason})")
+                self.evicted += 1
+                code = 1013 if client.close_reason == "slow" else 1011
+            self.disconnect(client)
+            try:
+                await client.websocket.close(code=code)
+            except Exception:
+                pass
+
+    def close_all(self, code: int, reason: str):
+        """关闭通道上的全部客户端（如会话被删除，可在任意线程调用）"""
+        with self._lock:
+            clients = self.active_connections
+        for client in clients:
+            client.close(code, reason)
+
+    def publish(self, message: dict):
+        """更新实时状态并向所有客户端入队（非阻塞，可在任意线程调用）"""
+        started = time.perf_counter()
+        final = message.get('type') in FINAL_EVENTS
+        with self._lock:
+            # 窗口在事件改变状态之前结算
+            windows = self.kpi.observe(message, self.state)
+            if final:
+                last = self.kpi.finish(self.state)
+                if last is not None:
+                    windows.append(last)
+            # 物料事件属于逐条事件流，其余消息（如仿真结束）发给所有客户端
+            data = message.get('data')
+            raw_only = isinstance(data, dict) and 'part_id' in data
+            tracker = self.trajectories
+            move = tracker.observe(message) if raw_only and tracker is not None else None
+            self.state.apply(message)
+            clients = self.active_connections
+            # 视口的可见物料集合与 set_viewport / reset_state 在同一把锁内读写
+            hidden = set()
+            if raw_only:
+                for client in clients:
+                    viewport = client.viewport
+                    if client.wants_raw and viewport is not None \
+                            and not viewport.accepts(message):
+                        hidden.add(client.id)
+            keyframes = []
+            now = time.monotonic()
+            if now - self._last_keyframe >= self.keyframe_interval:
+                self._last_keyframe = now
+                if any(client.sync_state for client in clients):
+                    keyframe = self.state.snapshot(MSG_KEYFRAME)
+                    self.keyframes += 1
+                    for client in clients:
+                        if client.sync_state:
+                            viewport = client.viewport
+                            keyframes.append((client, keyframe if viewport is None
+                                              else viewport.filter_snapshot(keyframe)))
+
+        for client in clients:
+            if client.wants_kpi:
+                for window in windows:
+                    client.enqueue(window)
+            if not raw_only:
+                client.enqueue(message)
+            elif client.wants_raw:
+                if client.id in hidden:
+                    client.filtered += 1
+                elif not client.moves or tracker is None:
+                    client.enqueue(message)
+                elif move is not None:
+                    client.enqueue(move)
+                elif message.get('type') in TERMINAL_EVENTS:
+                    # 未产生移动段的离线事件（如中止）原样转发，客户端据此移除物料
+                    client.enqueue(message)
+        for client, frame in keyframes:
+            client.enqueue(frame)
+        self.publish_latency.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态快照"""
+        with self._lock:
+            return self.state.snapshot()
+
+    def reset_state(self, num_stations: int = 0, num_buffers: int = 0,
+                    kpi_window: Optional[float] = None, topology=None):
+        """
+        新一轮仿真开始前清空实时状态和KPI窗口
+        :param num_stations: 工位数（KPI消息中利用率列表的长度）
+        :param num_buffers: 缓冲区数
+        :param kpi_window: KPI窗口长度，默认沿用当前设置
+        :param topology: 本轮仿真的拓扑（重建空间索引和路线表，已设置的视口按新索引重新解析，
+                         订阅移动段的客户端收到新路线表）
+        """
+        with self._lock:
+            self.state.reset()
+            self.kpi = KpiAggregator(kpi_window or self.kpi.window, num_stations, num_buffers)
+            if topology is not None:
+                self.spatial = SpatialIndex(topology)
+                self.trajectories = TrajectoryTracker(RoutePlanner(topology))
+                routes = self.trajectories.planner.describe()
+                for client in self.active_connections:
+                    if client.moves:
+                        client.enqueue(routes)
+            elif self.trajectories is not None:
+                self.trajectories.reset()
+            for client in self.active_connections:
+                if client.viewport is not None:
+                    client.viewport = Viewport(client.viewport.bbox, self.spatial)
+
+    def set_viewport(self, client: ClientConnection, bbox) -> Optional[Viewport]:
+        """
+        设置（bbox为None时清除）客户端视口，回复视口确认；
+        订阅状态同步的客户端随后收到只含视口内物料的快照
+        """
+        viewport = Viewport(parse_bbox(bbox), self.spatial) if bbox is not None else None
+        with self._lock:
+            client.viewport = viewport
+            client.enqueue(viewport.describe() if viewport is not None
+                           else {"type": MSG_VIEWPORT, "data": {"bbox": None}})
+            if client.sync_state:
+                snapshot = self.state.snapshot()
+                client.enqueue(snapshot if viewport is None else viewport.filter_snapshot(snapshot))
+        return viewport
+
+    def recent_kpi(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """最近的KPI窗口消息（按时间顺序）"""
+        with self._lock:
+            windows = list(self.kpi.recent)
+        return windows[-limit:] if limit else windows
+
+    def send_latency(self) -> Histogram:
+        """所有客户端（含已断开的）的推送延迟"""
+        histogram = self._closed_latency.copy()
+        for client in self.active_connections:
+            histogram.merge(client.send_latency)
+        return histogram
+
+    async def broadcast(self, message: dict):
+        self.publish(message)
+
+    def stats(self) -> Dict[str, Any]:
+        clients = self.active_connections
+        totals = dict(self._closed_totals)
+        for client in clients:
+            for key in totals:
+                totals[key] += getattr(client, key)
+        return {
+            "connections": len(clients),
+            "evicted": self.evicted,
+            "keyframes": self.keyframes,
+            "kpi_windows": self.kpi.windows,
+            "queue_depth": sum(c.queue_depth for c in clients),
+            **totals,
+            "clients": [c.stats() for c in clients]
+        }
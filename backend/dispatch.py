@@ -0,0 +1,155 @@
+"""
+并列工序的派工策略
+物料进入含多个可选工位的工序时，由派工器选择工位；
+负载感知策略直接读取 simpy.Resource 的排队列表和占用数（O(1)），不遍历物料
+"""
+
+from bisect import bisect_right
+from typing import Any, List, Sequence
+
+DISPATCH_RANDOM = 'random'                    # 随机选择（原有行为）
+DISPATCH_SHORTEST_QUEUE = 'shortest_queue'    # 排队+加工中物料最少的工位
+DISPATCH_EARLIEST_AVAILABLE = 'earliest_available'  # 预计最早空闲的工位
+DISPATCH_ROUND_ROBIN = 'round_robin'          # 轮流分配
+DISPATCH_WEIGHTED_SPEED = 'weighted_speed'    # 按加工速度（平均加工时间的倒数）加权随机
+DISPATCH_POLICIES = (
+    DISPATCH_RANDOM,
+    DISPATCH_SHORTEST_QUEUE,
+    DISPATCH_EARLIEST_AVAILABLE,
+    DISPATCH_ROUND_ROBIN,
+    DISPATCH_WEIGHTED_SPEED,
+)
+
+
+class Dispatcher:
+    """派工器基类"""
+
+    name = DISPATCH_RANDOM
+
+    def __init__(self, sim):
+        """
+        :param sim: ProductionLineSimulation，派工器读取其工位资源和派工随机数流
+        """
+        self.sim = sim
+        self.rng = sim.streams.routing
+
+    def select(self, stage_index: int, stations: Sequence[int]) -> int:
+        """为进入工序 stage_index 的物料选择工位"""
+        return self.rng.choice(stations)
+
+    def getstate(self) -> Any:
+        """派工器内部状态（保存到检查点）"""
+        return None
+
+    def setstate(self, state: Any):
+        """从检查点恢复内部状态"""
+
+
+class ShortestQueueDispatcher(Dispatcher):
+    """选择排队和加工中物料数最少的工位，相同时取编号小的"""
+
+    name = DISPATCH_SHORTEST_QUEUE
+
+    def select(self, stage_index, stations):
+        if len(stations) == 1:
+            return stations[0]
+        workstations = self.sim.workstations
+        best, best_load = stations[0], None
+        for station_id in stations:
+            resource = workstations[station_id]
+            load = len(resource.queue) + resource.count
+            if best_load is None or load < best_load:
+                best, best_load = station_id, load
+        return best
+
+
+class EarliestAvailableDispatcher(Dispatcher):
+    """
+    选择预计最早能开始加工的工位：
+    当前加工的预计完成时刻 + 排队物料数 x 该工位平均加工时间；
+    阻塞中的工位（完工物料等待下游缓冲区）何时释放无法预计，排在所有未阻塞工位之后
+    """
+
+    name = DISPATCH_EARLIEST_AVAILABLE
+
+    def select(self, stage_index, stations):
+        if len(stations) == 1:
+            return stations[0]
+        sim = self.sim
+        now = sim.env.now
+        best, best_key = stations[0], None
+        for station_id in stations:
+            resource = sim.workstations[station_id]
+            available = now
+            if resource.count:
+                available = max(now, sim.station_busy_until[station_id])
+            available += len(resource.queue) * sim.station_processing_mean[station_id]
+            key = (sim.station_blocked(station_id), available)
+            if best_key is None or key < best_key:
+                best, best_key = station_id, key
+        return best
+
+
+class RoundRobinDispatcher(Dispatcher):
+    """各工序独立轮转"""
+
+    name = DISPATCH_ROUND_ROBIN
+
+    def __init__(self, sim):
+        super().__init__(sim)
+        self._next = [0] * len(sim.stages)
+
+    def select(self, stage_index, stations):
+        index = self._next[stage_index]
+        self._next[stage_index] = (index + 1) % len(stations)
+        return stations[index]
+
+    def getstate(self):
+        return list(self._next)
+
+    def setstate(self, state):
+        self._next = list(state)
+
+
+class WeightedSpeedDispatcher(Dispatcher):
+    """按加工速度加权随机选择，较快的工位分到更多物料"""
+
+    name = DISPATCH_WEIGHTED_SPEED
+
+    def __init__(self, sim):
+        super().__init__(sim)
+        # 各工序的累计权重（预先计算，选择时二分查找）
+        self._cumulative: List[List[float]] = []
+        for stage in sim.stages:
+            total = 0.0
+            cumulative = []
+            for station_id in stage.stations:
+                total += 1.0 / max(sim.station_processing_mean[station_id], 1e-9)
+                cumulative.append(total)
+            self._cumulative.append(cumulative)
+
+    def select(self, stage_index, stations):
+        if len(stations) == 1:
+            return stations[0]
+        cumulative = self._cumulative[stage_index]
+        index = bisect_right(cumulative, self.rng.random() * cumulative[-1])
+        return stations[min(index, len(stations) - 1)]
+
+
+_DISPATCHERS = {
+    cls.name: cls for cls in (
+        Dispatcher,
+        ShortestQueueDispatcher,
+        EarliestAvailableDispatcher,
+        RoundRobinDispatcher,
+        WeightedSpeedDispatcher,
+    )
+}
+
+
+def create_dispatcher(policy: str, sim) -> Dispatcher:
+    """按策略名创建派工器"""
+    cls = _DISPATCHERS.get(policy)
+    if cls is None:
+        raise ValueError(f"Unknown dispatch policy: {policy}")
+    return cls(sim)
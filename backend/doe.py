@@ -0,0 +1,340 @@
+"""
+试验设计与参数寻优
+在仿真参数空间上生成候选方案（全因子网格、拉丁超立方），或以逐次减半（successive halving）
+自适应搜索：先用短时长评估全部候选，按中间统计淘汰较差的方案，幸存者从检查点继续运行更长时间；
+候选在进程池中并行评估，所有候选共用同一组种子（公共随机数），
+结果给出产能与在制品/缓冲区成本的帕累托前沿
+"""
+
+import itertools
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from experiments import EXPERIMENT_PARAMS, _map, check_param_value, validate_params
+from simulation import ProductionLineSimulation
+from topology import compile_topology
+
+DESIGN_GRID = 'grid'          # 全因子网格
+DESIGN_LHS = 'lhs'            # 拉丁超立方抽样
+DESIGN_HALVING = 'halving'    # 拉丁超立方候选 + 逐次减半淘汰
+DESIGNS = (DESIGN_GRID, DESIGN_LHS, DESIGN_HALVING)
+
+# 可寻优的参数（拓扑在基础参数中固定）
+SWEEP_PARAMS = tuple(name for name in EXPERIMENT_PARAMS if name != 'topology')
+# 取整数值的参数
+INTEGER_PARAMS = ('buffer_capacity',)
+
+
+def validate_space(space: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    检查参数空间：每个参数为 {"values": [...]} 离散取值，
+    或 {"min": a, "max": b} 连续区间（可选 "levels": 网格水平数，"integer": 是否取整）
+    """
+    if not space:
+        raise ValueError("Parameter space is empty")
+    checked = {}
+    for name, spec in space.items():
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"Cannot sweep parameter: {name}")
+        if not isinstance(spec, dict):
+            raise ValueError(f"Invalid range for {name}")
+        if 'values' in spec:
+            values = list(spec['values'])
+            if not values:
+                raise ValueError(f"No values given for {name}")
+            for value in values:
+                check_param_value(name, value)
+            checked[name] = {'values': values}
+            continue
+        try:
+            low, high = float(spec['min']), float(spec['max'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Range for {name} needs numeric min and max")
+        if low > high:
+            raise ValueError(f"Empty range for {name}")
+        integer = bool(spec.get('integer', name in INTEGER_PARAMS))
+        # 区间端点（取整参数按取整后的值）须在参数的合法范围内
+        for value in (low, high):
+            check_param_value(name, int(round(value)) if integer else value)
+        checked[name] = {
+            'min': low,
+            'max': high,
+            'levels': int(spec.get('levels', 3)),
+            'integer': integer,
+        }
+    return checked
+
+
+def _scale(spec: Dict[str, Any], u: float) -> Any:
+    """[0, 1) 上的坐标映射为参数取值"""
+    if 'values' in spec:
+        values = spec['values']
+        return values[min(int(u * len(values)), len(values) - 1)]
+    value = spec['min'] + u * (spec['max'] - spec['min'])
+    return int(round(value)) if spec['integer'] else value
+
+
+def grid_design(space: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """全因子网格：连续区间按 levels 个等距水平取值"""
+    axes = []
+    for spec in space.values():
+        if 'values' in spec:
+            axes.append(spec['values'])
+            continue
+        levels = max(1, spec['levels'])
+        values = [spec['min'] + (spec['max'] - spec['min']) * i / max(1, levels - 1)
+                  for i in range(levels)]
+        if spec['integer']:
+            values = list(dict.fromkeys(int(round(v)) for v in values))
+        axes.append(values)
+    return [dict(zip(space, combo)) for combo in itertools.product(*axes)]
+
+
+def latin_hypercube(space: Dict[str, Dict[str, Any]], samples: int,
+                    rng: random.Random) -> List[Dict[str, Any]]:
+    """拉丁超立方：每个参数的取值范围分为 samples 层，每层恰好抽一个点"""
+    columns = {}
+    for name, spec in space.items():
+        strata = list(range(samples))
+        rng.shuffle(strata)
+        columns[name] = [_scale(spec, (k + rng.random()) / samples) for k in strata]
+    candidates = [{name: columns[name][i] for name in space} for i in range(samples)]
+    # 离散/取整参数可能产生重复候选
+    unique = {}
+    for candidate in candidates:
+        unique.setdefault(tuple(sorted(candidate.items())), candidate)
+    return list(unique.values())
+
+
+def buffer_slots(params: Dict[str, Any]) -> int:
+    """产线缓冲区总容量（缓冲区成本的计量基础）"""
+    topology = compile_topology(params.get('topology'))
+    capacity = params.get('buffer_capacity')
+    if capacity is None:
+        return sum(topology.buffer_capacities)
+    return capacity * topology.num_buffers
+
+
+def pareto_front(points: Sequence[Tuple[float, float]]) -> List[int]:
+    """(产能, 成本) 中非支配点的下标：产能越高、成本越低越好"""
+    front = []
+    for i, (throughput, cost) in enumerate(points):
+        dominated = any(
+            t >= throughput and c <= cost and (t > throughput or c < cost)
+            for j, (t, c) in enumerate(points) if j != i
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def pareto_ranks(points: Sequence[Tuple[float, float]]) -> List[int]:
+    """非支配排序的层号（0为帕累托前沿）"""
+    ranks = [0] * len(points)
+    remaining = list(range(len(points)))
+    rank = 0
+    while remaining:
+        front = pareto_front([points[i] for i in remaining])
+        layer = [remaining[k] for k in front]
+        for i in layer:
+            ranks[i] = rank
+        remaining = [i for i in remaining if i not in set(layer)]
+        rank += 1
+    return ranks
+
+
+def crowding_distances(points: Sequence[Tuple[float, float]],
+                       ranks: Sequence[int]) -> List[float]:
+    """各点在所在非支配层内的拥挤距离（NSGA-II）：层的两端为无穷大，越大越稀疏"""
+    distances = [0.0] * len(points)
+    for rank in set(ranks):
+        layer = [i for i in range(len(points)) if ranks[i] == rank]
+        for axis in range(2):
+            layer.sort(key=lambda i: points[i][axis])
+            low, high = points[layer[0]][axis], points[layer[-1]][axis]
+            distances[layer[0]] = distances[layer[-1]] = math.inf
+            if high == low:
+                continue
+            for k in range(1, len(layer) - 1):
+                distances[layer[k]] += (points[layer[k + 1]][axis]
+                                        - points[layer[k - 1]][axis]) / (high - low)
+    return distances
+
+
+def _evaluate_args(args):
+    """评估一个候选的一次重复（进程池映射入口）；给出检查点时从检查点继续运行"""
+    params, seed, until, checkpoint, keep_checkpoint = args
+    if checkpoint is None:
+        sim = ProductionLineSimulation(record_events=False, seed=seed, **params)
+    else:
+        sim = ProductionLineSimulation.from_checkpoint(checkpoint, record_events=False)
+    stats = sim.run(until=until)
+    return stats, sim.checkpoint() if keep_checkpoint else None
+
+
+class _Candidate:
+    def __init__(self, index: int, sample: Dict[str, Any], params: Dict[str, Any],
+                 slots: int):
+        self.index = index
+        self.sample = sample
+        self.params = params
+        self.buffer_slots = slots
+        self.duration = 0.0
+        self.results: List[Dict[str, Any]] = []
+        self.checkpoints: List[Optional[Dict[str, Any]]] = []
+        self.eliminated_at: Optional[float] = None
+
+    def mean(self, key: str) -> float:
+        return sum(r[key] for r in self.results) / len(self.results)
+
+    def objectives(self, wip_cost: float, buffer_cost: float) -> Tuple[float, float]:
+        return (self.mean('throughput'),
+                wip_cost * self.mean('avg_wip') + buffer_cost * self.buffer_slots)
+
+    def describe(self, wip_cost: float, buffer_cost: float) -> Dict[str, Any]:
+        throughput, cost = self.objectives(wip_cost, buffer_cost)
+        return {
+            'params': self.sample,
+            'duration': self.duration,
+            'eliminated_at': self.eliminated_at,
+            'throughput': throughput,
+            'avg_wip': self.mean('avg_wip'),
+            'avg_cycle_time': self.mean('avg_cycle_time'),
+            'buffer_slots': self.buffer_slots,
+            'cost': cost,
+        }
+
+
+def run_sweep(space: Dict[str, Any],
+              params: Optional[Dict[str, Any]] = None,
+              design: str = DESIGN_LHS,
+              samples: int = 20,
+              duration: float = 2000,
+              replications: int = 3,
+              base_seed: int = 0,
+              wip_cost: float = 1.0,
+              buffer_cost: float = 0.0,
+              min_duration: Optional[float] = None,
+              eta: int = 3,
+              max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    参数扫描 / 寻优
+    :param space: 参数空间（见 validate_space）
+    :param params: 固定的基础仿真参数（见 EXPERIMENT_PARAMS）
+    :param design: grid、lhs 或 halving
+    :param samples: 拉丁超立方候选数（lhs / halving）
+    :param duration: 每个候选的仿真时长（halving 为幸存者的最终时长）
+    :param replications: 每个候选的重复次数（种子 base_seed..，各候选相同）
+    :param wip_cost: 单位平均在制品的成本
+    :param buffer_cost: 单位缓冲区容量的成本
+    :param min_duration: halving 首轮时长，默认使约 log_eta(候选数) 轮后达到 duration
+    :param eta: halving 每轮保留 1/eta 的候选，时长乘以 eta
+    :return: 含 candidates（全部候选）、pareto_front（仅在最终时长下评估的候选中的非支配解）
+             和 eliminated（halving 中被淘汰的候选，按淘汰时刻排序）
+    """
+    if design not in DESIGNS:
+        raise ValueError(f"Unknown design: {design}")
+    if replications < 1 or samples < 1 or duration <= 0:
+        raise ValueError("replications, samples and duration must be positive")
+    if eta < 2:
+        raise ValueError("eta must be at least 2")
+    space = validate_space(space)
+    base = validate_params(params or {})
+    rng = random.Random(base_seed)
+
+    if design == DESIGN_GRID:
+        samples_list = grid_design(space)
+    else:
+        samples_list = latin_hypercube(space, samples, rng)
+    candidates = []
+    for i, sample in enumerate(samples_list):
+        candidate_params = validate_params(dict(base, **sample))
+        candidates.append(_Candidate(i, sample, candidate_params, buffer_slots(candidate_params)))
+
+    # 评估计划：[(时长, 保留数)]
+    if design == DESIGN_HALVING and len(candidates) > 1:
+        rounds, remaining = 1, len(candidates)
+        while remaining > eta:
+            remaining = math.ceil(remaining / eta)
+            rounds += 1
+        first = min_duration or duration / eta ** (rounds - 1)
+        schedule = []
+        keep = len(candidates)
+        for r in range(rounds):
+            horizon = duration if r == rounds - 1 else min(duration, first * eta ** r)
+            keep = max(1, math.ceil(keep / eta)) if r < rounds - 1 else keep
+            schedule.append((horizon, keep))
+    else:
+        schedule = [(duration, len(candidates))]
+
+    seeds = list(range(base_seed, base_seed + replications))
+    started = time.perf_counter()
+    alive = candidates
+    evaluations = 0
+    simulated = 0.0
+    for round_index, (horizon, keep) in enumerate(schedule):
+        last_round = round_index == len(schedule) - 1
+        tasks = []
+        for candidate in alive:
+            for k, seed in enumerate(seeds):
+                checkpoint = candidate.checkpoints[k] if candidate.checkpoints else None
+                tasks.append((candidate.params, seed, horizon, checkpoint, not last_round))
+        outputs = _map(_evaluate_args, tasks, max_workers)
+        evaluations += len(tasks)
+        simulated += sum(horizon - c.duration for c in alive) * replications
+
+        for i, candidate in enumerate(alive):
+            chunk = outputs[i * replications:(i + 1) * replications]
+            candidate.results = [stats for stats, _ in chunk]
+            candidate.checkpoints = [checkpoint for _, checkpoint in chunk]
+            candidate.duration = horizon
+
+        if not last_round:
+            # 按非支配层排序，同层内拥挤距离大者优先，使前沿的两端（含低成本端）都得以保留
+            points = [c.objectives(wip_cost, buffer_cost) for c in alive]
+            ranks = pareto_ranks(points)
+            crowding = crowding_distances(points, ranks)
+            order = sorted(range(len(alive)),
+                           key=lambda i: (ranks[i], -crowding[i], -points[i][0]))
+            survivors = [alive[i] for i in order[:keep]]
+            for i in order[keep:]:
+                alive[i].eliminated_at = horizon
+                alive[i].checkpoints = []
+            alive = survivors
+
+    # 前沿只在最终时长下评估的候选上计算：较短时长的结果噪声更大且含预热偏差，不与之混比；
+    # 被淘汰的候选按淘汰时刻单独列出（duration 为其最后评估的时长）
+    finalists = [c for c in candidates if c.eliminated_at is None]
+    points = [c.objectives(wip_cost, buffer_cost) for c in finalists]
+    front = sorted((finalists[i] for i in pareto_front(points)),
+                   key=lambda c: c.objectives(wip_cost, buffer_cost)[1])
+    eliminated = sorted((c for c in candidates if c.eliminated_at is not None),
+                        key=lambda c: (c.eliminated_at, c.index))
+    return {
+        'design': design,
+        'space': space,
+        'params': base,
+        'duration': duration,
+        'replications': replications,
+        'seeds': seeds,
+        'objectives': {'throughput': 'max', 'cost': 'min',
+                       'wip_cost': wip_cost, 'buffer_cost': buffer_cost},
+        'schedule': [{'duration': horizon, 'keep': keep} for horizon, keep in schedule],
+        'evaluations': evaluations,
+        'simulated_time': simulated,
+        'elapsed': time.perf_counter() - started,
+        'candidates': [c.describe(wip_cost, buffer_cost) for c in candidates],
+        'pareto_front': [c.describe(wip_cost, buffer_cost) for c in front],
+        'eliminated': [c.describe(wip_cost, buffer_cost) for c in eliminated],
+    }
+
+
+if __name__ == '__main__':
+    import json
+
+    result = run_sweep(
+        {'buffer_capacity': {'min': 1, 'max': 10}, 'arrival_interval': {'min': 5.0, 'max': 8.0}},
+        design=DESIGN_HALVING, samples=27, duration=3000, buffer_cost=0.1)
+    print(json.dumps(result['pareto_front'], indent=2, ensure_ascii=False))
@@ -0,0 +1,378 @@
+"""
+列式事件存储 - 替代无界的事件字典列表
+事件类型、物料编号、工位/缓冲区编号、仿真时间等字段存放在定长类型数组中，
+事件类型通过驻留表编码为整数；支持环形缓冲区容量上限和可选的溢出落盘
+"""
+
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterator, Sequence, Tuple
+
+
+# 位置类型编码
+LOC_NONE = 0
+LOC_WORKSTATION = 1
+LOC_BUFFER = 2
+
+# 各事件类型对应的物料状态
+EVENT_STATUS = {
+    'part_arrived': 'arrived',
+    'part_waiting_buffer': 'waiting',
+    'part_queue': 'queuing',
+    'part_processing': 'processing',
+    'part_completed_station': 'completed',
+    'part_in_buffer': 'in_buffer',
+    'part_finished': 'finished',
+    'part_aborted': 'aborted',
+}
+
+# 各事件类型携带的数值字段（存放在value列）
+EVENT_VALUE_FIELD = {
+    'part_processing': 'duration',
+    'part_in_buffer': 'buffer_level',
+    'part_finished': 'cycle_time',
+}
+
+# 不带工位/缓冲区编号的事件的默认位置（原料区、成品区），可由拓扑覆盖
+DEFAULT_INPUT_POSITION = (5, 20)
+DEFAULT_OUTPUT_POSITION = (115, 20)
+
+PART_PREFIX = 'PART-'
+
+# 列定义: (列名, array类型码)
+COLUMNS = (
+    ('type', 'B'),       # 事件类型（驻留表下标）
+    ('part', 'i'),       # 物料编号，-1表示无
+    ('loc_kind', 'b'),   # 位置类型
+    ('loc_id', 'h'),     # 工位/缓冲区编号
+    ('time', 'd'),       # 仿真时间
+    ('value', 'd'),      # 附加数值（加工时长、缓冲区水平、周期时间）
+    ('wall', 'd'),       # 墙钟时间戳（epoch秒）
+)
+
+_NAN = float('nan')
+_CHUNK_HEADER = struct.Struct('<I')
+
+
+def format_part_id(number: int) -> str:
+    """物料编号 -> 物料ID"""
+    return f"{PART_PREFIX}{number:04d}"
+
+
+def parse_part_id(part_id: Optional[str]) -> int:
+    """物料ID -> 物料编号，无法解析时返回-1"""
+    if not part_id or not part_id.startswith(PART_PREFIX):
+        return -1
+    try:
+        return int(part_id[len(PART_PREFIX):])
+    except ValueError:
+        return -1
+
+
+class EventStore:
+    """列式环形事件存储"""
+
+    def __init__(self,
+                 workstation_positions: Sequence[Tuple[float, float]] = (),
+                 buffer_positions: Sequence[Tuple[float, float]] = (),
+                 input_position: Tuple[float, float] = DEFAULT_INPUT_POSITION,
+                 output_position: Tuple[float, float] = DEFAULT_OUTPUT_POSITION,
+                 capacity: Optional[int] = None,
+                 spill_path: Optional[str] = None,
+                 spill_chunk: Optional[int] = None):
+        """
+        :param workstation_positions: 工位坐标（用于还原事件位置）
+        :param buffer_positions: 缓冲区坐标
+        :param input_position: 原料区坐标（物料到达事件的位置）
+        :param output_position: 成品区坐标（物料完成事件的位置）
+        :param capacity: 环形缓冲区容量，None表示不限
+        :param spill_path: 溢出文件路径，设置后被淘汰的事件写入磁盘而非丢弃
+        :param spill_chunk: 每次落盘的事件数，默认为容量的1/4
+        """
+        if capacity is not None and capacity <= 0:
+            raise ValueError("capacity must be positive")
+
+        self.workstation_positions = workstation_positions
+        self.buffer_positions = buffer_positions
+        # 不带工位/缓冲区编号的事件的固定位置
+        self.fixed_positions = {
+            'part_arrived': tuple(input_position),
+            'part_finished': tuple(output_position),
+        }
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spill_chunk = max(1, spill_chunk or (capacity or 4) // 4)
+
+        self._columns = {name: array(code) for name, code in COLUMNS}
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+
+        self._head = 0        # 最早一条事件在数组中的下标
+        self._size = 0        # 当前保留的事件数
+        self.total = 0        # 累计写入的事件数
+        self.evicted = 0      # 被丢弃的事件数
+        self.spilled = 0      # 已落盘的事件数
+
+        if spill_path is not None:
+            # 清空旧的溢出文件
+            open(spill_path, 'wb').close()
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def intern_type(self, event_type: str) -> int:
+        """事件类型驻留"""
+        code = self._type_codes.get(event_type)
+        if code is None:
+            code = len(self._type_names)
+            if code > 255:
+                raise ValueError("Too many distinct event types")
+            self._type_names.append(event_type)
+            self._type_codes[event_type] = code
+        return code
+
+    def record(self, event_type: str, part: int, loc_kind: int, loc_id: int,
+               time: float, value: float = _NAN, wall: float = _NAN):
+        """写入一条事件（列值形式）"""
+        row = (self.intern_type(event_type), part, loc_kind, loc_id, time, value, wall)
+        columns = self._columns
+
+        if self.capacity is None or len(columns['time']) < self.capacity:
+            # 数组尚未达到容量，直接追加
+            for (name, _), v in zip(COLUMNS, row):
+                columns[name].append(v)
+            self._size += 1
+            self.total += 1
+            return
+
+        if self._size == self.capacity:
+            if self.spill_path is not None:
+                self._spill(self.spill_chunk)
+            else:
+                self._head = (self._head + 1) % self.capacity
+                self._size -= 1
+                self.evicted += 1
+
+        pos = (self._head + self._size) % len(columns['time'])
+        for (name, _), v in zip(COLUMNS, row):
+            columns[name][pos] = v
+        self._size += 1
+        self.total += 1
+
+    def append(self, event: Dict[str, Any]):
+        """写入一条事件（字典形式，与 log_event 的事件格式一致）"""
+        real_time = event.get('real_time')
+        wall = datetime.fromisoformat(real_time).timestamp() if real_time else _NAN
+        self.append_data(event['type'], event['timestamp'], event.get('data') or {}, wall)
+
+    def append_data(self, event_type: str, timestamp: float, data: Dict[str, Any],
+                    wall: float = _NAN):
+        """写入一条事件（事件字段形式，wall 为epoch秒，免去构造和解析事件字典）"""
+        if 'workstation_id' in data:
+            loc_kind, loc_id = LOC_WORKSTATION, data['workstation_id']
+        elif 'buffer_id' in data:
+            loc_kind, loc_id = LOC_BUFFER, data['buffer_id']
+        else:
+            loc_kind, loc_id = LOC_NONE, -1
+
+        field = EVENT_VALUE_FIELD.get(event_type)
+        value = data.get(field, _NAN) if field else _NAN
+
+        self.record(event_type, parse_part_id(data.get('part_id')),
+                    loc_kind, loc_id, timestamp, value, wall)
+
+    def _spill(self, count: int):
+        """将最早的count条事件写入溢出文件"""
+        count = min(count, self._size)
+        indices = self._segments(0, self._size)
+        with open(self.spill_path, 'ab') as f:
+            f.write(_CHUNK_HEADER.pack(count))
+            for name, code in COLUMNS:
+                column = self._columns[name]
+                chunk = array(code)
+                remaining = count
+                for lo, hi in indices:
+                    take = min(remaining, hi - lo)
+                    chunk.extend(column[lo:lo + take])
+                    remaining -= take
+                    if not remaining:
+                        break
+                chunk.tofile(f)
+
+        self._head = (self._head + count) % len(self._columns['time'])
+        self._size -= count
+        self.spilled += count
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def __len__(self) -> int:
+        return self._size
+
+    def _physical(self, index: int) -> int:
+        """逻辑下标 -> 数组下标"""
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("event index out of range")
+        return (self._head + index) % len(self._columns['time'])
+
+    def _segments(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        """逻辑区间[lo, hi) -> 连续的数组区间列表"""
+        if hi <= lo:
+            return []
+        length = len(self._columns['time'])
+        start = (self._head + lo) % length
+        end = start + (hi - lo)
+        if end <= length:
+            return [(start, end)]
+        return [(start, length), (0, end - length)]
+
+    def _logical(self, pos: int) -> int:
+        """数组下标 -> 逻辑下标"""
+        return (pos - self._head) % len(self._columns['time'])
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return self._decode(self._physical(index))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for lo, hi in self._segments(0, self._size):
+            for pos in range(lo, hi):
+                yield self._decode(pos)
+
+    def _decode(self, pos: int) -> Dict[str, Any]:
+        """还原为 log_event 的事件字典格式"""
+        c = self._columns
+        event_type = self._type_names[c['type'][pos]]
+        data: Dict[str, Any] = {}
+
+        part = c['part'][pos]
+        if part >= 0:
+            data['part_id'] = format_part_id(part)
+
+        loc_kind, loc_id = c['loc_kind'][pos], c['loc_id'][pos]
+        if loc_kind == LOC_WORKSTATION:
+            data['workstation_id'] = loc_id
+            if loc_id < len(self.workstation_positions):
+                data['position'] = list(self.workstation_positions[loc_id])
+        elif loc_kind == LOC_BUFFER:
+            data['buffer_id'] = loc_id
+            if loc_id < len(self.buffer_positions):
+                data['position'] = list(self.buffer_positions[loc_id])
+        elif event_type in self.fixed_positions:
+            data['position'] = list(self.fixed_positions[event_type])
+
+        if event_type in EVENT_STATUS:
+            data['status'] = EVENT_STATUS[event_type]
+
+        field = EVENT_VALUE_FIELD.get(event_type)
+        value = c['value'][pos]
+        if field and value == value:
+            data[field] = int(value) if field == 'buffer_level' else value
+
+        wall = c['wall'][pos]
+        return {
+            'timestamp': c['time'][pos],
+            'real_time': datetime.fromtimestamp(wall).isoformat() if wall == wall else None,
+            'type': event_type,
+            'data': data,
+        }
+
+    def time_range(self, start: Optional[float] = None,
+                   end: Optional[float] = None) -> Tuple[int, int]:
+        """
+        按仿真时间二分查找，返回逻辑下标区间[lo, hi)
+        仿真时间单调不减，每个连续数组区间内可直接二分
+        """
+        times = self._columns['time']
+        segments = self._segments(0, self._size)
+        lo, hi = 0, self._size
+        offset = 0
+        if start is not None:
+            lo = self._size
+            for seg_lo, seg_hi in segments:
+                i = bisect_left(times, start, seg_lo, seg_hi)
+                if i < seg_hi:
+                    lo = offset + i - seg_lo
+                    break
+                offset += seg_hi - seg_lo
+        offset = 0
+        if end is not None:
+            hi = 0
+            for seg_lo, seg_hi in segments:
+                i = bisect_right(times, end, seg_lo, seg_hi)
+                hi = offset + i - seg_lo
+                if i < seg_hi:
+                    break
+                offset += seg_hi - seg_lo
+        return lo, max(lo, hi)
+
+    def _find(self, column: str, value: int, lo: int, hi: int) -> List[int]:
+        """在列中查找等于value的逻辑下标（array.index在C层扫描）"""
+        col = self._columns[column]
+        found = []
+        for seg_lo, seg_hi in self._segments(lo, hi):
+            pos = seg_lo
+            while pos < seg_hi:
+                try:
+                    pos = col.index(value, pos, seg_hi)
+                except ValueError:
+                    break
+                found.append(self._logical(pos))
+                pos += 1
+        return found
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              part_id: Optional[str] = None,
+              event_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间窗口、物料和事件类型查询"""
+        lo, hi = self.time_range(start, end)
+
+        candidates = None
+        if part_id is not None:
+            candidates = self._find('part', parse_part_id(part_id), lo, hi)
+        if event_type is not None:
+            code = self._type_codes.get(event_type)
+            if code is None:
+                return []
+            if candidates is None:
+                candidates = self._find('type', code, lo, hi)
+            else:
+                types = self._columns['type']
+                candidates = [i for i in candidates
+                              if types[self._physical(i)] == code]
+
+        if candidates is None:
+            candidates = range(lo, hi)
+        return [self[i] for i in candidates]
+
+    def iter_spilled(self) -> Iterator[Dict[str, Any]]:
+        """读取已落盘的事件"""
+        if self.spill_path is None:
+            return
+        with open(self.spill_path, 'rb') as f:
+            while True:
+                header = f.read(_CHUNK_HEADER.size)
+                if not header:
+                    break
+                (count,) = _CHUNK_HEADER.unpack(header)
+                chunk = EventStore(self.workstation_positions, self.buffer_positions,
+                                   self.fixed_positions['part_arrived'],
+                                   self.fixed_positions['part_finished'])
+                chunk._type_names = self._type_names
+                for name, code in COLUMNS:
+                    chunk._columns[name].fromfile(f, count)
+                chunk._size = count
+                yield from chunk
+
+    def memory_bytes(self) -> int:
+        """列数组占用的字节数"""
+        return sum(col.itemsize * len(col) for col in self._columns.values())
+
+    def clear(self):
+        """清空内存中的事件"""
+        self._columns = {name: array(code) for name, code in COLUMNS}
+        self._head = 0
+        self._size = 0
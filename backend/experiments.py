@@ -0,0 +1,296 @@
+"""
+批量仿真实验 - 多次独立重复运行
+在进程池中以无头模式（无回调、无事件日志）并行运行多个随机种子，
+汇总每次重复的统计结果并给出均值与置信区间；
+假设分析（what-if）只预热一次，再从检查点分叉出多个方案并行运行；
+方案对比使用公共随机数（各方案共用同一组种子），按配对差值给出置信区间
+"""
+
+import inspect
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from dispatch import DISPATCH_POLICIES, DISPATCH_RANDOM
+from rng import RNG_BACKENDS, RNG_PYTHON
+from simulation import ProductionLineSimulation, FORK_STATION_PARAMS
+from steady_state import t_critical
+from topology import compile_topology
+
+
+# 允许通过实验接口覆盖的仿真参数
+EXPERIMENT_PARAMS = (
+    'buffer_capacity',
+    'processing_time_mean',
+    'processing_time_std',
+    'arrival_interval',
+    'topology',
+    'dispatch_policy',
+    'warmup',
+    'rng_backend',
+)
+
+
+def default_params() -> Dict[str, Any]:
+    """EXPERIMENT_PARAMS 的默认值（取自 ProductionLineSimulation 的构造参数）"""
+    signature = inspect.signature(ProductionLineSimulation.__init__)
+    return {name: signature.parameters[name].default for name in EXPERIMENT_PARAMS}
+
+
+# 数值参数的下限：(下限, 是否允许等于下限)
+NUMERIC_PARAM_LIMITS = {
+    'buffer_capacity': (0, False),
+    'processing_time_mean': (0, False),
+    'processing_time_std': (0, True),
+    'arrival_interval': (0, False),
+    'warmup': (0, True),
+}
+
+
+def check_param_value(name: str, value: Any):
+    """检查数值参数的取值范围（buffer_capacity 为None时使用拓扑中的容量）"""
+    if name not in NUMERIC_PARAM_LIMITS or (name == 'buffer_capacity' and value is None):
+        return
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        raise ValueError(f"{name} must be a number")
+    if name == 'buffer_capacity' and value != int(value):
+        raise ValueError("buffer_capacity must be an integer")
+    low, inclusive = NUMERIC_PARAM_LIMITS[name]
+    if value < low or (value == low and not inclusive):
+        raise ValueError(f"{name} must be {'>=' if inclusive else '>'} {low}")
+
+
+def validate_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """检查参数名和取值是否合法，拓扑配置在此编译一次以尽早报错"""
+    unknown = set(params) - set(EXPERIMENT_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown simulation parameters: {sorted(unknown)}")
+    for name, value in params.items():
+        check_param_value(name, value)
+    if params.get('topology') is not None:
+        compile_topology(params['topology'])
+    policy = params.get('dispatch_policy', DISPATCH_RANDOM)
+    if policy not in DISPATCH_POLICIES:
+        raise ValueError(f"Unknown dispatch policy: {policy}")
+    backend = params.get('rng_backend', RNG_PYTHON)
+    if backend not in RNG_BACKENDS:
+        raise ValueError(f"Unknown RNG backend: {backend}")
+    return dict(params)
+
+
+def run_replication(params: Dict[str, Any], seed: int, duration: float,
+                    target_half_width: Optional[float] = None) -> Dict[str, Any]:
+    """
+    以无头模式运行一次重复仿真，返回统计数据
+    :param target_half_width: 设置时周期时间置信区间半宽达标即停止（duration 为上限）
+    """
+    sim = ProductionLineSimulation(record_events=False, seed=seed, **params)
+    stats = sim.run(until=duration, target_half_width=target_half_width)
+    stats['seed'] = seed
+    return stats
+
+
+def _run_replication_args(args):
+    """进程池映射入口（需可被pickle）"""
+    return run_replication(*args)
+
+
+def _map(func, tasks: List[Any], max_workers: Optional[int] = None) -> List[Any]:
+    """在进程池中映射任务（单任务或单进程时直接在当前进程运行）"""
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        return [func(task) for task in tasks]
+    # 较大的chunksize减少进程间通信次数
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, tasks, chunksize=chunksize))
+
+
+def summarize_values(values: List[float], confidence: float = 0.95) -> Dict[str, Optional[float]]:
+    """计算样本均值、标准差和置信区间（单个样本无法估计区间，区间字段为None）"""
+    n = len(values)
+    mean = sum(values) / n if n else 0.0
+    if n > 1:
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+        half_width = t_critical(n - 1, confidence) * std / math.sqrt(n)
+    else:
+        std = 0.0
+        half_width = None if n == 1 else 0.0
+
+    return {
+        'mean': mean,
+        'std': std,
+        'min': min(values) if values else 0.0,
+        'max': max(values) if values else 0.0,
+        'ci_low': mean - half_width if half_width is not None else None,
+        'ci_high': mean + half_width if half_width is not None else None,
+        'half_width': half_width,
+    }
+
+
+def summarize(results: List[Dict[str, Any]], confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    汇总多次重复的统计结果
+    数值型指标给出整体摘要，数值列表（如工位利用率）逐元素给出摘要
+    """
+    if not results:
+        return {}
+
+    summary = {}
+    for key, first in results[0].items():
+        if key == 'seed':
+            continue
+        if isinstance(first, (int, float)) and not isinstance(first, bool):
+            summary[key] = summarize_values([r[key] for r in results], confidence)
+        elif isinstance(first, list) and all(isinstance(v, (int, float)) for v in first):
+            summary[key] = [
+                summarize_values([r[key][i] for r in results], confidence)
+                for i in range(len(first))
+            ]
+    return summary
+
+
+def run_experiment(params: Optional[Dict[str, Any]] = None,
+                   replications: int = 10,
+                   duration: float = 100,
+                   seeds: Optional[List[int]] = None,
+                   base_seed: int = 0,
+                   confidence: float = 0.95,
+                   max_workers: Optional[int] = None,
+                   target_half_width: Optional[float] = None) -> Dict[str, Any]:
+    """
+    批量运行重复仿真
+    :param params: 仿真参数（见 EXPERIMENT_PARAMS）
+    :param replications: 重复次数（未指定seeds时使用 base_seed.. 连续种子）
+    :param duration: 每次仿真时长
+    :param seeds: 显式指定的种子列表
+    :param confidence: 置信水平
+    :param max_workers: 进程数，默认为CPU核数
+    :param target_half_width: 每次重复在周期时间置信区间半宽达标时提前结束
+    """
+    params = validate_params(params or {})
+    if seeds is None:
+        seeds = list(range(base_seed, base_seed + replications))
+    if not seeds:
+        raise ValueError("At least one replication is required")
+
+    tasks = [(params, seed, duration, target_half_width) for seed in seeds]
+    results = _map(_run_replication_args, tasks, max_workers)
+
+    return {
+        'params': params,
+        'duration': duration,
+        'replications': len(results),
+        'confidence': confidence,
+        'results': results,
+        'summary': summarize(results, confidence),
+    }
+
+
+def run_comparison(scenarios: List[Dict[str, Any]],
+                   replications: int = 10,
+                   duration: float = 100,
+                   base_seed: int = 0,
+                   confidence: float = 0.95,
+                   max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    公共随机数方案对比：所有方案使用相同的种子序列，
+    同一种子下到达和各工位加工时间序列相同，差值的方差显著小于独立抽样；
+    以第一个方案为基准，逐指标给出配对差值的置信区间
+    :param scenarios: 各方案的仿真参数（见 EXPERIMENT_PARAMS）
+    """
+    scenarios = [validate_params(scenario) for scenario in scenarios]
+    if len(scenarios) < 2:
+        raise ValueError("At least two scenarios are required")
+    if replications < 1:
+        raise ValueError("At least one replication is required")
+
+    seeds = list(range(base_seed, base_seed + replications))
+    tasks = [(scenario, seed, duration) for scenario in scenarios for seed in seeds]
+    flat = _map(_run_replication_args, tasks, max_workers)
+    results = [flat[i:i + replications] for i in range(0, len(flat), replications)]
+
+    baseline = results[0]
+    comparisons = []
+    for scenario, scenario_results in zip(scenarios, results):
+        differences = {}
+        for key, first in baseline[0].items():
+            if key == 'seed' or isinstance(first, bool) or not isinstance(first, (int, float)):
+                continue
+            differences[key] = summarize_values(
+                [r[key] - b[key] for r, b in zip(scenario_results, baseline)], confidence)
+        comparisons.append({
+            'params': scenario,
+            'summary': summarize(scenario_results, confidence),
+            'difference': differences,
+        })
+
+    return {
+        'duration': duration,
+        'replications': replications,
+        'seeds': seeds,
+        'confidence': confidence,
+        'scenarios': comparisons,
+    }
+
+
+def validate_variant(variant: Dict[str, Any]) -> Dict[str, Any]:
+    """检查分叉方案的参数（拓扑不可在分叉时修改）"""
+    allowed = (set(EXPERIMENT_PARAMS) - {'topology'}) | set(FORK_STATION_PARAMS) | {'seed'}
+    unknown = set(variant) - allowed
+    if unknown:
+        raise ValueError(f"Unknown variant parameters: {sorted(unknown)}")
+    validate_params({k: v for k, v in variant.items() if k in EXPERIMENT_PARAMS})
+    return dict(variant)
+
+
+def _run_variant_args(args):
+    """从检查点恢复一个方案并运行（进程池映射入口）"""
+    checkpoint, variant, duration = args
+    sim = ProductionLineSimulation.from_checkpoint(checkpoint, record_events=False, **variant)
+    sim.reset_statistics()
+    return sim.run(until=checkpoint['time'] + duration)
+
+
+def run_what_if(variants: List[Dict[str, Any]],
+                params: Optional[Dict[str, Any]] = None,
+                warmup: float = 1000,
+                duration: float = 1000,
+                seed: int = 0,
+                max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    假设分析：预热一次后分叉为多个方案并行运行
+    各方案从同一检查点继续并沿用其随机数状态（公共随机数），
+    统计只覆盖分叉之后的 duration 时段
+    :param variants: 各方案的参数覆盖，如 {"station_processing_mean": {"5": 4.0}}
+    :param params: 预热阶段的仿真参数（见 EXPERIMENT_PARAMS）
+    """
+    params = validate_params(params or {})
+    variants = [validate_variant(variant) for variant in variants]
+    if not variants:
+        raise ValueError("At least one variant is required")
+
+    sim = ProductionLineSimulation(record_events=False, seed=seed, **params)
+    sim.run(until=warmup)
+    checkpoint = sim.checkpoint()
+
+    tasks = [(checkpoint, variant, duration) for variant in variants]
+    results = _map(_run_variant_args, tasks, max_workers)
+    return {
+        'params': params,
+        'warmup': warmup,
+        'duration': duration,
+        'seed': seed,
+        'variants': [
+            {'variant': variant, 'statistics': stats}
+            for variant, stats in zip(variants, results)
+        ],
+    }
+
+
+if __name__ == '__main__':
+    import json
+
+    experiment = run_experiment(replications=20, duration=500)
+    print(json.dumps(experiment['summary'], indent=2))
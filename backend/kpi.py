@@ -0,0 +1,146 @@
+"""
+按仿真时间窗口聚合的KPI流
+推送通道在应用每条事件前，按实时状态（LiveState）累计上一时刻至今的时间加权量，
+每个固定长度的仿真时间窗口结束时生成一条 kpi 消息：产出与产能、在制品、
+各工位利用率和缓冲区水平；概览类客户端只订阅该流即可，无需接收逐条物料事件
+"""
+
+import math
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from live_state import LiveState
+
+MSG_KPI = 'kpi'
+
+# 客户端订阅的推送流
+STREAM_RAW = 'raw'     # 逐条仿真事件（原有行为）
+STREAM_KPI = 'kpi'     # 仅窗口聚合KPI
+STREAM_BOTH = 'both'
+STREAMS = (STREAM_RAW, STREAM_KPI, STREAM_BOTH)
+
+DEFAULT_KPI_WINDOW = 1.0
+
+
+class KpiAggregator:
+    """固定仿真时间窗口的KPI聚合（非线程安全，由推送通道在其锁内调用）"""
+
+    def __init__(self, window: float = DEFAULT_KPI_WINDOW, num_stations: int = 0,
+                 num_buffers: int = 0, history: int = 600):
+        """
+        :param window: 窗口长度（仿真秒）
+        :param num_stations: 工位数（未知时按出现过的最大编号扩展）
+        :param num_buffers: 缓冲区数
+        :param history: 保留最近多少条窗口消息（供HTTP查询）
+        """
+        if window <= 0:
+            raise ValueError("KPI window must be positive")
+        self.window = window
+        self.num_stations = num_stations
+        self.num_buffers = num_buffers
+        self.recent = deque(maxlen=history)
+        self.windows = 0
+        self._start: Optional[float] = None
+        self._clock = 0.0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._finished = 0
+        self._arrived = 0
+        self._wip_area = 0.0
+        self._busy_area = [0.0] * self.num_stations
+        self._buffer_area = [0.0] * self.num_buffers
+
+    def _accumulate(self, until: float, state: LiveState):
+        """按当前状态累计 [clock, until) 的时间加权量"""
+        dt = until - self._clock
+        if dt <= 0:
+            return
+        self._wip_area += len(state.parts) * dt
+        busy_area = self._busy_area
+        for station in state.busy_stations:
+            if station is None:
+                continue
+            if station >= len(busy_area):
+                busy_area.extend([0.0] * (station + 1 - len(busy_area)))
+            busy_area[station] += dt
+        buffer_area = self._buffer_area
+        for buffer_id, level in state.buffer_levels.items():
+            if buffer_id >= len(buffer_area):
+                buffer_area.extend([0.0] * (buffer_id + 1 - len(buffer_area)))
+            buffer_area[buffer_id] += level * dt
+        self._clock = until
+
+    def _close(self, end: float, state: LiveState, partial: bool = False) -> Dict[str, Any]:
+        """结束当前窗口 [start, end) 并生成消息"""
+        self._accumulate(end, state)
+        length = end - self._start
+        scale = 1.0 / length if length > 0 else 0.0
+        num_stations = max(self.num_stations, len(self._busy_area))
+        num_buffers = max(self.num_buffers, len(self._buffer_area))
+        busy = self._busy_area + [0.0] * (num_stations - len(self._busy_area))
+        buffers = self._buffer_area + [0.0] * (num_buffers - len(self._buffer_area))
+        levels = [0] * num_buffers
+        for buffer_id, level in state.buffer_levels.items():
+            levels[buffer_id] = level
+
+        message = {
+            'type': MSG_KPI,
+            'timestamp': end,
+            'data': {
+                'window_start': self._start,
+                'window_end': end,
+                'partial': partial,
+                'arrived': self._arrived,
+                'finished': self._finished,
+                'throughput': self._finished * scale,
+                'wip': len(state.parts),
+                'avg_wip': self._wip_area * scale,
+                'utilization': [area * scale for area in busy],
+                'busy_stations': sorted(s for s in state.busy_stations if s is not None),
+                'buffer_levels': levels,
+                'avg_buffer_levels': [area * scale for area in buffers],
+            }
+        }
+        self.recent.append(message)
+        self.windows += 1
+        self._start = end
+        self._reset_window()
+        return message
+
+    def observe(self, message: Dict[str, Any], state: LiveState) -> List[Dict[str, Any]]:
+        """
+        在事件应用到 state 之前调用，返回因时间推进而结束的窗口消息；
+        事件间隔跨越多个窗口时，中间无事件的时段合并为一条消息
+        """
+        event_type = message.get('type')
+        timestamp = message.get('timestamp')
+        if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+            return []
+        data = message.get('data')
+        if not isinstance(data, dict) or data.get('part_id') is None:
+            return []
+
+        closed = []
+        if self._start is None:
+            self._start = self._clock = math.floor(timestamp / self.window) * self.window
+        else:
+            window_end = self._start + self.window
+            if timestamp >= window_end:
+                closed.append(self._close(window_end, state))
+                boundary = math.floor(timestamp / self.window) * self.window
+                if boundary > self._start:
+                    closed.append(self._close(boundary, state))
+
+        self._accumulate(timestamp, state)
+        if event_type == 'part_arrived':
+            self._arrived += 1
+        elif event_type == 'part_finished':
+            self._finished += 1
+        return closed
+
+    def finish(self, state: LiveState) -> Optional[Dict[str, Any]]:
+        """仿真结束时输出未满的最后一个窗口"""
+        if self._start is None or state.timestamp <= self._start:
+            return None
+        return self._close(state.timestamp, state, partial=True)
@@ -0,0 +1,120 @@
+"""
+实时状态模型
+由事件流增量维护当前在制品位置、工位状态和缓冲区水平；
+新连接的客户端先收到一次紧凑快照，随后接收增量事件，
+周期性关键帧供丢帧的客户端重新同步，无需回放完整事件历史
+"""
+
+from typing import Dict, Any, List, Optional
+
+MSG_SNAPSHOT = 'snapshot'   # 连接时发送的完整状态
+MSG_KEYFRAME = 'keyframe'   # 周期性发送的完整状态
+
+# 物料离开产线的事件
+TERMINAL_EVENTS = ('part_finished', 'part_aborted')
+# 仿真结束消息
+FINAL_EVENTS = ('simulation_completed', 'simulation_stopped')
+
+
+class LiveState:
+    """当前产线状态（按事件增量更新，非线程安全，由调用方加锁）"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """清空状态（新一轮仿真开始时调用）"""
+        self.seq = 0              # 已应用的事件数
+        self.timestamp = 0.0      # 最近一条事件的仿真时间
+        self.finished: Optional[str] = None
+        # 物料ID -> [状态, 位置, 所在工位ID, 所在缓冲区ID]
+        self.parts: Dict[str, list] = {}
+        self.busy_stations = set()
+        self.buffer_levels: Dict[int, int] = {}
+
+    def copy(self) -> "LiveState":
+        """状态副本（物料条目逐个复制，位置坐标不可变可共享）"""
+        state = LiveState.__new__(LiveState)
+        state.seq = self.seq
+        state.timestamp = self.timestamp
+        state.finished = self.finished
+        state.parts = {part_id: list(entry) for part_id, entry in self.parts.items()}
+        state.busy_stations = set(self.busy_stations)
+        state.buffer_levels = dict(self.buffer_levels)
+        return state
+
+    def _leave_buffer(self, entry: list):
+        buffer_id = entry[3]
+        if buffer_id is not None:
+            self.buffer_levels[buffer_id] = max(0, self.buffer_levels.get(buffer_id, 0) - 1)
+            entry[3] = None
+
+    def apply(self, message: Dict[str, Any]):
+        """应用一条推送消息，非仿真事件忽略"""
+        event_type = message.get('type')
+        if event_type in FINAL_EVENTS:
+            self.finished = event_type
+            return
+        data = message.get('data')
+        timestamp = message.get('timestamp')
+        if not isinstance(data, dict) or not isinstance(timestamp, (int, float)):
+            return
+        part_id = data.get('part_id')
+        if part_id is None:
+            return
+
+        self.seq += 1
+        self.timestamp = timestamp
+        entry = self.parts.get(part_id)
+
+        if event_type in TERMINAL_EVENTS:
+            if entry is not None:
+                self._leave_buffer(entry)
+                if entry[2] is not None and entry[0] == 'processing':
+                    self.busy_stations.discard(entry[2])
+                del self.parts[part_id]
+            return
+
+        if entry is None:
+            entry = self.parts[part_id] = [None, None, None, None]
+        entry[0] = data.get('status', event_type)
+        if 'position' in data:
+            entry[1] = data['position']
+
+        buffer_id = data.get('buffer_id')
+        if buffer_id is not None:
+            # 物料在缓冲区中（放入后、取出前），水平按所在物料数统计
+            if entry[3] != buffer_id:
+                self._leave_buffer(entry)
+                entry[3] = buffer_id
+                self.buffer_levels[buffer_id] = self.buffer_levels.get(buffer_id, 0) + 1
+        elif event_type == 'part_processing':
+            # 物料在工位前排队时仍占用缓冲区，占用工位开始加工时才取出
+            self._leave_buffer(entry)
+
+        workstation_id = data.get('workstation_id')
+        entry[2] = workstation_id
+        if event_type == 'part_processing':
+            self.busy_stations.add(workstation_id)
+        elif event_type == 'part_completed_station':
+            self.busy_stations.discard(workstation_id)
+
+    def snapshot(self, message_type: str = MSG_SNAPSHOT) -> Dict[str, Any]:
+        """紧凑的完整状态消息；物料为 [ID, 状态, x, y] 数组"""
+        levels: List[int] = [0] * (max(self.buffer_levels, default=-1) + 1)
+        for buffer_id, level in self.buffer_levels.items():
+            levels[buffer_id] = level
+        return {
+            'type': message_type,
+            'timestamp': self.timestamp,
+            'data': {
+                'seq': self.seq,
+                'finished': self.finished,
+                'parts': [
+                    [part_id, entry[0]] + list(entry[1] or (None, None))
+                    for part_id, entry in self.parts.items()
+                ],
+                'busy_stations': sorted(self.busy_stations),
+                'buffer_levels': levels
+            }
+        }
@@ -0,0 +1,274 @@
+"""
+运行指标与采样分析
+计数和队列深度由各组件自行维护（仿真热路径上不做额外计时），
+/api/metrics 抓取时汇总为 Prometheus 文本格式；
+延迟类指标用固定桶直方图记录；可按次运行开启采样分析器，定位仿真线程的耗时分布
+"""
+
+import math
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """固定桶直方图（每个实例只由一个线程写入，抓取时读取）"""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # 最后一格为 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        """累加另一个同桶直方图"""
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        return self
+
+    def copy(self) -> "Histogram":
+        return Histogram(self.buckets).merge(self)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估计分位数（落在 +Inf 桶时返回最大的有限上界）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if math.isnan(value):
+            return 'NaN'
+    return repr(value)
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        text = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{key}="{text}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class PrometheusWriter:
+    """按指标族收集样本并输出 Prometheus 文本格式（0.0.4）"""
+
+    def __init__(self):
+        # 指标名 -> (类型, 说明, 样本行)
+        self._families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> List[str]:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help_text, [])
+        return family[2]
+
+    def gauge(self, name: str, help_text: str, value: float, **labels):
+        self._family(name, 'gauge', help_text).append(
+            f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def counter(self, name: str, help_text: str, value: float, **labels):
+        # 指标族名与样本名一致（均带 _total），否则0.0.4文本格式的抓取端视为无类型
+        name = f"{name}_total"
+        self._family(name, 'counter', help_text).append(
+            f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram, **labels):
+        lines = self._family(name, 'histogram', help_text)
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + (float('inf'),), histogram.counts):
+            cumulative += n
+            bucket_labels = dict(labels, le=_format_value(float(bound)))
+            lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        out = []
+        for name, (kind, help_text, lines) in self._families.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按固定间隔读取目标线程的调用栈（sys._current_frames），
+    按函数统计自身采样数（栈顶）和累计采样数（出现在栈中）；
+    不挂钩每次函数调用，开销只与采样频率有关
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._self: Counter = Counter()
+        self._total: Counter = Counter()
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    def start(self, thread_id: Optional[int] = None) -> "SamplingProfiler":
+        """开始采样指定线程（默认为调用线程）"""
+        self._thread_id = thread_id or threading.get_ident()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.stopped_at = self.stopped_at or time.time()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                break
+            self._sample(frame)
+
+    def _sample(self, frame):
+        self.samples += 1
+        seen = set()
+        depth = 0
+        leaf = True
+        while frame is not None and depth < self.max_depth:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if leaf:
+                self._self[key] += 1
+                leaf = False
+            if key not in seen:
+                seen.add(key)
+                self._total[key] += 1
+            frame = frame.f_back
+            depth += 1
+
+    def summary(self, top: int = 30) -> Dict[str, Any]:
+        """采样结果：按累计采样数排序的函数列表"""
+        samples = self.samples or 1
+        functions = []
+        for key, total in self._total.most_common(top):
+            filename, line, name = key
+            functions.append({
+                'function': name,
+                'file': filename,
+                'line': line,
+                'self': self._self.get(key, 0),
+                'total': total,
+                'self_fraction': self._self.get(key, 0) / samples,
+                'total_fraction': total / samples,
+            })
+        return {
+            'samples': self.samples,
+            'interval': self.interval,
+            'running': self.stopped_at is None,
+            'functions': functions,
+        }
+
+
+def render_metrics(session_manager) -> str:
+    """汇总所有会话和推送通道的指标"""
+    writer = PrometheusWriter()
+    session_list = session_manager.list()
+    writer.gauge("simulation_sessions", "Number of simulation sessions", len(session_list))
+    writer.gauge("simulation_sessions_running", "Number of running simulation sessions",
+                 sum(session.running for session in session_list))
+
+    for session in session_list:
+        labels = {'session': session.id, 'mode': session.mode}
+        metrics = session.worker.metrics()
+        writer.gauge("simulation_running", "Whether the simulation is running",
+                     session.running, **labels)
+        writer.counter("simulation_events", "Simulation events published",
+                       metrics['events'], **labels)
+        writer.gauge("simulation_events_per_second",
+                     "Simulation events published per wall-clock second",
+                     metrics['events_per_second'], **labels)
+        writer.gauge("simulation_time_seconds", "Current simulation clock",
+                     metrics['sim_time'], **labels)
+        writer.gauge("simulation_wall_seconds", "Wall-clock time since the run started",
+                     metrics['wall_seconds'], **labels)
+        writer.gauge("simulation_sim_wall_ratio",
+                     "Simulated seconds per wall-clock second",
+                     metrics['sim_wall_ratio'], **labels)
+        writer.gauge("simulation_event_queue_depth",
+                     "Events waiting between the simulation and the publisher",
+                     metrics['queue_depth'], **labels)
+        writer.gauge("simulation_event_queue_max_depth",
+                     "Highest event queue depth observed in this run",
+                     metrics['queue_max_depth'], **labels)
+        writer.counter("simulation_event_queue_blocked_puts",
+                       "Times the simulation waited on a full event queue",
+                       metrics['blocked_puts'], **labels)
+
+    for session_id, channel in list(session_manager.channels.items()):
+        labels = {'session': session_id}
+        stats = channel.stats()
+        writer.gauge("websocket_connections", "Connected WebSocket clients",
+                     stats['connections'], **labels)
+        writer.gauge("websocket_queue_depth", "Messages waiting in client send queues",
+                     stats['queue_depth'], **labels)
+        writer.counter("websocket_messages_sent", "Messages sent to clients",
+                       stats['sent'], **labels)
+        writer.counter("websocket_messages_dropped", "Messages dropped for slow clients",
+                       stats['dropped'], **labels)
+        writer.counter("websocket_messages_filtered", "Part events outside client viewports",
+                       stats['filtered'], **labels)
+        writer.counter("websocket_evicted", "Clients evicted as slow or dead",
+                       stats['evicted'], **labels)
+        writer.histogram("websocket_publish_seconds",
+                         "Time to apply and fan out one event to all client queues",
+                         channel.publish_latency, **labels)
+        writer.histogram("websocket_send_latency_seconds",
+                         "Delay from enqueue to send completion, all clients",
+                         channel.send_latency(), **labels)
+        for client in list(channel.active_connections):
+            writer.histogram("websocket_client_send_latency_seconds",
+                             "Delay from enqueue to send completion per client",
+                             client.send_latency, client=client.id, **labels)
+
+    return writer.render()
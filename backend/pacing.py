@@ -0,0 +1,78 @@
+"""
+仿真事件推送节奏控制
+仿真线程通过有界队列把事件交给推送线程：队列满时仿真线程阻塞（反压），内存占用恒定；
+回放速度由仿真侧的实时环境（simpy.rt.RealtimeEnvironment）控制
+"""
+
+import queue
+import threading
+from typing import Callable, Dict, Any, Optional
+
+_CLOSE = object()
+
+
+def realtime_factor(speed: Optional[float]) -> Optional[float]:
+    """
+    速度倍数 -> RealtimeEnvironment 的 factor（每仿真秒对应的墙钟秒数）
+    speed 为 None 或 <= 0 表示尽可能快（不做实时同步）
+    """
+    if speed is None or speed <= 0:
+        return None
+    return 1.0 / speed
+
+
+class EventPump:
+    """仿真线程 -> 推送线程 的有界事件通道"""
+
+    def __init__(self, publish: Callable[[Dict[str, Any]], None],
+                 maxsize: int = 1000, name: str = "event-pump"):
+        """
+        :param publish: 推送函数（在推送线程中调用）
+        :param maxsize: 队列上限，满时 put 阻塞仿真线程
+        """
+        self.publish = publish
+        self.maxsize = maxsize
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.published = 0
+        self.blocked_puts = 0
+        # 推送线程观察到的最大排队深度
+        self.max_depth = 0
+
+    def start(self) -> "EventPump":
+        self._thread.start()
+        return self
+
+    def put(self, event: Dict[str, Any]):
+        """入队事件（作为仿真回调使用），队列满时阻塞"""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.blocked_puts += 1
+            self._queue.put(event)
+
+    def close(self):
+        """推送完剩余事件后结束推送线程"""
+        self._queue.put(_CLOSE)
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    @property
+    def depth(self) -> int:
+        """当前排队的事件数"""
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is _CLOSE:
+                break
+            depth = self._queue.qsize() + 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+            try:
+                self.publish(event)
+                self.published += 1
+            except Exception as e:
+                print(f"Error publishing event: {e}")
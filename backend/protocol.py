@@ -0,0 +1,261 @@
+"""
+WebSocket紧凑二进制协议
+多个事件合并为一帧，事件类型、字段名、物料ID等字符串通过每连接的字符串表编码为整数，
+可选zlib压缩；JSON逐条推送仍作为默认的兼容格式
+
+帧格式（小端）:
+    byte 0      魔数 0xB1
+    byte 1      标志位，bit0 = 负载经过zlib压缩
+    byte 2..    负载：若干条记录直到帧尾
+
+记录格式:
+    0x01 STRING  varint id, varint 长度, UTF-8字节        字符串表新增条目
+    0x02 EVENT   f64 仿真时间, varint 类型id, varint 字段数, 字段...
+    0x03 JSON    varint 长度, UTF-8 JSON                  无法紧凑编码的消息（如统计结果）
+    0x04 RESET                                            清空字符串表
+
+字段格式: varint 字段名id, byte 值类型, 值
+    0x00 null   0x01 true   0x02 false
+    0x03 int    zigzag varint
+    0x04 float  f64
+    0x05 str    varint 字符串id
+    0x06 point  2 x f32（坐标）
+    0x07 json   varint 长度, UTF-8 JSON
+"""
+
+import json
+import struct
+import zlib
+from typing import List, Dict, Any, Iterable, Tuple
+
+MAGIC = 0xB1
+FLAG_COMPRESSED = 0x01
+
+REC_STRING = 0x01
+REC_EVENT = 0x02
+REC_JSON = 0x03
+REC_RESET = 0x04
+
+VAL_NULL = 0x00
+VAL_TRUE = 0x01
+VAL_FALSE = 0x02
+VAL_INT = 0x03
+VAL_FLOAT = 0x04
+VAL_STR = 0x05
+VAL_POINT = 0x06
+VAL_JSON = 0x07
+
+PROTOCOL_JSON = 'json'
+PROTOCOL_BINARY = 'binary'
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY)
+
+_F64 = struct.Struct('<d')
+_POINT = struct.Struct('<ff')
+
+
+def _write_varint(buf: bytearray, value: int):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+class BinaryEncoder:
+    """二进制帧编码器（每个连接一个，维护该连接的字符串表）"""
+
+    def __init__(self, compress: bool = False, max_strings: int = 65536,
+                 compress_min_bytes: int = 256):
+        """
+        :param compress: 是否对负载进行zlib压缩
+        :param max_strings: 字符串表上限，超过后发送RESET重建
+        :param compress_min_bytes: 小于该长度的负载不压缩
+        """
+        self.compress = compress
+        self.max_strings = max_strings
+        self.compress_min_bytes = compress_min_bytes
+        self._strings: Dict[str, int] = {}
+
+    def _string_id(self, buf: bytearray, value: str) -> int:
+        """获取字符串id，首次出现时写入STRING记录"""
+        sid = self._strings.get(value)
+        if sid is None:
+            sid = len(self._strings)
+            self._strings[value] = sid
+            raw = value.encode('utf-8')
+            buf.append(REC_STRING)
+            _write_varint(buf, sid)
+            _write_varint(buf, len(raw))
+            buf += raw
+        return sid
+
+    def _write_json(self, buf: bytearray, message: Any):
+        raw = json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        _write_varint(buf, len(raw))
+        buf += raw
+
+    def _encode_value(self, buf: bytearray, value: Any) -> bytearray:
+        """编码字段值，返回值字节（字符串定义直接写入buf）"""
+        out = bytearray()
+        if value is None:
+            out.append(VAL_NULL)
+        elif value is True:
+            out.append(VAL_TRUE)
+        elif value is False:
+            out.append(VAL_FALSE)
+        elif isinstance(value, int):
+            out.append(VAL_INT)
+            _write_varint(out, _zigzag(value))
+        elif isinstance(value, float):
+            out.append(VAL_FLOAT)
+            out += _F64.pack(value)
+        elif isinstance(value, str):
+            sid = self._string_id(buf, value)
+            out.append(VAL_STR)
+            _write_varint(out, sid)
+        elif (isinstance(value, (list, tuple)) and len(value) == 2
+              and all(isinstance(v, (int, float)) for v in value)):
+            out.append(VAL_POINT)
+            out += _POINT.pack(value[0], value[1])
+        else:
+            out.append(VAL_JSON)
+            self._write_json(out, value)
+        return out
+
+    def _encode_message(self, buf: bytearray, message: Dict[str, Any]):
+        timestamp = message.get('timestamp')
+        data = message.get('data')
+        if not isinstance(timestamp, (int, float)) or not isinstance(data, dict):
+            # 非仿真事件（控制消息、统计结果）按JSON记录发送
+            buf.append(REC_JSON)
+            self._write_json(buf, message)
+            return
+
+        # 字符串表将满时先重建，保证同一事件引用的id都在同一张表内
+        if len(self._strings) + 2 * len(data) + 1 > self.max_strings:
+            buf.append(REC_RESET)
+            self._strings.clear()
+
+        type_id = self._string_id(buf, message['type'])
+        fields = bytearray()
+        for key, value in data.items():
+            key_id = self._string_id(buf, key)
+            value_bytes = self._encode_value(buf, value)
+            _write_varint(fields, key_id)
+            fields += value_bytes
+
+        buf.append(REC_EVENT)
+        buf += _F64.pack(timestamp)
+        _write_varint(buf, type_id)
+        _write_varint(buf, len(data))
+        buf += fields
+
+    def encode(self, messages: Iterable[Dict[str, Any]]) -> bytes:
+        """将一批消息编码为一帧"""
+        payload = bytearray()
+        for message in messages:
+            self._encode_message(payload, message)
+
+        flags = 0
+        if self.compress and len(payload) >= self.compress_min_bytes:
+            payload = zlib.compress(bytes(payload), 6)
+            flags |= FLAG_COMPRESSED
+        return bytes((MAGIC, flags)) + bytes(payload)
+
+
+class BinaryDecoder:
+    """二进制帧解码器（与前端 app.js 中的解码逻辑对应）"""
+
+    def __init__(self):
+        self._strings: List[str] = []
+
+    def _read_json(self, data: bytes, pos: int) -> Tuple[Any, int]:
+        length, pos = _read_varint(data, pos)
+        return json.loads(data[pos:pos + length].decode('utf-8')), pos + length
+
+    def _read_value(self, data: bytes, pos: int) -> Tuple[Any, int]:
+        tag = data[pos]
+        pos += 1
+        if tag == VAL_NULL:
+            return None, pos
+        if tag == VAL_TRUE:
+            return True, pos
+        if tag == VAL_FALSE:
+            return False, pos
+        if tag == VAL_INT:
+            raw, pos = _read_varint(data, pos)
+            return _unzigzag(raw), pos
+        if tag == VAL_FLOAT:
+            return _F64.unpack_from(data, pos)[0], pos + _F64.size
+        if tag == VAL_STR:
+            sid, pos = _read_varint(data, pos)
+            return self._strings[sid], pos
+        if tag == VAL_POINT:
+            return list(_POINT.unpack_from(data, pos)), pos + _POINT.size
+        if tag == VAL_JSON:
+            return self._read_json(data, pos)
+        raise ValueError(f"Unknown value tag: {tag}")
+
+    def decode(self, frame: bytes) -> List[Dict[str, Any]]:
+        """解码一帧，返回消息列表"""
+        if len(frame) < 2 or frame[0] != MAGIC:
+            raise ValueError("Not a binary event frame")
+        data = frame[2:]
+        if frame[1] & FLAG_COMPRESSED:
+            data = zlib.decompress(data)
+
+        messages = []
+        pos = 0
+        while pos < len(data):
+            rec = data[pos]
+            pos += 1
+            if rec == REC_STRING:
+                sid, pos = _read_varint(data, pos)
+                length, pos = _read_varint(data, pos)
+                value = data[pos:pos + length].decode('utf-8')
+                pos += length
+                if sid == len(self._strings):
+                    self._strings.append(value)
+                else:
+                    self._strings[sid] = value
+            elif rec == REC_EVENT:
+                timestamp = _F64.unpack_from(data, pos)[0]
+                pos += _F64.size
+                type_id, pos = _read_varint(data, pos)
+                count, pos = _read_varint(data, pos)
+                event_data = {}
+                for _ in range(count):
+                    key_id, pos = _read_varint(data, pos)
+                    event_data[self._strings[key_id]], pos = self._read_value(data, pos)
+                messages.append({
+                    'timestamp': timestamp,
+                    'type': self._strings[type_id],
+                    'data': event_data
+                })
+            elif rec == REC_JSON:
+                message, pos = self._read_json(data, pos)
+                messages.append(message)
+            elif rec == REC_RESET:
+                self._strings.clear()
+            else:
+                raise ValueError(f"Unknown record type: {rec}")
+        return messages
@@ -0,0 +1,255 @@
+"""
+事件回放
+对已记录的事件流（运行历史中保存的事件，或仿真的事件日志）建立仿真时间索引，
+每隔固定条数保存一次状态关键帧；定位到任意时刻只需二分查找 + 从最近关键帧重放少量事件，
+回放按指定速度经WebSocket推送，支持暂停、变速和前后拖动
+"""
+
+import asyncio
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from connections import ClientConnection
+from live_state import LiveState, MSG_SNAPSHOT
+
+MSG_REPLAY_STATUS = 'replay_status'
+
+# 客户端控制命令
+ACTION_PLAY = 'play'
+ACTION_PAUSE = 'pause'
+ACTION_SEEK = 'seek'
+ACTION_SPEED = 'speed'
+ACTIONS = (ACTION_PLAY, ACTION_PAUSE, ACTION_SEEK, ACTION_SPEED)
+
+
+class ReplayIndex:
+    """事件流的仿真时间索引与周期性状态关键帧（构建后只读，可被多个回放共享）"""
+
+    def __init__(self, events: Iterable[Dict[str, Any]], keyframe_interval: int = 256):
+        """
+        :param events: 按仿真时间排序的事件（含 timestamp/type/data）
+        :param keyframe_interval: 每隔多少条事件保存一次状态关键帧
+        """
+        if keyframe_interval <= 0:
+            raise ValueError("keyframe_interval must be positive")
+        self.keyframe_interval = keyframe_interval
+        self.events: List[Dict[str, Any]] = []
+        self.times = array('d')
+        # keyframes[k] 为应用前 k * keyframe_interval 条事件后的状态
+        self.keyframes: List[LiveState] = []
+
+        state = LiveState()
+        for event in events:
+            if len(self.events) % keyframe_interval == 0:
+                self.keyframes.append(state.copy())
+            message = {'timestamp': event['timestamp'], 'type': event['type'],
+                       'data': event['data']}
+            self.events.append(message)
+            self.times.append(message['timestamp'])
+            state.apply(message)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @property
+    def start_time(self) -> float:
+        return self.times[0] if self.times else 0.0
+
+    @property
+    def end_time(self) -> float:
+        return self.times[-1] if self.times else 0.0
+
+    def position(self, sim_time: float) -> int:
+        """仿真时间 <= sim_time 的事件数（二分查找）"""
+        return bisect_right(self.times, sim_time)
+
+    def state_at(self, sim_time: float) -> LiveState:
+        """sim_time 时刻（含该时刻的事件）的产线状态：最近关键帧 + 增量重放"""
+        position = self.position(sim_time)
+        if not self.keyframes:
+            return LiveState()
+        # 事件数恰为关键帧间隔的整数倍时，末尾之后没有关键帧，从最后一个关键帧重放
+        keyframe = min(position // self.keyframe_interval, len(self.keyframes) - 1)
+        state = self.keyframes[keyframe].copy()
+        for message in self.events[keyframe * self.keyframe_interval:position]:
+            state.apply(message)
+        state.timestamp = max(state.timestamp, min(sim_time, self.end_time))
+        return state
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'events': len(self.events),
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'keyframes': len(self.keyframes),
+            'keyframe_interval': self.keyframe_interval,
+        }
+
+
+def load_run_events(store, run_id: str, page_size: int = 10000) -> Iterable[Dict[str, Any]]:
+    """按序号分页读取运行历史中保存的事件"""
+    after_seq = -1
+    while True:
+        page = store.get_events(run_id, after_seq=after_seq, limit=page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_seq = page[-1]['seq']
+
+
+class ReplayCache:
+    """最近使用的回放索引（按运行ID，LRU）"""
+
+    def __init__(self, store, max_entries: int = 4, keyframe_interval: int = 256):
+        self.store = store
+        self.max_entries = max_entries
+        self.keyframe_interval = keyframe_interval
+        self._indexes: "OrderedDict[str, ReplayIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效加一，加载期间发生失效的索引不放入缓存
+        self._generation = 0
+
+    def get(self, run_id: str) -> Optional[ReplayIndex]:
+        """运行的回放索引；运行不存在或未保存事件时返回None"""
+        with self._lock:
+            index = self._indexes.get(run_id)
+            if index is not None:
+                self._indexes.move_to_end(run_id)
+                return index
+            generation = self._generation
+        run = self.store.get_run(run_id)
+        if run is None or not run['event_count']:
+            return None
+        index = ReplayIndex(load_run_events(self.store, run_id), self.keyframe_interval)
+        with self._lock:
+            if generation == self._generation:
+                self._indexes[run_id] = index
+                while len(self._indexes) > self.max_entries:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, run_id: str):
+        """丢弃运行的回放索引（运行被删除时调用）"""
+        with self._lock:
+            self._indexes.pop(run_id, None)
+            self._generation += 1
+
+
+class ReplayPlayer:
+    """单个客户端的回放：按速度把事件推入客户端发送队列，响应控制命令"""
+
+    def __init__(self, index: ReplayIndex, client: ClientConnection,
+                 speed: float = 1.0, start: Optional[float] = None, paused: bool = False):
+        """
+        :param speed: 回放速度倍数（仿真秒/墙钟秒）
+        :param start: 起始仿真时刻，默认为第一条事件的时刻
+        """
+        if speed <= 0:
+            raise ValueError("Replay speed must be positive")
+        self.index = index
+        self.client = client
+        self.speed = speed
+        self.paused = paused
+        self.position = 0
+        self._anchor_sim = 0.0
+        self._anchor_wall = 0.0
+        self._wakeup = asyncio.Event()
+        self.seek(index.start_time if start is None else start)
+
+    @property
+    def sim_time(self) -> float:
+        """当前回放到的仿真时刻"""
+        if self.paused:
+            return self._anchor_sim
+        elapsed = time.monotonic() - self._anchor_wall
+        return min(self._anchor_sim + elapsed * self.speed, self.index.end_time)
+
+    def _anchor(self, sim_time: float):
+        self._anchor_sim = sim_time
+        self._anchor_wall = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'type': MSG_REPLAY_STATUS,
+            'timestamp': self.sim_time,
+            'data': dict(self.index.describe(), speed=self.speed, paused=self.paused,
+                         position=self.position, time=self.sim_time)
+        }
+
+    def seek(self, sim_time: float):
+        """定位到 sim_time：发送该时刻的状态快照，之后从下一条事件继续回放"""
+        sim_time = min(max(sim_time, self.index.start_time), self.index.end_time)
+        self.client.enqueue(self.index.state_at(sim_time).snapshot(MSG_SNAPSHOT))
+        self.position = self.index.position(sim_time)
+        self._anchor(sim_time)
+
+    def handle(self, command: Dict[str, Any]):
+        """处理客户端命令，如 {"action": "seek", "time": 120} 或 {"action": "speed", "value": 10}"""
+        action = command.get('action')
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown replay action: {action}")
+        if action == ACTION_SEEK:
+            self.seek(float(command['time']))
+        elif action == ACTION_SPEED:
+            speed = float(command['value'])
+            if speed <= 0:
+                raise ValueError("Replay speed must be positive")
+            self._anchor(self.sim_time)
+            self.speed = speed
+        elif action == ACTION_PAUSE:
+            self._anchor(self.sim_time)
+            self.paused = True
+        elif action == ACTION_PLAY:
+            if self.position >= len(self.index):
+                self.seek(self.index.start_time)
+            self._anchor(self._anchor_sim)
+            self.paused = False
+        self.client.enqueue(self.status())
+        self._wakeup.set()
+
+    async def run(self, max_backlog: Optional[int] = None):
+        """
+        回放主循环（在连接所在的事件循环中运行）
+        :param max_backlog: 发送队列积压超过该值时暂缓推送，默认为队列上限的一半
+        """
+        max_backlog = max_backlog or max(1, self.client.max_queue // 2)
+        events, times = self.index.events, self.index.times
+        self.client.enqueue(self.status())
+        while not self.client.closed:
+            delay = None
+            if not self.paused:
+                if self.client.queue_depth > max_backlog:
+                    delay = 0.01
+                else:
+                    target = self.sim_time
+                    end = bisect_right(times, target, self.position)
+                    end = min(end, self.position + max_backlog)
+                    for message in events[self.position:end]:
+                        self.client.enqueue(message)
+                    self.position = end
+                    if self.position >= len(events):
+                        self._anchor(self.index.end_time)
+                        self.paused = True
+                        self.client.enqueue(self.status())
+                    else:
+                        delay = max(0.0, (times[self.position] - target) / self.speed)
+            try:
+                # 等到下一条事件到期或收到控制命令
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       None if delay is None else min(delay, 0.25))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+def parse_command(text: str) -> Dict[str, Any]:
+    """解析客户端发来的JSON控制命令"""
+    command = json.loads(text)
+    if not isinstance(command, dict):
+        raise ValueError("Replay command must be a JSON object")
+    return command
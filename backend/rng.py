@@ -0,0 +1,147 @@
+"""
+随机数流
+每类随机过程（到达、各工位加工时间、派工）使用独立的随机数流，子流种子由主种子和用途名派生：
+同一主种子下的不同方案共享到达和加工时间序列（公共随机数），多个仿真实例互不影响；
+安装NumPy时可选择分块预抽样以减少热路径上的单次抽样开销
+"""
+
+import hashlib
+import random
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # NumPy为可选依赖
+    np = None
+
+RNG_PYTHON = 'python'
+RNG_NUMPY = 'numpy'
+RNG_BACKENDS = (RNG_PYTHON, RNG_NUMPY)
+
+
+def derive_seed(seed: int, purpose: str) -> int:
+    """由主种子和用途名派生64位子种子"""
+    digest = hashlib.sha256(f"{seed}/{purpose}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def random_seed() -> int:
+    """未指定种子时随机生成主种子（记录下来即可复现该次运行）"""
+    return random.SystemRandom().randrange(2 ** 63)
+
+
+class RandomStream:
+    """单一用途的随机数流（Python random.Random）"""
+
+    def __init__(self, seed: int):
+        self._random = random.Random(seed)
+
+    def exponential(self, mean: float) -> float:
+        return self._random.expovariate(1.0 / mean)
+
+    def normal(self, mean: float, std: float) -> float:
+        return self._random.gauss(mean, std)
+
+    def random(self) -> float:
+        return self._random.random()
+
+    def choice(self, seq: Sequence[Any]) -> Any:
+        return self._random.choice(seq)
+
+    def getstate(self) -> Any:
+        return self._random.getstate()
+
+    def setstate(self, state: Any):
+        self._random.setstate(state)
+
+
+class NumpyRandomStream(RandomStream):
+    """
+    NumPy分块预抽样的随机数流
+    按块抽取标准指数/标准正态/均匀变量并转为Python列表，使用时再按参数缩放，
+    因此参数在运行中改变（如分叉后修改加工时间）不会使已抽取的块失效
+    """
+
+    def __init__(self, seed: int, block_size: int = 4096):
+        if np is None:
+            raise ValueError("NumPy is required for the numpy RNG backend")
+        self.block_size = block_size
+        self._generator = np.random.Generator(np.random.PCG64(seed))
+        # 各分布的预抽样块及读取位置
+        self._blocks: Dict[str, List[float]] = {'exponential': [], 'normal': [], 'uniform': []}
+        self._index: Dict[str, int] = {'exponential': 0, 'normal': 0, 'uniform': 0}
+
+    def _next(self, kind: str) -> float:
+        index = self._index[kind]
+        block = self._blocks[kind]
+        if index >= len(block):
+            if kind == 'exponential':
+                block = self._generator.standard_exponential(self.block_size).tolist()
+            elif kind == 'normal':
+                block = self._generator.standard_normal(self.block_size).tolist()
+            else:
+                block = self._generator.random(self.block_size).tolist()
+            self._blocks[kind] = block
+            index = 0
+        self._index[kind] = index + 1
+        return block[index]
+
+    def exponential(self, mean: float) -> float:
+        return mean * self._next('exponential')
+
+    def normal(self, mean: float, std: float) -> float:
+        return mean + std * self._next('normal')
+
+    def random(self) -> float:
+        return self._next('uniform')
+
+    def choice(self, seq: Sequence[Any]) -> Any:
+        return seq[int(self._next('uniform') * len(seq))]
+
+    def getstate(self) -> Any:
+        return (self._generator.bit_generator.state,
+                {kind: list(block) for kind, block in self._blocks.items()},
+                dict(self._index))
+
+    def setstate(self, state: Any):
+        self._generator.bit_generator.state = state[0]
+        self._blocks = {kind: list(block) for kind, block in state[1].items()}
+        self._index = dict(state[2])
+
+
+class RandomStreams:
+    """一次仿真的全部随机数流：到达、各工位加工时间、派工"""
+
+    def __init__(self, seed: Optional[int], num_stations: int,
+                 backend: str = RNG_PYTHON, block_size: int = 4096):
+        """
+        :param seed: 主种子，None表示随机生成（可从 self.seed 读取以复现）
+        :param backend: python 或 numpy（分块预抽样）
+        """
+        if backend not in RNG_BACKENDS:
+            raise ValueError(f"Unknown RNG backend: {backend}")
+        self.seed = random_seed() if seed is None else seed
+        self.backend = backend
+
+        def stream(purpose: str) -> RandomStream:
+            sub_seed = derive_seed(self.seed, purpose)
+            if backend == RNG_NUMPY:
+                return NumpyRandomStream(sub_seed, block_size)
+            return RandomStream(sub_seed)
+
+        self.arrivals = stream('arrivals')
+        self.routing = stream('routing')
+        self.processing = [stream(f'processing/{i}') for i in range(num_stations)]
+
+    def getstate(self) -> Dict[str, Any]:
+        return {
+            'arrivals': self.arrivals.getstate(),
+            'routing': self.routing.getstate(),
+            'processing': [s.getstate() for s in self.processing],
+        }
+
+    def setstate(self, state: Dict[str, Any]):
+        self.arrivals.setstate(state['arrivals'])
+        self.routing.setstate(state['routing'])
+        for s, s_state in zip(self.processing, state['processing']):
+            s.setstate(s_state)
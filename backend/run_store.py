@@ -0,0 +1,460 @@
+"""
+运行历史存储（SQLite）
+每次会话运行的元数据、参数、最终统计以及可选的事件流持久化到本地数据库；
+写入由后台线程分批提交（仿真和推送线程只入队），查询使用独立的只读连接；
+参数按名称/数值建索引，可按参数取值、时间范围筛选并对比历史运行而无需重新仿真
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from live_state import FINAL_EVENTS
+
+RUN_RUNNING = 'running'
+RUN_COMPLETED = 'completed'
+RUN_STOPPED = 'stopped'
+RUN_ERROR = 'error'
+
+# 运行表中单独成列、可用于排序和对比的统计指标
+RUN_METRICS = ('simulation_time', 'parts_produced', 'throughput', 'avg_cycle_time',
+               'avg_queue_time', 'avg_wip')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    session_id TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    mode TEXT,
+    topology TEXT,
+    seed INTEGER,
+    duration REAL,
+    speed REAL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    simulation_time REAL,
+    parts_produced INTEGER,
+    throughput REAL,
+    avg_cycle_time REAL,
+    avg_queue_time REAL,
+    avg_wip REAL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    params TEXT NOT NULL,
+    statistics TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_finished ON runs (finished_at);
+CREATE INDEX IF NOT EXISTS idx_runs_session ON runs (session_id, started_at);
+
+CREATE TABLE IF NOT EXISTS run_params (
+    run_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value_num REAL,
+    value_text TEXT,
+    PRIMARY KEY (run_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_params_num ON run_params (name, value_num);
+CREATE INDEX IF NOT EXISTS idx_params_text ON run_params (name, value_text);
+
+CREATE TABLE IF NOT EXISTS run_events (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_events_time ON run_events (run_id, timestamp);
+"""
+
+_STOP = object()
+
+
+def _param_row(run_id: str, name: str, value: Any):
+    """参数行：数值存入 value_num，其余存为文本（非字符串按JSON）"""
+    if isinstance(value, bool):
+        return run_id, name, float(value), None
+    if isinstance(value, (int, float)):
+        return run_id, name, float(value), None
+    if value is None or isinstance(value, str):
+        return run_id, name, None, value
+    return run_id, name, None, json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+class RunStore:
+    """运行历史数据库"""
+
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval: float = 0.5):
+        """
+        :param path: 数据库文件路径（":memory:" 不支持，读写使用不同连接）
+        :param batch_size: 每个事务最多写入的事件数
+        :param flush_interval: 写线程最长等待多久提交一次（秒）
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        # 上次进程退出时未结束的运行
+        conn.execute("UPDATE runs SET status = ?, error = ? WHERE status = ?",
+                     (RUN_ERROR, "server exited during run", RUN_RUNNING))
+        conn.commit()
+        conn.close()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self.written_events = 0
+        self.transactions = 0
+        self._thread = threading.Thread(target=self._write_loop, name="run-store-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        # WAL：写线程提交时读连接不被阻塞
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """当前线程的只读查询连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ------------------------------------------------------------------
+    # 写入（入队，不阻塞调用线程）
+    # ------------------------------------------------------------------
+    def start_run(self, params: Dict[str, Any], session_id: Optional[str] = None,
+                  mode: Optional[str] = None, topology: Optional[str] = None,
+                  seed: Optional[int] = None, duration: Optional[float] = None,
+                  speed: Optional[float] = None, run_id: Optional[str] = None) -> str:
+        """登记一次运行，返回运行ID"""
+        run_id = run_id or uuid.uuid4().hex
+        self._queue.put(('start', run_id, {
+            'session_id': session_id, 'mode': mode, 'topology': topology,
+            'seed': seed, 'duration': duration, 'speed': speed,
+            'started_at': time.time(), 'params': params,
+        }))
+        return run_id
+
+    def append_events(self, run_id: str, first_seq: int, events: List[Dict[str, Any]]):
+        """追加一批事件（seq 从 first_seq 起连续编号）"""
+        if events:
+            self._queue.put(('events', run_id, first_seq, events))
+
+    def finish_run(self, run_id: str, statistics: Dict[str, Any], status: str = RUN_COMPLETED,
+                   error: Optional[str] = None, event_count: int = 0):
+        """记录运行结束及最终统计"""
+        self._queue.put(('finish', run_id, {
+            'statistics': statistics, 'status': status, 'error': error,
+            'finished_at': time.time(), 'event_count': event_count,
+        }))
+
+    def delete_run(self, run_id: str):
+        self._queue.put(('delete', run_id))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前入队的写入全部提交"""
+        done = threading.Event()
+        self._queue.put(('sync', done))
+        return done.wait(timeout)
+
+    def close(self):
+        """提交剩余写入并结束写线程"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    # ------------------------------------------------------------------
+    # 写线程
+    # ------------------------------------------------------------------
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = []
+            pending_events = 0
+            deadline = time.monotonic() + self.flush_interval
+            # 合并短时间内到达的写入为一个事务；结束运行和同步请求立即提交
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic())
+                                           if batch else None)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                if item is _STOP or item[0] in ('sync', 'finish'):
+                    break
+                if item[0] == 'events':
+                    pending_events += len(item[3])
+                    if pending_events >= self.batch_size:
+                        break
+
+            stop = any(entry is _STOP for entry in batch)
+            writes = [entry for entry in batch if entry is not _STOP and entry[0] != 'sync']
+            try:
+                self._write_batch(conn, writes)
+            except Exception as e:
+                print(f"Error writing run history: {e}")
+                conn.rollback()
+            for entry in batch:
+                if entry is not _STOP and entry[0] == 'sync':
+                    entry[1].set()
+            if stop:
+                conn.close()
+                return
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        events = []
+        with conn:
+            for entry in batch:
+                kind = entry[0]
+                if kind == 'start':
+                    self._write_start(conn, entry[1], entry[2])
+                elif kind == 'events':
+                    _, run_id, seq, messages = entry
+                    for offset, message in enumerate(messages):
+                        events.append((
+                            run_id, seq + offset, message.get('timestamp', 0.0),
+                            message.get('type', ''),
+                            json.dumps(message.get('data'), ensure_ascii=False,
+                                       separators=(',', ':'))
+                        ))
+                elif kind == 'finish':
+                    # 同一事务内先写入之前的事件，再更新运行状态
+                    self._write_events(conn, events)
+                    events = []
+                    self._write_finish(conn, entry[1], entry[2])
+                elif kind == 'delete':
+                    self._write_events(conn, events)
+                    events = []
+                    for table in ('run_events', 'run_params', 'runs'):
+                        conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (entry[1],))
+            self._write_events(conn, events)
+        self.transactions += 1
+
+    def _write_events(self, conn: sqlite3.Connection, events: List[tuple]):
+        if events:
+            conn.executemany("INSERT OR REPLACE INTO run_events VALUES (?, ?, ?, ?, ?)", events)
+            self.written_events += len(events)
+
+    @staticmethod
+    def _write_start(conn: sqlite3.Connection, run_id: str, info: Dict[str, Any]):
+        params = info['params']
+        conn.execute(
+            "INSERT OR REPLACE INTO runs (run_id, session_id, status, mode, topology, seed,"
+            " duration, speed, started_at, params) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, info['session_id'], RUN_RUNNING, info['mode'], info['topology'],
+             info['seed'], info['duration'], info['speed'], info['started_at'],
+             json.dumps(params, sort_keys=True, ensure_ascii=False)))
+        rows = [_param_row(run_id, name, value) for name, value in params.items()]
+        for name in ('seed', 'duration', 'speed', 'mode', 'topology'):
+            if name not in params and info[name] is not None:
+                rows.append(_param_row(run_id, name, info[name]))
+        conn.executemany("INSERT OR REPLACE INTO run_params VALUES (?, ?, ?, ?)", rows)
+
+    @staticmethod
+    def _write_finish(conn: sqlite3.Connection, run_id: str, info: Dict[str, Any]):
+        stats = info['statistics'] or {}
+        metrics = [stats.get(name) for name in RUN_METRICS]
+        conn.execute(
+            "UPDATE runs SET status = ?, error = ?, finished_at = ?, event_count = ?,"
+            " seed = COALESCE(seed, ?), statistics = ?, "
+            + ", ".join(f"{name} = ?" for name in RUN_METRICS)
+            + " WHERE run_id = ?",
+            [info['status'], info['error'], info['finished_at'], info['event_count'],
+             stats.get('seed'), json.dumps(stats, ensure_ascii=False)] + metrics + [run_id])
+        if stats.get('seed') is not None:
+            conn.execute("INSERT OR IGNORE INTO run_params VALUES (?, 'seed', ?, NULL)",
+                         (run_id, float(stats['seed'])))
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _summary(row: sqlite3.Row, statistics: bool = False) -> Dict[str, Any]:
+        run = {key: row[key] for key in row.keys() if key not in ('params', 'statistics')}
+        run['params'] = json.loads(row['params'])
+        if statistics:
+            run['statistics'] = json.loads(row['statistics']) if row['statistics'] else None
+        return run
+
+    def list_runs(self, params: Optional[Dict[str, Any]] = None,
+                  session_id: Optional[str] = None, status: Optional[str] = None,
+                  since: Optional[float] = None, until: Optional[float] = None,
+                  order_by: str = 'started_at', descending: bool = True,
+                  limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """
+        按条件查询运行（不含完整统计和事件）
+        :param params: 参数筛选，值为精确匹配，或 {"min": x, "max": y} 数值范围
+        :param since/until: 开始时间（Unix时间戳）范围
+        :param order_by: started_at、finished_at 或 RUN_METRICS 中的指标
+        """
+        if order_by not in ('started_at', 'finished_at') + RUN_METRICS:
+            raise ValueError(f"Cannot order by: {order_by}")
+        where, args = [], []
+        for name, condition in (params or {}).items():
+            if isinstance(condition, dict):
+                unknown = set(condition) - {'min', 'max'}
+                if unknown:
+                    raise ValueError(f"Unknown range keys for {name}: {sorted(unknown)}")
+                clause = "SELECT run_id FROM run_params WHERE name = ?"
+                clause_args: List[Any] = [name]
+                if condition.get('min') is not None:
+                    clause += " AND value_num >= ?"
+                    clause_args.append(float(condition['min']))
+                if condition.get('max') is not None:
+                    clause += " AND value_num <= ?"
+                    clause_args.append(float(condition['max']))
+            else:
+                _, _, value_num, value_text = _param_row('', name, condition)
+                if value_num is not None:
+                    clause = "SELECT run_id FROM run_params WHERE name = ? AND value_num = ?"
+                    clause_args = [name, value_num]
+                else:
+                    clause = "SELECT run_id FROM run_params WHERE name = ? AND value_text IS ?"
+                    clause_args = [name, value_text]
+            where.append(f"run_id IN ({clause})")
+            args.extend(clause_args)
+        if session_id is not None:
+            where.append("session_id = ?")
+            args.append(session_id)
+        if status is not None:
+            where.append("status = ?")
+            args.append(status)
+        if since is not None:
+            where.append("started_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("started_at <= ?")
+            args.append(until)
+
+        condition_sql = (" WHERE " + " AND ".join(where)) if where else ""
+        conn = self._reader()
+        total = conn.execute(f"SELECT COUNT(*) FROM runs{condition_sql}", args).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM runs{condition_sql} ORDER BY {order_by} "
+            f"{'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?",
+            args + [limit, offset]).fetchall()
+        return {'total': total, 'runs': [self._summary(row) for row in rows]}
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """单次运行的完整记录（含最终统计）"""
+        row = self._reader().execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return self._summary(row, statistics=True) if row is not None else None
+
+    def get_events(self, run_id: str, start: Optional[float] = None,
+                   end: Optional[float] = None, after_seq: Optional[int] = None,
+                   limit: int = 1000) -> List[Dict[str, Any]]:
+        """按仿真时间范围读取保存的事件（after_seq 用于分页）"""
+        where, args = ["run_id = ?"], [run_id]
+        if start is not None:
+            where.append("timestamp >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("timestamp <= ?")
+            args.append(end)
+        if after_seq is not None:
+            where.append("seq > ?")
+            args.append(after_seq)
+        order = "timestamp, seq" if after_seq is None else "seq"
+        rows = self._reader().execute(
+            f"SELECT seq, timestamp, type, data FROM run_events WHERE {' AND '.join(where)} "
+            f"ORDER BY {order} LIMIT ?", args + [limit]).fetchall()
+        return [
+            {'seq': row['seq'], 'timestamp': row['timestamp'], 'type': row['type'],
+             'data': json.loads(row['data'])}
+            for row in rows
+        ]
+
+    def compare_runs(self, run_ids: Iterable[str]) -> Dict[str, Any]:
+        """并列对比多次运行的参数和指标，差值相对第一个运行"""
+        runs = []
+        for run_id in run_ids:
+            run = self.get_run(run_id)
+            if run is None:
+                raise ValueError(f"Run not found: {run_id}")
+            runs.append(run)
+        if not runs:
+            raise ValueError("At least one run is required")
+
+        names = sorted(set().union(*(run['params'] for run in runs)))
+        baseline = runs[0]
+        compared = []
+        for run in runs:
+            difference = {}
+            for metric in RUN_METRICS:
+                value, reference = run[metric], baseline[metric]
+                if value is not None and reference is not None:
+                    difference[metric] = value - reference
+            compared.append({
+                'run_id': run['run_id'],
+                'status': run['status'],
+                'started_at': run['started_at'],
+                'params': {name: run['params'].get(name) for name in names},
+                'metrics': {metric: run[metric] for metric in RUN_METRICS},
+                'difference': difference,
+            })
+        # 各运行取值不同的参数
+        varying = [name for name in names
+                   if len({json.dumps(c['params'][name], sort_keys=True) for c in compared}) > 1]
+        return {'baseline': baseline['run_id'], 'varying_params': varying, 'runs': compared}
+
+
+class RunRecorder:
+    """
+    单次运行的记录器：包装推送函数，在推送线程中缓存事件并按批入队写入，
+    收到仿真结束消息时写入最终统计
+    """
+
+    def __init__(self, store: RunStore, run_id: str, publish, record_events: bool = False,
+                 batch_size: int = 500,
+                 get_error: Optional[Callable[[], Optional[str]]] = None):
+        """
+        :param publish: 被包装的推送函数
+        :param record_events: 是否保存事件流
+        :param get_error: 返回运行错误信息（用于判定结束状态）
+        """
+        self.store = store
+        self.run_id = run_id
+        self._publish = publish
+        self.record_events = record_events
+        self.batch_size = batch_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._seq = 0
+        self._get_error = get_error
+
+    def _flush(self):
+        if self._buffer:
+            self.store.append_events(self.run_id, self._seq, self._buffer)
+            self._seq += len(self._buffer)
+            self._buffer = []
+
+    def publish(self, message: Dict[str, Any]):
+        event_type = message.get('type')
+        if event_type in FINAL_EVENTS:
+            self._flush()
+            error = self._get_error() if self._get_error is not None else None
+            if error is not None:
+                status = RUN_ERROR
+            elif event_type == 'simulation_stopped':
+                status = RUN_STOPPED
+            else:
+                status = RUN_COMPLETED
+            self.store.finish_run(self.run_id, message.get('data') or {}, status,
+                                  error, self._seq)
+        elif self.record_events:
+            self._buffer.append(message)
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+        self._publish(message)
@@ -3,40 +3,80 @@ FastAPI + WebSocket服务器
 提供仿真控制API和实时数据推送
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 import asyncio
-import json
 import contextlib
-from typing import List, Dict
-import threading
+from typing import List, Dict, Any, Optional
 import os
-from simulation import ProductionLineSimulation
+from pydantic import BaseModel
+from doe import DESIGN_LHS, run_sweep
+from experiments import run_comparison, run_experiment, run_what_if
+from kpi import DEFAULT_KPI_WINDOW
+from metrics import PROMETHEUS_CONTENT_TYPE, render_metrics
+from connections import ClientConnection
+from replay import ReplayCache, ReplayPlayer, parse_command
+from run_store import RunStore
+from sessions import SessionManager, SessionError, DEFAULT_SESSION_ID
+from spatial import ACTION_VIEWPORT
+from topology import SerializedLayout, compile_topology
+from trajectory import RoutePlanner
+from workers import MODE_THREAD
 
+# 获取项目根目录
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
+
+
+def _default_run_history_db() -> str:
+    """运行历史数据库的默认路径：用户数据目录（Windows为LOCALAPPDATA，其余为XDG_DATA_HOME）"""
+    data_home = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_DATA_HOME")
+                 or os.path.join(os.path.expanduser("~"), ".local", "share"))
+    return os.path.join(data_home, "simpy-openlayers", "runs.db")
+
+
+# 运行历史数据库（SQLite），可通过环境变量 RUN_HISTORY_DB 指定路径；
+# 存储在应用启动时（lifespan）才打开，导入本模块不创建文件和写线程
+RUN_HISTORY_DB = os.environ.get("RUN_HISTORY_DB") or _default_run_history_db()
+run_store: Optional[RunStore] = None
+
+# 仿真会话管理（每个会话独立的仿真线程和推送通道）
+sessions = SessionManager()
+
+# 回放索引缓存（按运行ID）
+replays = ReplayCache(None)
 
-# Dedicated event loop for callbacks running in a background thread
-callback_loop: asyncio.AbstractEventLoop = None
+# 空闲会话回收间隔（秒）
+SESSION_REAP_INTERVAL = 30
+
+# 布局响应的缓存策略：短期缓存，过期后凭ETag重新验证
+LAYOUT_CACHE_CONTROL = "public, max-age=60"
+
+
+async def _reap_sessions():
+    """定期回收空闲会话"""
+    while True:
+        await asyncio.sleep(SESSION_REAP_INTERVAL)
+        sessions.reap()
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Manages the startup and shutdown of the background event loop."""
-    global callback_loop
-    callback_loop = asyncio.new_event_loop()
-    thread = threading.Thread(target=callback_loop.run_forever, daemon=True)
-    thread.start()
+    """启动/关闭运行历史存储和后台会话回收任务"""
+    global run_store
+    run_store = RunStore(RUN_HISTORY_DB)
+    sessions.store = replays.store = run_store
+    reaper = asyncio.create_task(_reap_sessions())
     yield
-    callback_loop.call_soon_threadsafe(callback_loop.stop)
+    reaper.cancel()
+    sessions.store = replays.store = None
+    run_store.close()
+    run_store = None
 
 
 app = FastAPI(title="SimPy-OpenLayers Production Simulation", lifespan=lifespan)
 
-# 获取项目根目录
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
-
 # CORS配置
 app.add_middleware(
     CORSMiddleware,
@@ -46,31 +86,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# WebSocket连接管理
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting: {e}")
-
-manager = ConnectionManager()
-
-# 全局仿真实例
-current_simulation = None
-simulation_running = False
-
 
 @app.get("/")
 async def read_root():
@@ -84,485 +99,517 @@ async def get_app_js():
     return FileResponse(os.path.join(FRONTEND_DIR, "app.js"))
 
 
-@app.get("/api/workshop-layout")
-async def get_workshop_layout():
-    """获取车间布局数据（GeoJSON格式）- 9个工位，包含并列工序和公用缓存区"""
-    layout = {
-        "type": "FeatureCollection",
-        "features": [
-            # 车间边界
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "boundary",
-                    "name": "车间边界"
-                },
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[
-                        [0, 0],
-                        [120, 0],
-                        [120, 40],
-                        [0, 40],
-                        [0, 0]
-                    ]]
-                }
-            },
-            # === 工位定义 ===
-            # 工位1 - 预处理
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 0,
-                    "name": "工位1-预处理",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [10, 20]
-                }
-            },
-            # 工位2 - 粗加工A（并列）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 1,
-                    "name": "工位2-粗加工A",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [30, 30]
-                }
-            },
-            # 工位3 - 粗加工B（并列）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 2,
-                    "name": "工位3-粗加工B",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [30, 10]
-                }
-            },
-            # 工位4 - 精加工A（并列）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 3,
-                    "name": "工位4-精加工A",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [50, 30]
-                }
-            },
-            # 工位5 - 精加工B（并列）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 4,
-                    "name": "工位5-精加工B",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [50, 10]
-                }
-            },
-            # 工位6 - 组装
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 5,
-                    "name": "工位6-组装",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [70, 20]
-                }
-            },
-            # 工位7 - 质检A（并列）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 6,
-                    "name": "工位7-质检A",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [90, 30]
-                }
-            },
-            # 工位8 - 质检B（并列）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 7,
-                    "name": "工位8-质检B",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [90, 10]
-                }
-            },
-            # 工位9 - 包装
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "workstation",
-                    "id": 8,
-                    "name": "工位9-包装",
-                    "status": "idle"
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [105, 20]
-                }
-            },
-            # === 缓冲区定义 ===
-            # 公用缓存区1（工位1后，工位2和3共享）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "buffer",
-                    "id": 0,
-                    "name": "公用缓存区1",
-                    "capacity": 5,
-                    "level": 0
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [20, 20]
-                }
-            },
-            # 公用缓存区2（工位2和3后，工位4和5共享）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "buffer",
-                    "id": 1,
-                    "name": "公用缓存区2",
-                    "capacity": 5,
-                    "level": 0
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [40, 20]
-                }
-            },
-            # 公用缓存区3（工位4和5后，工位6前）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "buffer",
-                    "id": 2,
-                    "name": "公用缓存区3",
-                    "capacity": 5,
-                    "level": 0
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [60, 20]
-                }
-            },
-            # 缓存区4（工位6后，工位7和8共享）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "buffer",
-                    "id": 3,
-                    "name": "缓存区4",
-                    "capacity": 5,
-                    "level": 0
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [80, 20]
-                }
-            },
-            # 缓存区5（工位7和8后，工位9前）
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "buffer",
-                    "id": 4,
-                    "name": "缓存区5",
-                    "capacity": 5,
-                    "level": 0
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [97.5, 20]
-                }
-            },
-            # === 区域定义 ===
-            # 物料输入区
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "input_zone",
-                    "name": "原料区"
-                },
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[
-                        [0, 15],
-                        [5, 15],
-                        [5, 25],
-                        [0, 25],
-                        [0, 15]
-                    ]]
-                }
-            },
-            # 成品输出区
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "output_zone",
-                    "name": "成品区"
-                },
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[
-                        [110, 15],
-                        [120, 15],
-                        [120, 25],
-                        [110, 25],
-                        [110, 15]
-                    ]]
-                }
-            },
-            # === 产线路径（显示工艺流程）===
-            # 主路径
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "主生产线路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [5, 20],    # 原料区出口
-                        [10, 20],   # 工位1
-                        [20, 20],   # 公用缓存区1
-                        [40, 20],   # 公用缓存区2
-                        [60, 20],   # 公用缓存区3
-                        [70, 20],   # 工位6
-                        [80, 20],   # 缓存区4
-                        [97.5, 20], # 缓存区5
-                        [105, 20],  # 工位9
-                        [115, 20]   # 成品区
-                    ]
-                }
-            },
-            # 并列路径 - 粗加工A
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "粗加工A路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [20, 20],   # 公用缓存区1
-                        [30, 30],   # 工位2
-                        [40, 20]    # 公用缓存区2
-                    ]
-                }
-            },
-            # 并列路径 - 粗加工B
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "粗加工B路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [20, 20],   # 公用缓存区1
-                        [30, 10],   # 工位3
-                        [40, 20]    # 公用缓存区2
-                    ]
-                }
-            },
-            # 并列路径 - 精加工A
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "精加工A路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [40, 20],   # 公用缓存区2
-                        [50, 30],   # 工位4
-                        [60, 20]    # 公用缓存区3
-                    ]
-                }
-            },
-            # 并列路径 - 精加工B
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "精加工B路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [40, 20],   # 公用缓存区2
-                        [50, 10],   # 工位5
-                        [60, 20]    # 公用缓存区3
-                    ]
-                }
-            },
-            # 并列路径 - 质检A
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "质检A路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [80, 20],   # 缓存区4
-                        [90, 30],   # 工位7
-                        [97.5, 20]  # 缓存区5
-                    ]
-                }
-            },
-            # 并列路径 - 质检B
-            {
-                "type": "Feature",
-                "properties": {
-                    "type": "path",
-                    "name": "质检B路径"
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": [
-                        [80, 20],   # 缓存区4
-                        [90, 10],   # 工位8
-                        [97.5, 20]  # 缓存区5
-                    ]
-                }
-            }
-        ]
+def _layout_response(request: Request, layout: SerializedLayout) -> Response:
+    """返回预序列化的布局，支持 If-None-Match 和 gzip"""
+    headers = {
+        "ETag": layout.etag,
+        "Cache-Control": LAYOUT_CACHE_CONTROL,
+        "Vary": "Accept-Encoding"
     }
-    return layout
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or layout.etag in (
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    body = layout.body
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = layout.gzipped
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/api/workshop-layout")
+async def get_workshop_layout(request: Request):
+    """获取车间布局数据（GeoJSON格式），由默认拓扑配置生成，拓扑变化前只序列化一次"""
+    return _layout_response(request, compile_topology().serialized_layout())
+
+
+@app.get("/api/workshop-routes")
+async def get_workshop_routes():
+    """获取默认拓扑的物料移动路线表（moves=1 推送的移动段按路线编号引用）"""
+    return RoutePlanner(compile_topology()).describe()
 
 
 @app.get("/api/simulation/status")
 async def get_simulation_status():
     """获取仿真状态"""
-    global current_simulation, simulation_running
+    session = sessions.get(DEFAULT_SESSION_ID)
 
-    if current_simulation is None:
+    if session is None:
         return {
             "running": False,
             "statistics": None
         }
 
     return {
-        "running": simulation_running,
-        "statistics": current_simulation.get_statistics()
+        "running": session.running,
+        "statistics": session.get_statistics()
     }
 
 
 @app.post("/api/simulation/start")
-async def start_simulation(duration: float = 100):
-    """启动仿真"""
-    global current_simulation, simulation_running
+async def start_simulation(duration: float = 100, speed: Optional[float] = None,
+                           mode: str = MODE_THREAD,
+                           profile: bool = False, kpi_window: float = DEFAULT_KPI_WINDOW,
+                           store_events: bool = False):
+    """
+    启动仿真
+    :param duration: 仿真时长（秒）
+    :param speed: 回放速度倍数（1为实时，10为10倍速）；不指定或为0时尽可能快（与原接口行为一致）
+    :param mode: 执行模式，thread 或 process（子进程，不占用API进程的GIL）
+    :param profile: 是否开启采样分析（结果见 /api/sessions/default/profile）
+    :param kpi_window: KPI聚合窗口（仿真秒），/ws?stream=kpi 的客户端只接收窗口KPI
+    :param store_events: 是否在运行历史中保存事件流
+    """
+    try:
+        session = sessions.create(duration=duration, speed=speed, session_id=DEFAULT_SESSION_ID,
+                                  mode=mode, profile=profile, kpi_window=kpi_window,
+                                  store_events=store_events)
+    except (SessionError, ValueError) as e:
+        return {"error": str(e)}
 
-    if simulation_running:
-        return {"error": "Simulation already running"}
+    return {"status": "Simulation started", "duration": duration, "speed": speed, "mode": mode,
+            "run_id": session.run_id}
 
-    simulation_running = True
 
-    # 创建事件回调函数
-    async def event_callback(event):
-        await manager.broadcast(event)
-        # 控制事件推送速度（放慢以便观察）
-        await asyncio.sleep(0.1)
+@app.post("/api/simulation/stop")
+async def stop_simulation():
+    """停止仿真"""
+    session = sessions.get(DEFAULT_SESSION_ID)
 
-    # 在新线程中运行仿真
-    def run_simulation():
-        global simulation_running, current_simulation
+    if session is None or not session.running:
+        return {"status": "Simulation is not running"}
 
-        def sync_callback(event):
-            """Thread-safe callback to run the async event_callback in the dedicated loop."""
-            asyncio.run_coroutine_threadsafe(event_callback(event), callback_loop)
+    session.stop()
+    return {"status": "Stop requested"}
 
-        current_simulation = ProductionLineSimulation(callback=sync_callback)
-        try:
-            stats = current_simulation.run(until=duration)
-        finally:
-            simulation_running = False
-            message_type = "simulation_completed"
-            if current_simulation.stopped_early:
-                message_type = "simulation_stopped"
 
-            # Schedule the final broadcast in the callback loop
-            asyncio.run_coroutine_threadsafe(
-                manager.broadcast({
-                    "type": message_type,
-                    "data": stats
-                }),
-                callback_loop
-            )
+class SessionRequest(BaseModel):
+    """创建仿真会话请求"""
+    duration: float = 100
+    speed: float = 1.0
+    params: Dict[str, Any] = {}
+    seed: Optional[int] = None
+    mode: str = MODE_THREAD
+    profile: bool = False
+    kpi_window: float = DEFAULT_KPI_WINDOW
+    store_events: bool = False
 
-    thread = threading.Thread(target=run_simulation, daemon=True)
-    thread.start()
 
-    return {"status": "Simulation started", "duration": duration}
+@app.post("/api/sessions")
+async def create_session(request: SessionRequest):
+    """创建并启动仿真会话，事件通过 /ws/{session_id} 推送"""
+    try:
+        session = sessions.create(
+            duration=request.duration,
+            speed=request.speed,
+            params=request.params,
+            seed=request.seed,
+            mode=request.mode,
+            profile=request.profile,
+            kpi_window=request.kpi_window,
+            store_events=request.store_events
+        )
+    except (SessionError, ValueError) as e:
+        return {"error": str(e)}
+    return session.describe()
+
+
+@app.get("/api/sessions")
+async def list_sessions():
+    """列出所有会话"""
+    return {"sessions": [session.describe() for session in sessions.list()]}
+
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    """获取会话状态及统计数据"""
+    session = sessions.get(session_id)
+    if session is None:
+        return {"error": "Session not found"}
+    return session.describe(statistics=True)
+
+
+@app.get("/api/sessions/{session_id}/layout")
+async def get_session_layout(session_id: str, request: Request):
+    """获取会话产线的车间布局（GeoJSON格式）"""
+    session = sessions.get(session_id)
+    if session is None:
+        return {"error": "Session not found"}
+    return _layout_response(request, session.layout())
+
+
+@app.get("/api/sessions/{session_id}/routes")
+async def get_session_routes(session_id: str):
+    """获取会话产线的物料移动路线表"""
+    channel = sessions.channel(session_id)
+    if channel is None or channel.trajectories is None:
+        return {"error": "Session not found"}
+    return channel.trajectories.planner.describe()
+
+
+@app.get("/api/sessions/{session_id}/state")
+async def get_session_state(session_id: str):
+    """获取会话当前的产线状态快照（与WebSocket连接时收到的快照相同）"""
+    channel = sessions.channel(session_id)
+    if channel is None:
+        return {"error": "Session not found"}
+    return channel.snapshot()
+
+
+@app.get("/api/sessions/{session_id}/kpi")
+async def get_session_kpi(session_id: str, limit: Optional[int] = None):
+    """获取会话最近的KPI窗口（与 stream=kpi 推送的消息相同）"""
+    channel = sessions.channel(session_id)
+    if channel is None:
+        return {"error": "Session not found"}
+    return {"window": channel.kpi.window, "windows": channel.recent_kpi(limit)}
+
+
+@app.get("/api/sessions/{session_id}/profile")
+async def get_session_profile(session_id: str):
+    """获取会话的采样分析结果（创建时需指定 profile=true）"""
+    session = sessions.get(session_id)
+    if session is None:
+        return {"error": "Session not found"}
+    profile = session.profile()
+    if profile is None:
+        return {"error": "Profiling is not enabled for this session"}
+    return profile
+
+
+@app.post("/api/sessions/{session_id}/stop")
+async def stop_session(session_id: str):
+    """停止会话中的仿真"""
+    session = sessions.get(session_id)
+    if session is None:
+        return {"error": "Session not found"}
+    if not session.running:
+        return {"status": "Simulation is not running"}
+    session.stop()
+    return {"status": "Stop requested"}
 
 
-@app.post("/api/simulation/stop")
-async def stop_simulation():
-    """停止仿真"""
-    global simulation_running, current_simulation
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """停止并删除会话"""
+    session = sessions.remove(session_id)
+    if session is None:
+        return {"error": "Session not found"}
+    return {"status": "Session removed", "session_id": session_id}
 
-    if not simulation_running or current_simulation is None:
-        return {"status": "Simulation is not running"}
 
-    current_simulation.request_stop()
-    return {"status": "Stop requested"}
+@app.get("/api/connections")
+async def get_connections():
+    """WebSocket连接及发送队列统计（按会话）"""
+    return {
+        session_id: channel.stats()
+        for session_id, channel in list(sessions.channels.items())
+    }
 
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket连接端点"""
-    await manager.connect(websocket)
+@app.get("/api/runs")
+async def list_runs(session_id: Optional[str] = None, status: Optional[str] = None,
+                    since: Optional[float] = None, until: Optional[float] = None,
+                    order_by: str = "started_at", descending: bool = True,
+                    limit: int = 50, offset: int = 0):
+    """
+    查询运行历史（按开始时间倒序）
+    :param since/until: 开始时间范围（Unix时间戳）
+    """
+    try:
+        return await asyncio.to_thread(
+            run_store.list_runs, session_id=session_id, status=status, since=since,
+            until=until, order_by=order_by, descending=descending, limit=limit, offset=offset)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+class RunQuery(BaseModel):
+    """运行历史查询：参数值精确匹配或 {"min": x, "max": y} 范围"""
+    params: Dict[str, Any] = {}
+    session_id: Optional[str] = None
+    status: Optional[str] = None
+    since: Optional[float] = None
+    until: Optional[float] = None
+    order_by: str = "started_at"
+    descending: bool = True
+    limit: int = 50
+    offset: int = 0
+
+
+@app.post("/api/runs/query")
+async def query_runs(query: RunQuery):
+    """按参数取值和时间范围筛选运行历史"""
+    try:
+        return await asyncio.to_thread(run_store.list_runs, **query.model_dump())
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/runs/compare")
+async def compare_runs(ids: str):
+    """对比多次运行的参数和指标（ids 以逗号分隔，差值相对第一个）"""
+    try:
+        return await asyncio.to_thread(
+            run_store.compare_runs, [run_id for run_id in ids.split(",") if run_id])
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: str):
+    """单次运行的参数和最终统计"""
+    run = await asyncio.to_thread(run_store.get_run, run_id)
+    if run is None:
+        return {"error": "Run not found"}
+    return run
+
+
+@app.get("/api/runs/{run_id}/events")
+async def get_run_events(run_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                         after_seq: Optional[int] = None, limit: int = 1000):
+    """读取运行保存的事件流（需以 store_events=true 运行）"""
+    events = await asyncio.to_thread(run_store.get_events, run_id, start=start, end=end,
+                                     after_seq=after_seq, limit=min(limit, 10000))
+    return {"run_id": run_id, "events": events}
+
+
+@app.get("/api/runs/{run_id}/state")
+async def get_run_state(run_id: str, time: float):
+    """运行在指定仿真时刻的产线状态快照（需保存了事件流）"""
+    index = await asyncio.to_thread(replays.get, run_id)
+    if index is None:
+        return {"error": "Run not found or has no recorded events"}
+    return index.state_at(time).snapshot()
+
+
+@app.delete("/api/runs/{run_id}")
+async def delete_run(run_id: str):
+    """删除一次运行的记录"""
+    if await asyncio.to_thread(run_store.get_run, run_id) is None:
+        return {"error": "Run not found"}
+    run_store.delete_run(run_id)
+    # 删除提交后再丢弃回放索引，避免并发的回放请求重新加载已删除的运行
+    await asyncio.to_thread(run_store.flush)
+    replays.invalidate(run_id)
+    return {"status": "Run removed", "run_id": run_id}
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """运行指标（Prometheus文本格式）"""
+    return Response(content=render_metrics(sessions), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+class ExperimentRequest(BaseModel):
+    """批量实验请求"""
+    params: Dict[str, Any] = {}
+    replications: int = 10
+    duration: float = 100
+    seeds: Optional[List[int]] = None
+    base_seed: int = 0
+    confidence: float = 0.95
+    max_workers: Optional[int] = None
+    target_half_width: Optional[float] = None
+
+
+@app.post("/api/experiments")
+async def create_experiment(request: ExperimentRequest):
+    """批量运行重复仿真（进程池，不阻塞实时仿真）"""
+    try:
+        return await asyncio.to_thread(
+            run_experiment,
+            params=request.params,
+            replications=request.replications,
+            duration=request.duration,
+            seeds=request.seeds,
+            base_seed=request.base_seed,
+            confidence=request.confidence,
+            max_workers=request.max_workers,
+            target_half_width=request.target_half_width
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+class WhatIfRequest(BaseModel):
+    """假设分析请求：预热一次后分叉为多个方案"""
+    variants: List[Dict[str, Any]]
+    params: Dict[str, Any] = {}
+    warmup: float = 1000
+    duration: float = 1000
+    seed: int = 0
+    max_workers: Optional[int] = None
+
+
+@app.post("/api/experiments/what-if")
+async def create_what_if(request: WhatIfRequest):
+    """从同一预热检查点分叉运行多个方案（进程池）"""
+    try:
+        return await asyncio.to_thread(
+            run_what_if,
+            variants=request.variants,
+            params=request.params,
+            warmup=request.warmup,
+            duration=request.duration,
+            seed=request.seed,
+            max_workers=request.max_workers
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+class ComparisonRequest(BaseModel):
+    """公共随机数方案对比请求"""
+    scenarios: List[Dict[str, Any]]
+    replications: int = 10
+    duration: float = 100
+    base_seed: int = 0
+    confidence: float = 0.95
+    max_workers: Optional[int] = None
+
+
+@app.post("/api/experiments/compare")
+async def create_comparison(request: ComparisonRequest):
+    """各方案使用相同种子运行，给出相对第一个方案的配对差值（进程池）"""
+    try:
+        return await asyncio.to_thread(
+            run_comparison,
+            scenarios=request.scenarios,
+            replications=request.replications,
+            duration=request.duration,
+            base_seed=request.base_seed,
+            confidence=request.confidence,
+            max_workers=request.max_workers
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+class SweepRequest(BaseModel):
+    """参数扫描/寻优请求"""
+    space: Dict[str, Dict[str, Any]]
+    params: Dict[str, Any] = {}
+    design: str = DESIGN_LHS
+    samples: int = 20
+    duration: float = 2000
+    replications: int = 3
+    base_seed: int = 0
+    wip_cost: float = 1.0
+    buffer_cost: float = 0.0
+    min_duration: Optional[float] = None
+    eta: int = 3
+    max_workers: Optional[int] = None
+
+
+@app.post("/api/experiments/sweep")
+async def create_sweep(request: SweepRequest):
+    """网格/拉丁超立方/逐次减半参数寻优，返回产能与成本的帕累托前沿（进程池）"""
+    try:
+        return await asyncio.to_thread(
+            run_sweep,
+            space=request.space,
+            params=request.params,
+            design=request.design,
+            samples=request.samples,
+            duration=request.duration,
+            replications=request.replications,
+            base_seed=request.base_seed,
+            wip_cost=request.wip_cost,
+            buffer_cost=request.buffer_cost,
+            min_duration=request.min_duration,
+            eta=request.eta,
+            max_workers=request.max_workers
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+async def _serve_websocket(websocket: WebSocket, session_id: str):
+    """在指定会话的推送通道上服务一个WebSocket连接"""
+    channel = sessions.channel(session_id)
+    if not sessions.accepts_client(session_id):
+        await websocket.close(code=4404 if channel is None else 4429)
+        return
+
+    client = await channel.connect(websocket)
+    writer_task = asyncio.create_task(channel.serve(client))
     try:
         while True:
-            # 保持连接
             data = await websocket.receive_text()
-            # 可以处理客户端发来的消息
-            print(f"Received: {data}")
+            try:
+                command = parse_command(data)
+            except ValueError:
+                print(f"Received: {data}")
+                continue
+            # 客户端视口：{"action": "viewport", "bbox": [minx, miny, maxx, maxy]}，bbox为null时清除
+            if command.get("action") == ACTION_VIEWPORT:
+                try:
+                    channel.set_viewport(client, command.get("bbox"))
+                except (ValueError, TypeError) as e:
+                    client.enqueue({"type": "error", "data": {"message": str(e)}})
+            else:
+                print(f"Received: {data}")
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
         print("WebSocket disconnected")
+    finally:
+        channel.disconnect(client)
+        writer_task.cancel()
+
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """WebSocket连接端点（默认会话）"""
+    await _serve_websocket(websocket, DEFAULT_SESSION_ID)
+
+
+@app.websocket("/ws/{session_id}")
+async def session_websocket_endpoint(websocket: WebSocket, session_id: str):
+    """WebSocket连接端点（指定会话）"""
+    await _serve_websocket(websocket, session_id)
+
+
+@app.websocket("/ws/replay/{run_id}")
+async def replay_websocket_endpoint(websocket: WebSocket, run_id: str, speed: float = 1.0,
+                                    start: Optional[float] = None, paused: bool = False):
+    """
+    回放已保存事件流的运行：连接后先收到起始时刻的状态快照，随后按速度推送事件；
+    客户端发送 {"action": "seek"|"speed"|"pause"|"play", ...} 控制回放
+    """
+    index = await asyncio.to_thread(replays.get, run_id)
+    if index is None:
+        await websocket.close(code=4404)
+        return
+    # 连接参数在接受连接之前解析，参数不合法时以4400关闭
+    try:
+        client = ClientConnection.from_query(websocket)
+    except (ValueError, TypeError):
+        client = None
+    if client is None or speed <= 0:
+        await websocket.close(code=4400)
+        return
+
+    await websocket.accept()
+    client.bind(asyncio.get_running_loop())
+    if "protocol" in websocket.query_params:
+        await websocket.send_json(client.describe())
+    player = ReplayPlayer(index, client, speed=speed, start=start, paused=paused)
+    writer_task = asyncio.create_task(client.run_writer())
+    playback_task = asyncio.create_task(player.run())
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                player.handle(parse_command(text))
+            except (ValueError, KeyError, TypeError) as e:
+                client.enqueue({"type": "error", "data": {"message": str(e)}})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        client.closed = True
+        playback_task.cancel()
+        writer_task.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,270 @@
+"""
+仿真会话管理
+每个会话拥有独立的仿真执行器（线程或子进程）、事件推送通道（/ws/{session_id}），
+会话数量、时长和连接数受资源上限约束，空闲会话超时后自动回收；
+配置了运行历史存储时，每次运行的参数、最终统计（及可选的事件流）写入数据库
+"""
+
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, List
+
+from connections import ConnectionManager
+from experiments import default_params, validate_params
+from kpi import DEFAULT_KPI_WINDOW
+from pacing import realtime_factor
+from run_store import RunRecorder, RunStore
+from topology import SerializedLayout, compile_topology
+from workers import create_worker, MODE_THREAD, MODES
+
+# 兼容旧接口（/api/simulation/*、/ws）的默认会话
+DEFAULT_SESSION_ID = 'default'
+
+
+class SessionError(Exception):
+    """会话操作失败（数量超限、会话不存在等）"""
+
+
+class SimulationSession:
+    """单个仿真会话"""
+
+    def __init__(self, session_id: str, channel: ConnectionManager,
+                 duration: float = 100, speed: Optional[float] = 1.0,
+                 params: Optional[Dict[str, Any]] = None,
+                 seed: Optional[int] = None,
+                 event_queue_size: int = 1000,
+                 mode: str = MODE_THREAD,
+                 profile: bool = False,
+                 store: Optional[RunStore] = None,
+                 store_events: bool = False):
+        """
+        :param speed: 回放速度倍数，None或<=0表示尽可能快（见 pacing.realtime_factor）
+        :param store: 运行历史存储，None表示不记录
+        :param store_events: 是否同时保存本次运行的事件流
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown execution mode: {mode}")
+        self.id = session_id
+        self.channel = channel
+        self.duration = duration
+        self.speed = speed
+        self.params = validate_params(params or {})
+        self.topology = compile_topology(self.params.get('topology'))
+        self.seed = seed
+        self.mode = mode
+        self.created_at = time.time()
+        self.last_active = self.created_at
+
+        publish = channel.publish
+        self.store = store
+        self.run_id: Optional[str] = None
+        if store is not None:
+            self.run_id = uuid.uuid4().hex
+            recorder = RunRecorder(store, self.run_id, publish, record_events=store_events,
+                                   get_error=lambda: self.worker.error)
+            publish = recorder.publish
+
+        self.worker = create_worker(
+            mode,
+            publish,
+            dict(self.params, seed=seed, realtime_factor=realtime_factor(speed),
+                 topology=self.topology),
+            duration,
+            name=session_id,
+            event_queue_size=event_queue_size,
+            profile=profile
+        )
+
+    @property
+    def running(self) -> bool:
+        return self.worker.running
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.worker.error
+
+    @property
+    def finished_at(self) -> Optional[float]:
+        return self.worker.finished_at
+
+    def layout(self) -> SerializedLayout:
+        """本会话产线的车间布局（预序列化的GeoJSON）"""
+        capacity = self.params.get('buffer_capacity')
+        capacities = None if capacity is None else [capacity] * self.topology.num_buffers
+        return self.topology.serialized_layout(capacities)
+
+    def profile(self) -> Optional[Dict[str, Any]]:
+        """采样分析结果（未开启分析时为None）"""
+        return self.worker.profile_summary()
+
+    def run_params(self) -> Dict[str, Any]:
+        """本次运行的有效参数（含默认值），拓扑记为名称"""
+        params = dict(default_params(), **self.params)
+        params['topology'] = self.topology.name
+        if params['buffer_capacity'] is None and len(set(self.topology.buffer_capacities)) == 1:
+            params['buffer_capacity'] = self.topology.buffer_capacities[0]
+        return params
+
+    def start(self) -> "SimulationSession":
+        if self.store is not None:
+            self.store.start_run(self.run_params(), session_id=self.id, mode=self.mode,
+                                 topology=self.topology.name, seed=self.seed,
+                                 duration=self.duration, speed=self.speed, run_id=self.run_id)
+        self.worker.start()
+        return self
+
+    def get_statistics(self):
+        """当前统计数据（进程模式下为最近一次快照）"""
+        return self.worker.get_statistics()
+
+    def stop(self):
+        """请求停止仿真"""
+        self.touch()
+        self.worker.request_stop()
+
+    def touch(self):
+        """记录一次访问"""
+        self.last_active = time.time()
+
+    def idle_seconds(self, now: Optional[float] = None) -> float:
+        """距最后一次访问（或仿真结束）的时长；运行中或有客户端连接时不算空闲"""
+        if self.running or self.channel.active_connections:
+            return 0.0
+        last_active = max(self.last_active, self.finished_at or 0)
+        return (now or time.time()) - last_active
+
+    def describe(self, statistics: bool = False) -> Dict[str, Any]:
+        info = {
+            "session_id": self.id,
+            "run_id": self.run_id,
+            "running": self.running,
+            "duration": self.duration,
+            "speed": self.speed,
+            "params": self.params,
+            "seed": self.seed,
+            "mode": self.mode,
+            "profile": self.worker.profile,
+            "simulation_time": self.worker.sim_time,
+            "clients": len(self.channel.active_connections),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+        if statistics:
+            info["statistics"] = self.get_statistics()
+        return info
+
+
+class SessionManager:
+    """会话注册表与资源限制"""
+
+    def __init__(self, max_sessions: int = 20, max_running: Optional[int] = None,
+                 max_duration: float = 86400 * 7, max_clients: int = 500,
+                 idle_timeout: float = 600, event_queue_size: int = 1000,
+                 store: Optional[RunStore] = None):
+        """
+        :param max_sessions: 同时存在的会话上限（含已结束未回收的）
+        :param max_running: 同时运行的会话上限，默认等于 max_sessions
+        :param max_duration: 单个会话允许的最长仿真时长
+        :param max_clients: 单个会话的WebSocket连接上限
+        :param idle_timeout: 已结束且无连接的会话在空闲多少秒后回收
+        :param event_queue_size: 每个会话事件队列的容量
+        :param store: 运行历史存储，None表示不记录
+        """
+        self.max_sessions = max_sessions
+        self.max_running = max_running or max_sessions
+        self.max_duration = max_duration
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.event_queue_size = event_queue_size
+        self.store = store
+
+        self.sessions: Dict[str, SimulationSession] = {}
+        # 推送通道独立于会话生命周期，默认会话重启时已连接的客户端保持不变
+        self.channels: Dict[str, ConnectionManager] = {DEFAULT_SESSION_ID: ConnectionManager()}
+        self._lock = threading.Lock()
+
+    def channel(self, session_id: str) -> Optional[ConnectionManager]:
+        return self.channels.get(session_id)
+
+    def get(self, session_id: str) -> Optional[SimulationSession]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def list(self) -> List[SimulationSession]:
+        return list(self.sessions.values())
+
+    def create(self, duration: float = 100, speed: Optional[float] = 1.0,
+               params: Optional[Dict[str, Any]] = None, seed: Optional[int] = None,
+               session_id: Optional[str] = None,
+               mode: str = MODE_THREAD, profile: bool = False,
+               kpi_window: float = DEFAULT_KPI_WINDOW,
+               store_events: bool = False) -> SimulationSession:
+        """
+        创建并启动会话
+        :param kpi_window: 推送通道KPI聚合窗口长度（仿真秒）
+        :param store_events: 是否在运行历史中保存事件流
+        """
+        if duration <= 0 or duration > self.max_duration:
+            raise SessionError(f"Duration must be in (0, {self.max_duration}]")
+        if kpi_window <= 0:
+            raise ValueError("KPI window must be positive")
+
+        self.reap()
+        with self._lock:
+            session_id = session_id or uuid.uuid4().hex[:12]
+            existing = self.sessions.get(session_id)
+            if existing is not None:
+                if existing.running:
+                    raise SessionError("Simulation already running")
+                del self.sessions[session_id]
+
+            if len(self.sessions) >= self.max_sessions:
+                raise SessionError(f"Session limit reached ({self.max_sessions})")
+            if sum(s.running for s in self.sessions.values()) >= self.max_running:
+                raise SessionError(f"Running session limit reached ({self.max_running})")
+
+            channel = self.channels.get(session_id)
+            if channel is None:
+                channel = self.channels[session_id] = ConnectionManager()
+            session = SimulationSession(session_id, channel, duration, speed, params, seed,
+                                        event_queue_size=self.event_queue_size,
+                                        mode=mode, profile=profile,
+                                        store=self.store, store_events=store_events)
+            channel.reset_state(session.topology.num_stations, session.topology.num_buffers,
+                                kpi_window, session.topology)
+            self.sessions[session_id] = session
+
+        return session.start()
+
+    def remove(self, session_id: str) -> Optional[SimulationSession]:
+        """停止并删除会话（默认会话的推送通道保留，其余会话的连接以4404关闭）"""
+        channel = None
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            if session_id != DEFAULT_SESSION_ID:
+                channel = self.channels.pop(session_id, None)
+        if session is not None and session.running:
+            session.stop()
+        if channel is not None:
+            channel.close_all(4404, "session removed")
+        return session
+
+    def reap(self, now: Optional[float] = None) -> List[str]:
+        """回收空闲超时的会话"""
+        now = now or time.time()
+        expired = [
+            session_id for session_id, session in list(self.sessions.items())
+            if session.idle_seconds(now) > self.idle_timeout
+        ]
+        for session_id in expired:
+            self.remove(session_id)
+        return expired
+
+    def accepts_client(self, session_id: str) -> bool:
+        """会话通道是否存在且未达到连接上限"""
+        channel = self.channels.get(session_id)
+        return channel is not None and len(channel.active_connections) < self.max_clients
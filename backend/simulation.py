@@ -1,27 +1,89 @@
 """
 生产线仿真模型 - 基于SimPy
-模拟一个3工位串行生产线，包含缓冲区、设备、物料流转
+模拟由拓扑配置描述的生产线（默认为9工位、含并列工序和公用缓存区），包含缓冲区、设备、物料流转
 """
 
 import simpy
 import simpy.core
-import random
+import simpy.rt
+import copy
 import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from accumulators import StreamingStats, TimeWeightedValue, StateTimer
+from dispatch import DISPATCH_RANDOM, create_dispatcher
+from event_store import EventStore
+from rng import RNG_PYTHON, RandomStreams
+from steady_state import SteadyStateMonitor
+from topology import Topology, compile_topology
+
+# 在途物料所处阶段（检查点记录）
+PHASE_BUFFER_GET = 'buffer_get'    # 等待从上游缓冲区取料
+PHASE_QUEUE = 'queue'              # 在工位前排队
+PHASE_PROCESSING = 'processing'    # 加工中
+PHASE_BUFFER_PUT = 'buffer_put'    # 完工后等待放入下游缓冲区
+
+CHECKPOINT_VERSION = 1
+
+# 分叉时可覆盖的参数（构造参数之外，工位级参数以 {工位ID: 值} 给出）
+FORK_STATION_PARAMS = ('station_processing_mean', 'station_processing_std')
+
 
 class ProductionLineSimulation:
     """生产线仿真类"""
 
-    def __init__(self, callback=None):
+    # 工位状态：加工中 / 完工后因下游缓冲区满而阻塞 / 线上有在制品但无料可加工 / 线上无在制品
+    STATION_STATES = ('busy', 'blocked', 'starved', 'idle')
+
+    def __init__(self, callback=None, record_events: bool = True,
+                 seed: Optional[int] = None,
+                 realtime_factor: Optional[float] = None,
+                 event_log_capacity: Optional[int] = 100000,
+                 event_log_spill_path: Optional[str] = None,
+                 topology=None,
+                 buffer_capacity: Optional[int] = None,
+                 processing_time_mean: float = 5.0,
+                 processing_time_std: float = 1.0,
+                 arrival_interval: float = 6.0,
+                 dispatch_policy: str = DISPATCH_RANDOM,
+                 warmup: float = 0.0,
+                 rng_backend: str = RNG_PYTHON):
         """
         初始化仿真环境
         :param callback: 回调函数，用于推送仿真事件
+        :param record_events: 是否记录事件日志（批量实验时关闭）；
+                              不记录且无回调时为快速模式，完全跳过事件构造
+        :param seed: 主随机数种子，None表示随机生成（实际使用的种子见 self.seed）；
+                     到达、各工位加工时间、派工各用独立的派生随机数流
+        :param realtime_factor: 每仿真秒对应的墙钟秒数，None表示不做实时同步
+        :param event_log_capacity: 事件日志环形缓冲区容量，None表示不限
+        :param event_log_spill_path: 事件日志溢出文件，设置后淘汰的事件写入磁盘
+        :param topology: 产线拓扑（Topology、配置字典、文件路径或拓扑名），None为默认拓扑
+        :param buffer_capacity: 统一的缓冲区容量，None表示使用拓扑中各缓冲区的容量
+        :param dispatch_policy: 并列工序的派工策略（见 dispatch.DISPATCH_POLICIES）
+        :param warmup: 预热时长，到达该仿真时刻时丢弃此前的统计（reset_statistics）
+        :param rng_backend: 随机数实现，python 或 numpy（需安装NumPy，分块预抽样）
         """
-        self.env = simpy.Environment()
+        self.realtime_factor = realtime_factor
+        self.env = self._create_env()
         self.callback = callback
-        self.event_log = []
+        self.record_events = record_events
+        # 是否需要构造事件（既无回调也不记录日志时跳过事件字典构造）
+        self._emit = self.callback is not None or self.record_events
+        # 构造参数（检查点中保存，用于恢复和分叉）
+        self.config = {
+            'seed': seed,
+            'topology': None if topology is None else compile_topology(topology).spec,
+            'buffer_capacity': buffer_capacity,
+            'processing_time_mean': processing_time_mean,
+            'processing_time_std': processing_time_std,
+            'arrival_interval': arrival_interval,
+            'dispatch_policy': dispatch_policy,
+            'warmup': warmup,
+            'rng_backend': rng_backend,
+        }
 
         # 停止控制
         self.stop_requested = False
@@ -30,95 +92,155 @@ class ProductionLineSimulation:
         self._pre_run_stop_requested = False
         self._aborted_parts = set()
 
+        # 产线拓扑（编译后的路线表）
+        self.topology: Topology = compile_topology(topology)
+        self.stages = self.topology.stages
+        self.process_routes = self.topology.routes
+        self.workstation_positions = self.topology.station_positions
+        self.buffer_positions = self.topology.buffer_positions
+        self.input_position = list(self.topology.input_position)
+        self.output_position = list(self.topology.output_position)
+
         # 仿真参数
-        self.num_workstations = 9
-        self.buffer_capacity = 5
-        self.processing_time_mean = 5.0  # 平均加工时间（秒）
-        self.processing_time_std = 1.0   # 加工时间标准差
-        self.arrival_interval = 6.0       # 物料到达间隔（秒）
+        self.num_workstations = self.topology.num_stations
+
+        # 各用途独立的随机数流
+        self.streams = RandomStreams(seed, self.num_workstations, rng_backend)
+        self.seed = self.streams.seed
+        self.config['seed'] = self.seed
+        self.num_buffers = self.topology.num_buffers
+        if buffer_capacity is None:
+            self.buffer_capacities = list(self.topology.buffer_capacities)
+        else:
+            self.buffer_capacities = [buffer_capacity] * self.num_buffers
+        self.buffer_capacity = (buffer_capacity if buffer_capacity is not None
+                                else max(self.buffer_capacities, default=0))
+        self.processing_time_mean = processing_time_mean  # 平均加工时间（秒）
+        self.processing_time_std = processing_time_std    # 加工时间标准差
+        self.arrival_interval = arrival_interval          # 物料到达间隔（秒）
+        # 各工位加工时间参数（拓扑中未指定的工位使用全局参数）
+        self.station_processing_mean = [
+            processing_time_mean if mean is None else mean
+            for mean in self.topology.station_processing_mean
+        ]
+        self.station_processing_std = [
+            processing_time_std if std is None else std
+            for std in self.topology.station_processing_std
+        ]
 
         # 统计数据
         self.stats = {
             'produced': 0,
             'in_system': 0,
-            'workstation_busy': [0] * 9,
-            'workstation_idle': [0] * 9,
-            'buffer_level': [0] * 5,
-            'queue_time': [],
-            'cycle_time': []
+            'buffer_level': [0] * self.num_buffers,
+            # 流式累加器：O(1)内存，统计摘要常数时间
+            'queue_time': StreamingStats(),
+            'cycle_time': StreamingStats(),
+            'queue_time_by_workstation': [
+                StreamingStats() for _ in range(self.num_workstations)
+            ],
+            # 按工序下标存放
+            'queue_time_by_stage': [StreamingStats() for _ in self.stages]
         }
 
+        # 时间加权状态跟踪（仅在状态变化时更新）
+        self.wip_tracker = TimeWeightedValue()
+        self.station_states = [
+            StateTimer(self.STATION_STATES, 'idle')
+            for _ in range(self.num_workstations)
+        ]
+        self._station_processing = [False] * self.num_workstations
+        self._station_blocked = [0] * self.num_workstations
+        # 各工序上游（尚未占用该工序工位）的在制品数量，用于区分 starved 与 idle
+        self.station_stage = self.topology.station_stage
+        self._upstream_wip = [0] * len(self.stages)
+        # 各工位当前加工的预计完成时刻（派工策略使用）
+        self.station_busy_until = [0.0] * self.num_workstations
+        self.buffer_trackers = [TimeWeightedValue() for _ in range(self.num_buffers)]
+
+        self._build_resources()
+
+        # 并列工序派工
+        self.dispatch_policy = dispatch_policy
+        self.dispatcher = create_dispatcher(dispatch_policy, self)
+
+        # 列式事件日志（有界环形缓冲区）
+        self.event_log = EventStore(
+            self.workstation_positions,
+            self.buffer_positions,
+            input_position=self.topology.input_position,
+            output_position=self.topology.output_position,
+            capacity=event_log_capacity,
+            spill_path=event_log_spill_path if self.record_events else None
+        )
+
+        self.part_counter = 0
+        # 在途物料记录（检查点使用）: 物料ID -> 记录，见 part_process
+        self._parts: Dict[str, list] = {}
+        self._next_arrival: Optional[float] = None
+        self._generator_started = False
+        # 统计起点（reset_statistics 后为重置时刻）
+        self.stats_start = 0.0
+        # 预热截断
+        self.warmup = warmup
+        self._warmup_pending = warmup > 0
+        self._warmup_process = None
+        # 稳态检测（MSER-5截断 + 批均值置信区间）
+        self.steady = SteadyStateMonitor()
+        self.stopped_by_ci = False
+
+    def _create_env(self, initial_time: float = 0.0) -> simpy.Environment:
+        if self.realtime_factor is None:
+            return simpy.Environment(initial_time)
+        # 非严格模式：处理落后时不报错，只是不再等待
+        return simpy.rt.RealtimeEnvironment(initial_time, factor=self.realtime_factor,
+                                            strict=False)
+
+    def _build_resources(self, buffer_levels: Optional[List[int]] = None):
+        """创建工位资源和缓冲区（恢复检查点时以保存的水平初始化缓冲区）"""
         # 创建资源（设备）
         self.workstations = [
             simpy.Resource(self.env, capacity=1)
             for _ in range(self.num_workstations)
         ]
 
-        # 创建缓冲区（包含公用缓存区）
-        # 缓存区0: 公用缓存区1（工位1后，工位2和3共享）
-        # 缓存区1: 公用缓存区2（工位2和3后，工位4和5共享）
-        # 缓存区2: 公用缓存区3（工位4和5后，工位6前）
-        # 缓存区3: 缓存区4（工位6后，工位7和8共享）
-        # 缓存区4: 缓存区5（工位7和8后，工位9前）
+        # 创建缓冲区（工序之间，可被并列工位共享）
+        levels = buffer_levels or [0] * self.num_buffers
         self.buffers = [
-            simpy.Container(self.env, capacity=self.buffer_capacity, init=0)
-            for _ in range(5)
-        ]
-
-        # 工位地图坐标（车间平面坐标，米）
-        self.workstation_positions = [
-            (10, 20),   # 工位1 - 预处理
-            (30, 30),   # 工位2 - 粗加工A（上方）
-            (30, 10),   # 工位3 - 粗加工B（下方）
-            (50, 30),   # 工位4 - 精加工A（上方）
-            (50, 10),   # 工位5 - 精加工B（下方）
-            (70, 20),   # 工位6 - 组装
-            (90, 30),   # 工位7 - 质检A（上方）
-            (90, 10),   # 工位8 - 质检B（下方）
-            (105, 20)   # 工位9 - 包装
-        ]
-
-        self.buffer_positions = [
-            (20, 20),   # 公用缓存区1（工位1后）
-            (40, 20),   # 公用缓存区2（工位2和3后）
-            (60, 20),   # 公用缓存区3（工位4和5后）
-            (80, 20),   # 缓存区4（工位6后）
-            (97.5, 20)  # 缓存区5（工位7和8后）
+            simpy.Container(self.env, capacity=capacity, init=level)
+            for capacity, level in zip(self.buffer_capacities, levels)
         ]
 
-        # 定义工艺路线（支持并列工序）
-        # 每个物料会随机选择并列工序中的一条路线
-        self.process_routes = {
-            'stage1': [0],           # 工位1 - 预处理
-            'stage2': [1, 2],        # 工位2或3 - 粗加工（并列）
-            'stage3': [3, 4],        # 工位4或5 - 精加工（并列）
-            'stage4': [5],           # 工位6 - 组装
-            'stage5': [6, 7],        # 工位7或8 - 质检（并列）
-            'stage6': [8]            # 工位9 - 包装
-        }
-
-        self.part_counter = 0
-
     def log_event(self, event_type: str, data: Dict[str, Any]):
         """记录并推送事件"""
-        event = {
-            'timestamp': self.env.now,
-            'real_time': datetime.now().isoformat(),
-            'type': event_type,
-            'data': data
-        }
-        self.event_log.append(event)
+        if self.callback is None and not self.record_events:
+            return
+
+        # 墙钟时间只取一次：事件日志直接存epoch秒，仅推送时才格式化为ISO字符串
+        wall = time.time()
+        if self.record_events:
+            self.event_log.append_data(event_type, self.env.now, data, wall)
 
         if self.callback:
-            self.callback(event)
+            self.callback({
+                'timestamp': self.env.now,
+                'real_time': datetime.fromtimestamp(wall).isoformat(),
+                'type': event_type,
+                'data': data
+            })
 
-    def part_generator(self):
-        """物料生成器"""
+    def part_generator(self, first_arrival: Optional[float] = None):
+        """物料生成器；first_arrival 为从检查点恢复时已排定的下一次到达时刻"""
         while True:
             if self.stop_requested:
                 break
             # 等待到达间隔
-            yield self.env.timeout(random.expovariate(1.0 / self.arrival_interval))
+            if first_arrival is not None:
+                delay, first_arrival = max(0.0, first_arrival - self.env.now), None
+            else:
+                delay = self.streams.arrivals.exponential(self.arrival_interval)
+            self._next_arrival = self.env.now + delay
+            yield self.env.timeout(delay)
 
             if self.stop_requested:
                 break
@@ -127,147 +249,220 @@ class ProductionLineSimulation:
             self.part_counter += 1
             part_id = f"PART-{self.part_counter:04d}"
 
-            self.stats['in_system'] += 1
+            self._change_wip(1)
+            for stage_index in range(len(self.stages)):
+                self._change_upstream(stage_index, 1)
 
             # 记录物料到达事件
-            self.log_event('part_arrived', {
-                'part_id': part_id,
-                'position': [5, 20],  # 起始位置
-                'status': 'arrived'
-            })
+            if self._emit:
+                self.log_event('part_arrived', {
+                    'part_id': part_id,
+                    'position': self.input_position,
+                    'status': 'arrived'
+                })
 
             # 启动物料流程
             self.env.process(self.part_process(part_id))
 
-    def part_process(self, part_id: str):
-        """物料加工流程 - 支持并列工序和公用缓存区"""
-        arrival_time = self.env.now
-
-        # 定义工艺路线和对应的缓冲区映射
-        # (stage, buffer_before, buffer_after)
-        process_stages = [
-            ('stage1', None, 0),      # 工位1 → 公用缓存区1
-            ('stage2', 0, 1),          # 公用缓存区1 → 工位2或3 → 公用缓存区2
-            ('stage3', 1, 2),          # 公用缓存区2 → 工位4或5 → 公用缓存区3
-            ('stage4', 2, 3),          # 公用缓存区3 → 工位6 → 缓存区4
-            ('stage5', 3, 4),          # 缓存区4 → 工位7或8 → 缓存区5
-            ('stage6', 4, None)        # 缓存区5 → 工位9 → 完成
-        ]
-
-        for stage_name, buffer_before, buffer_after in process_stages:
+    def part_process(self, part_id: str, resume: Optional[list] = None):
+        """
+        物料加工流程 - 支持并列工序和公用缓存区
+        :param resume: 从检查点恢复时的在途记录（见 _parts），从记录的工序和阶段继续
+        """
+        # 在途记录: [到达时刻, 工序下标, 阶段, 工位ID, 阶段开始时刻, 阶段结束时刻, 等待的事件]
+        if resume is None:
+            record = [self.env.now, 0, PHASE_BUFFER_GET, None, 0.0, 0.0, None]
+            phase = None
+        else:
+            record = resume
+            phase = record[2]
+            if phase == PHASE_BUFFER_GET:
+                # 取料前的等待直接重新开始该工序
+                phase = None
+        self._parts[part_id] = record
+        arrival_time = record[0]
+
+        # 按编译后的路线表逐道工序流转
+        for stage_index, stage_name, stations, buffer_before, buffer_after in \
+                self.stages[record[1]:]:
             if self.stop_requested:
                 self._handle_part_abort(part_id)
                 return
-            # 如果需要从缓冲区取料
-            if buffer_before is not None:
-                # 记录在缓冲区等待
-                self.log_event('part_waiting_buffer', {
-                    'part_id': part_id,
-                    'buffer_id': buffer_before,
-                    'position': list(self.buffer_positions[buffer_before]),
-                    'status': 'waiting'
-                })
-
-                # 从缓冲区取料
-                yield self.buffers[buffer_before].get(1)
-                if self.stop_requested:
-                    self._handle_part_abort(part_id)
-                    return
-                self.stats['buffer_level'][buffer_before] = self.buffers[buffer_before].level
-
-            # 从该阶段的可选工位中随机选择一个
-            available_workstations = self.process_routes[stage_name]
-            workstation_id = random.choice(available_workstations)
-
-            # 请求工位资源
-            queue_start = self.env.now
-
-            self.log_event('part_queue', {
-                'part_id': part_id,
-                'workstation_id': workstation_id,
-                'position': list(self.workstation_positions[workstation_id]),
-                'status': 'queuing'
-            })
-
+            record[1] = stage_index
+
+            if phase is None:
+                # 物料在缓冲区中等待工位，直到占用工位时才取出（见下方取料）
+                if buffer_before is not None:
+                    # 记录在缓冲区等待
+                    if self._emit:
+                        self.log_event('part_waiting_buffer', {
+                            'part_id': part_id,
+                            'buffer_id': buffer_before,
+                            'position': list(self.buffer_positions[buffer_before]),
+                            'status': 'waiting'
+                        })
+
+                # 由派工策略从该工序的可选工位中选择一个
+                workstation_id = self.dispatcher.select(stage_index, stations)
+
+                # 请求工位资源
+                queue_start = self.env.now
+
+                if self._emit:
+                    self.log_event('part_queue', {
+                        'part_id': part_id,
+                        'workstation_id': workstation_id,
+                        'position': list(self.workstation_positions[workstation_id]),
+                        'status': 'queuing'
+                    })
+            else:
+                workstation_id, queue_start = record[3], record[4]
+
+            # 物料占用工位直到放入下游缓冲区后才释放（完工后阻塞）
             with self.workstations[workstation_id].request() as req:
-                yield req
-
-                if self.stop_requested:
-                    self._handle_part_abort(part_id)
-                    return
-
-                queue_time = self.env.now - queue_start
-                self.stats['queue_time'].append(queue_time)
-
-                # 记录开始加工
-                processing_time = random.gauss(
-                    self.processing_time_mean,
-                    self.processing_time_std
-                )
-                processing_time = max(1.0, processing_time)  # 确保至少1秒
-
-                self.log_event('part_processing', {
-                    'part_id': part_id,
-                    'workstation_id': workstation_id,
-                    'position': list(self.workstation_positions[workstation_id]),
-                    'status': 'processing',
-                    'duration': processing_time
-                })
-
-                # 更新工位忙碌状态
-                self.stats['workstation_busy'][workstation_id] += processing_time
-
-                # 加工过程
-                yield self.env.timeout(processing_time)
-
-                if self.stop_requested:
-                    self._handle_part_abort(part_id)
-                    return
-
-                # 记录完成加工
-                self.log_event('part_completed_station', {
-                    'part_id': part_id,
-                    'workstation_id': workstation_id,
-                    'position': list(self.workstation_positions[workstation_id]),
-                    'status': 'completed'
-                })
-
-            # 如果需要放入缓冲区
-            if buffer_after is not None:
-                yield self.buffers[buffer_after].put(1)
-                if self.stop_requested:
-                    self._handle_part_abort(part_id)
-                    return
-                self.stats['buffer_level'][buffer_after] = self.buffers[buffer_after].level
-
-                self.log_event('part_in_buffer', {
-                    'part_id': part_id,
-                    'buffer_id': buffer_after,
-                    'position': list(self.buffer_positions[buffer_after]),
-                    'status': 'in_buffer',
-                    'buffer_level': self.buffers[buffer_after].level
-                })
+                if phase == PHASE_BUFFER_PUT:
+                    # 恢复阻塞中的物料：先重新占用工位，再继续等待放料
+                    record[6] = req
+                    yield req
+                else:
+                    record[2:5] = PHASE_QUEUE, workstation_id, queue_start
+                    record[6] = req
+                    yield req
+                    if phase != PHASE_PROCESSING:
+                        self._change_upstream(stage_index, -1)
+                        if buffer_before is not None:
+                            # 占用工位后才从缓冲区取料，排队期间物料计入缓冲区容量；
+                            # 该物料放入的一份必在缓冲区中，取料立即完成，无需等待
+                            self.buffers[buffer_before].get(1)
+                            self._record_buffer_level(buffer_before)
+
+                    if self.stop_requested:
+                        self._handle_part_abort(part_id)
+                        return
+
+                    if phase == PHASE_PROCESSING:
+                        # 恢复加工中的物料：按原定的完成时刻继续
+                        processing_time = record[5] - record[4]
+                        remaining = record[5] - self.env.now
+                    else:
+                        queue_time = self.env.now - queue_start
+                        self.stats['queue_time'].add(queue_time)
+                        self.stats['queue_time_by_stage'][stage_index].add(queue_time)
+                        self.stats['queue_time_by_workstation'][workstation_id].add(queue_time)
+
+                        # 记录开始加工
+                        processing_time = self.streams.processing[workstation_id].normal(
+                            self.station_processing_mean[workstation_id],
+                            self.station_processing_std[workstation_id]
+                        )
+                        processing_time = max(1.0, processing_time)  # 确保至少1秒
+                        remaining = processing_time
+
+                    if self._emit:
+                        self.log_event('part_processing', {
+                            'part_id': part_id,
+                            'workstation_id': workstation_id,
+                            'position': list(self.workstation_positions[workstation_id]),
+                            'status': 'processing',
+                            'duration': processing_time
+                        })
+
+                    # 更新工位忙碌状态
+                    self._station_processing[workstation_id] = True
+                    self.station_busy_until[workstation_id] = self.env.now + remaining
+                    self._update_station_state(workstation_id)
+
+                    # 加工过程
+                    record[2] = PHASE_PROCESSING
+                    record[4] = self.env.now + remaining - processing_time
+                    record[5] = self.env.now + remaining
+                    record[6] = None
+                    yield self.env.timeout(remaining)
+
+                    self._station_processing[workstation_id] = False
+                    self._update_station_state(workstation_id)
+
+                    if self.stop_requested:
+                        self._handle_part_abort(part_id)
+                        return
+
+                    # 记录完成加工
+                    if self._emit:
+                        self.log_event('part_completed_station', {
+                            'part_id': part_id,
+                            'workstation_id': workstation_id,
+                            'position': list(self.workstation_positions[workstation_id]),
+                            'status': 'completed'
+                        })
+                phase = None
+
+                # 如果需要放入缓冲区（已满时工位阻塞，不能接收下一个物料）
+                if buffer_after is not None:
+                    buffer = self.buffers[buffer_after]
+                    record[2] = PHASE_BUFFER_PUT
+                    record[6] = buffer.put(1)
+                    if not record[6].triggered:
+                        # 下游缓冲区已满，工位阻塞
+                        self._station_blocked[workstation_id] += 1
+                        self._update_station_state(workstation_id)
+                        yield record[6]
+                        self._station_blocked[workstation_id] -= 1
+                        self._update_station_state(workstation_id)
+                    else:
+                        yield record[6]
+                    if self.stop_requested:
+                        self._handle_part_abort(part_id)
+                        return
+                    self._record_buffer_level(buffer_after)
+
+                    if self._emit:
+                        self.log_event('part_in_buffer', {
+                            'part_id': part_id,
+                            'buffer_id': buffer_after,
+                            'position': list(self.buffer_positions[buffer_after]),
+                            'status': 'in_buffer',
+                            'buffer_level': self.buffers[buffer_after].level
+                        })
+            record[1] = stage_index + 1
+            record[2] = PHASE_BUFFER_GET
 
         # 所有工位完成
+        del self._parts[part_id]
         cycle_time = self.env.now - arrival_time
-        self.stats['cycle_time'].append(cycle_time)
+        self.stats['cycle_time'].add(cycle_time)
+        self.steady.observe(self.env.now, cycle_time, self.wip_tracker.integral(self.env.now))
         self.stats['produced'] += 1
-        self.stats['in_system'] -= 1
+        self._change_wip(-1)
 
         if part_id in self._aborted_parts:
             self._aborted_parts.remove(part_id)
 
-        self.log_event('part_finished', {
-            'part_id': part_id,
-            'position': [115, 20],  # 成品区（调整坐标）
-            'status': 'finished',
-            'cycle_time': cycle_time
-        })
+        if self._emit:
+            self.log_event('part_finished', {
+                'part_id': part_id,
+                'position': self.output_position,
+                'status': 'finished',
+                'cycle_time': cycle_time
+            })
 
-    def run(self, until: float = 100):
-        """运行仿真"""
+    def run(self, until: float = 100, target_half_width: Optional[float] = None,
+            target_relative_half_width: Optional[float] = None,
+            confidence: float = 0.95, check_interval: Optional[float] = None,
+            min_batches: int = 10):
+        """
+        运行仿真
+        :param until: 运行到的仿真时刻（上限）
+        :param target_half_width: 周期时间均值置信区间（MSER截断后的批均值区间）
+                                  半宽小于该值时提前结束
+        :param target_relative_half_width: 同上，以相对均值的比例给出
+        :param confidence: 置信水平
+        :param check_interval: 检查停止条件的仿真时间间隔，默认为剩余时长的1/200
+        :param min_batches: 判定前至少需要的批数
+        """
         self.stopped_early = False
+        self.stopped_by_ci = False
         self.stop_event = self.env.event()
+        self._emit = self.callback is not None or self.record_events
 
         if self._pre_run_stop_requested:
             self.stop_requested = True
@@ -276,15 +471,34 @@ class ProductionLineSimulation:
         else:
             self.stop_requested = False
 
+        if self.realtime_factor is not None:
+            # 从此刻开始对齐墙钟
+            self.env.sync()
+
         # 启动停止监视器
         self.env.process(self._stop_monitor())
 
-        # 启动物料生成器
-        self.env.process(self.part_generator())
+        # 启动物料生成器（多次调用 run() 时只启动一次）
+        if not self._generator_started:
+            self._generator_started = True
+            self.env.process(self.part_generator(self._next_arrival))
+
+        # 预热截断
+        if self._warmup_pending and self._warmup_process is None:
+            self._warmup_process = self.env.process(self._warmup_monitor())
 
         # 运行仿真
         try:
-            self.env.run(until=until)
+            if target_half_width is None and target_relative_half_width is None:
+                self.env.run(until=until)
+            else:
+                interval = check_interval or max((until - self.env.now) / 200, 1e-6)
+                while self.env.now < until:
+                    self.env.run(until=min(until, self.env.now + interval))
+                    if self._precision_reached(target_half_width, target_relative_half_width,
+                                               confidence, min_batches):
+                        self.stopped_by_ci = True
+                        break
         except simpy.core.StopSimulation:
             pass
         finally:
@@ -293,6 +507,26 @@ class ProductionLineSimulation:
         # 计算最终统计数据
         return self.get_statistics()
 
+    def _warmup_monitor(self):
+        """到达预热时长时丢弃此前的统计"""
+        yield self.env.timeout(max(0.0, self.warmup - self.env.now))
+        self._warmup_pending = False
+        self.reset_statistics()
+
+    def _precision_reached(self, half_width: Optional[float], relative: Optional[float],
+                           confidence: float, min_batches: int) -> bool:
+        """周期时间置信区间是否达到目标精度（预热未结束时不判定）"""
+        if self._warmup_pending:
+            return False
+        ci = self.steady.confidence_interval(confidence)
+        if ci is None or len(self.steady.means) - self.steady.truncation() < min_batches:
+            return False
+        if half_width is not None and ci['half_width'] > half_width:
+            return False
+        if relative is not None and ci['half_width'] > relative * abs(ci['mean']):
+            return False
+        return True
+
     def _stop_monitor(self):
         """监听停止事件并终止仿真"""
         yield self.stop_event
@@ -313,30 +547,269 @@ class ProductionLineSimulation:
             return
 
         self._aborted_parts.add(part_id)
+        record = self._parts.pop(part_id, None)
+        if record is not None:
+            for stage_index in range(self._first_pending_stage(record), len(self.stages)):
+                self._change_upstream(stage_index, -1)
         if self.stats['in_system'] > 0:
-            self.stats['in_system'] -= 1
+            self._change_wip(-1)
 
-        self.log_event('part_aborted', {
-            'part_id': part_id,
-            'status': 'aborted'
-        })
+        if self._emit:
+            self.log_event('part_aborted', {
+                'part_id': part_id,
+                'status': 'aborted'
+            })
+
+    def _change_wip(self, delta: int):
+        """更新在制品数量及其时间加权统计"""
+        before = self.stats['in_system']
+        after = before + delta
+        self.stats['in_system'] = after
+        self.wip_tracker.update(self.env.now, after)
+
+    def _change_upstream(self, stage_index: int, delta: int):
+        """更新尚未进入该工序工位的在制品数量"""
+        before = self._upstream_wip[stage_index]
+        after = before + delta
+        self._upstream_wip[stage_index] = after
+
+        # 上游有无物料切换时，该工序的空闲工位在 starved 与 idle 之间切换
+        if (before == 0) != (after == 0):
+            for workstation_id in self.stages[stage_index].stations:
+                self._update_station_state(workstation_id)
+
+    @staticmethod
+    def _first_pending_stage(record: list) -> int:
+        """在途记录中物料尚未占用工位的第一道工序"""
+        stage_index, phase, event = record[1], record[2], record[6]
+        if phase == PHASE_BUFFER_GET or (
+                phase == PHASE_QUEUE and not (event is not None and event.triggered)):
+            return stage_index
+        return stage_index + 1
+
+    def station_blocked(self, workstation_id: int) -> bool:
+        """工位是否阻塞（完工物料因下游缓冲区已满仍占用工位）"""
+        return self._station_blocked[workstation_id] > 0
+
+    def _update_station_state(self, workstation_id: int):
+        """
+        根据当前状况更新工位状态：
+        busy 加工中；blocked 完工后因下游缓冲区已满仍占用工位；
+        starved 空闲且有物料尚在本工序上游（等待来料）；idle 空闲且上游没有物料
+        """
+        if self._station_processing[workstation_id]:
+            state = 'busy'
+        elif self._station_blocked[workstation_id]:
+            state = 'blocked'
+        elif self._upstream_wip[self.station_stage[workstation_id]] > 0:
+            state = 'starved'
+        else:
+            state = 'idle'
+        self.station_states[workstation_id].set(self.env.now, state)
+
+    def _record_buffer_level(self, buffer_id: int):
+        """记录缓冲区水平变化"""
+        level = self.buffers[buffer_id].level
+        self.stats['buffer_level'][buffer_id] = level
+        self.buffer_trackers[buffer_id].update(self.env.now, level)
+
+    def reset_statistics(self):
+        """从当前时刻重新开始统计，在制品、缓冲区水平和工位状态保持不变"""
+        now = self.env.now
+        self.stats_start = now
+        self.stats['produced'] = 0
+        self.stats['queue_time'] = StreamingStats()
+        self.stats['cycle_time'] = StreamingStats()
+        self.stats['queue_time_by_workstation'] = [
+            StreamingStats() for _ in range(self.num_workstations)
+        ]
+        self.stats['queue_time_by_stage'] = [StreamingStats() for _ in self.stages]
+        self.wip_tracker = TimeWeightedValue(self.stats['in_system'], now)
+        self.station_states = [
+            StateTimer(self.STATION_STATES, timer.state, now) for timer in self.station_states
+        ]
+        self.buffer_trackers = [
+            TimeWeightedValue(buffer.level, now) for buffer in self.buffers
+        ]
+        self.steady = SteadyStateMonitor(now=now)
+
+    # ------------------------------------------------------------------
+    # 检查点、分叉与恢复
+    # ------------------------------------------------------------------
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        保存当前仿真状态（可pickle），在 run() 返回后调用
+        包括随机数状态、在途物料（所处工序和阶段）、各资源队列顺序、缓冲区水平和统计累加器
+        """
+        if self.env.active_process is not None:
+            raise RuntimeError("Checkpoint must be taken between runs")
+
+        # 在途物料按恢复顺序排列：加工中的物料先重新占用工位，
+        # 其余按在工位/缓冲区队列中的原有顺序重新排队
+        queue_index = {}
+        for resource in self.workstations:
+            for index, request in enumerate(resource.queue):
+                queue_index[id(request)] = index
+        for buffer in self.buffers:
+            for index, event in enumerate(buffer.get_queue):
+                queue_index[id(event)] = index
+            for index, event in enumerate(buffer.put_queue):
+                queue_index[id(event)] = index
+        phase_rank = {PHASE_PROCESSING: 0, PHASE_BUFFER_PUT: 0, PHASE_QUEUE: 1,
+                      PHASE_BUFFER_GET: 2}
+        parts = sorted(
+            self._parts.items(),
+            key=lambda item: (phase_rank[item[1][2]], queue_index.get(id(item[1][6]), 0),
+                              item[1][0])
+        )
+
+        return {
+            'version': CHECKPOINT_VERSION,
+            'time': self.env.now,
+            'config': dict(self.config),
+            'rng_state': self.streams.getstate(),
+            'next_arrival': self._next_arrival,
+            'buffer_levels': [buffer.level for buffer in self.buffers],
+            'dispatcher': self.dispatcher.getstate(),
+            'state': copy.deepcopy({
+                'parts': [(part_id, record[:6] + [None]) for part_id, record in parts],
+                'part_counter': self.part_counter,
+                'stats': self.stats,
+                'stats_start': self.stats_start,
+                'wip_tracker': self.wip_tracker,
+                'station_states': self.station_states,
+                'buffer_trackers': self.buffer_trackers,
+                'station_processing': self._station_processing,
+                'station_busy_until': self.station_busy_until,
+                'station_processing_mean': self.station_processing_mean,
+                'station_processing_std': self.station_processing_std,
+                'aborted_parts': self._aborted_parts,
+                'steady': self.steady,
+                'warmup_pending': self._warmup_pending,
+            }),
+        }
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint: Dict[str, Any], callback=None,
+                        record_events: bool = True,
+                        realtime_factor: Optional[float] = None,
+                        event_log_capacity: Optional[int] = 100000,
+                        event_log_spill_path: Optional[str] = None,
+                        **overrides) -> 'ProductionLineSimulation':
+        """
+        从检查点恢复仿真，之后调用 run(until) 继续（until 为绝对仿真时刻）
+        :param overrides: 覆盖的构造参数（如 processing_time_mean、dispatch_policy），
+                          以及 FORK_STATION_PARAMS 中的工位级参数 {工位ID: 值}；
+                          指定 seed 时重新播种，否则沿用检查点的随机数状态
+        """
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version")
+        if 'topology' in overrides:
+            raise ValueError("Topology cannot be changed when resuming a checkpoint")
+        station_overrides = {
+            name: overrides.pop(name) for name in FORK_STATION_PARAMS if name in overrides
+        }
+        config = dict(checkpoint['config'], **overrides)
+
+        sim = cls(callback=callback, record_events=record_events,
+                  realtime_factor=realtime_factor, event_log_capacity=event_log_capacity,
+                  event_log_spill_path=event_log_spill_path, **config)
+        state = copy.deepcopy(checkpoint['state'])
+
+        sim.env = sim._create_env(checkpoint['time'])
+        sim._build_resources(checkpoint['buffer_levels'])
+        if 'seed' not in overrides:
+            if sim.streams.backend != checkpoint['config'].get('rng_backend', RNG_PYTHON):
+                raise ValueError("Changing the RNG backend requires a new seed")
+            sim.streams.setstate(checkpoint['rng_state'])
+
+        sim.part_counter = state['part_counter']
+        sim.stats = state['stats']
+        sim.stats_start = state['stats_start']
+        sim.wip_tracker = state['wip_tracker']
+        sim.station_states = state['station_states']
+        sim.buffer_trackers = state['buffer_trackers']
+        sim._station_processing = state['station_processing']
+        sim.station_busy_until = state['station_busy_until']
+        sim._aborted_parts = state['aborted_parts']
+        sim.steady = state['steady']
+        sim._warmup_pending = state['warmup_pending']
+        # 阻塞计数由恢复后重新等待放料的物料重新累加
+        sim._station_blocked = [0] * sim.num_workstations
+        for _, record in state['parts']:
+            for stage_index in range(sim._first_pending_stage(record), len(sim.stages)):
+                sim._upstream_wip[stage_index] += 1
+        if not {'processing_time_mean', 'processing_time_std'} & set(overrides):
+            sim.station_processing_mean = state['station_processing_mean']
+            sim.station_processing_std = state['station_processing_std']
+        for name, values in station_overrides.items():
+            target = getattr(sim, name)
+            for station_id, value in values.items():
+                target[int(station_id)] = value
+
+        # 派工器依赖工位参数，覆盖参数后重建；策略未变时延续其状态
+        sim.dispatcher = create_dispatcher(sim.dispatch_policy, sim)
+        if sim.dispatch_policy == checkpoint['config']['dispatch_policy']:
+            sim.dispatcher.setstate(checkpoint['dispatcher'])
+
+        # 按保存的顺序重建在途物料流程，物料生成器在 run() 中按原定时刻继续
+        for part_id, record in state['parts']:
+            sim.env.process(sim.part_process(part_id, record))
+        sim._next_arrival = checkpoint['next_arrival']
+        return sim
+
+    def fork(self, variants: List[Dict[str, Any]]) -> List['ProductionLineSimulation']:
+        """
+        从当前状态分叉出多个方案（如预热后分别修改工位参数）
+        :param variants: 每个方案传给 from_checkpoint 的参数
+        """
+        checkpoint = self.checkpoint()
+        return [type(self).from_checkpoint(checkpoint, **variant) for variant in variants]
 
     def get_statistics(self) -> Dict[str, Any]:
-        """获取统计数据"""
+        """获取统计数据（reset_statistics 后从重置时刻起统计）"""
         total_time = self.env.now
+        elapsed = total_time - self.stats_start
 
         return {
             'simulation_time': total_time,
+            'statistics_start': self.stats_start,
+            'seed': self.seed,
+            'warmup': self.warmup,
+            'dispatch_policy': self.dispatch_policy,
             'parts_produced': self.stats['produced'],
             'parts_in_system': self.stats['in_system'],
-            'throughput': self.stats['produced'] / total_time if total_time > 0 else 0,
-            'avg_cycle_time': sum(self.stats['cycle_time']) / len(self.stats['cycle_time']) if self.stats['cycle_time'] else 0,
-            'avg_queue_time': sum(self.stats['queue_time']) / len(self.stats['queue_time']) if self.stats['queue_time'] else 0,
+            'throughput': self.stats['produced'] / elapsed if elapsed > 0 else 0,
+            'avg_cycle_time': self.stats['cycle_time'].mean,
+            'avg_queue_time': self.stats['queue_time'].mean,
+            'cycle_time_stats': self.stats['cycle_time'].summary(),
+            'queue_time_stats': self.stats['queue_time'].summary(),
+            'queue_time_by_stage': {
+                stage_name: acc.summary()
+                for stage_name, acc in zip(self.topology.stage_names,
+                                           self.stats['queue_time_by_stage'])
+            },
+            'queue_time_by_workstation': [
+                acc.summary() for acc in self.stats['queue_time_by_workstation']
+            ],
             'workstation_utilization': [
-                self.stats['workstation_busy'][i] / total_time if total_time > 0 else 0
-                for i in range(self.num_workstations)
+                timer.fractions(total_time)['busy'] for timer in self.station_states
+            ],
+            # 各状态的时间占比，定义见 _update_station_state
+            'workstation_states': [
+                timer.fractions(total_time) for timer in self.station_states
+            ],
+            'buffer_levels': self.stats['buffer_level'],
+            'avg_buffer_levels': [
+                tracker.mean(total_time) for tracker in self.buffer_trackers
             ],
-            'buffer_levels': self.stats['buffer_level']
+            'max_buffer_levels': [tracker.max for tracker in self.buffer_trackers],
+            'avg_wip': self.wip_tracker.mean(total_time),
+            # MSER-5截断后的稳态估计及批均值置信区间
+            'steady_state': dict(
+                self.steady.summary(total_time, self.wip_tracker.integral(total_time)),
+                stopped_by_ci=self.stopped_by_ci
+            )
         }
 
 
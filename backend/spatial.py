@@ -0,0 +1,164 @@
+"""
+空间索引与视口过滤
+以均匀网格索引工位、缓冲区和投料/成品区的坐标，矩形查询只检查与之相交的单元格；
+客户端通过WebSocket发送当前视口范围后，推送通道只转发位置落在视口内的物料事件，
+大型多产线车间中每个客户端的带宽按可见面积比例下降
+"""
+
+import math
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from live_state import TERMINAL_EVENTS
+
+MSG_VIEWPORT = 'viewport'
+ACTION_VIEWPORT = 'viewport'
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(value: Any) -> BBox:
+    """[minx, miny, maxx, maxy] -> 元组"""
+    if not isinstance(value, (list, tuple)) or len(value) != 4:
+        raise ValueError("bbox must be [minx, miny, maxx, maxy]")
+    minx, miny, maxx, maxy = (float(v) for v in value)
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox min must not exceed max")
+    return minx, miny, maxx, maxy
+
+
+class GridIndex:
+    """均匀网格上的点要素索引"""
+
+    def __init__(self, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive")
+        self.cell_size = cell_size
+        # 单元格 -> [(键, x, y)]
+        self._cells: Dict[Tuple[int, int], List[Tuple[Hashable, float, float]]] = {}
+        self.size = 0
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, key: Hashable, point: Sequence[float]):
+        x, y = point
+        self._cells.setdefault(self._cell(x, y), []).append((key, x, y))
+        self.size += 1
+
+    def query(self, bbox: BBox) -> List[Hashable]:
+        """落在矩形内（含边界）的要素键"""
+        minx, miny, maxx, maxy = bbox
+        cx0, cy0 = self._cell(minx, miny)
+        cx1, cy1 = self._cell(maxx, maxy)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # 视口覆盖的单元格多于已占用的单元格时直接遍历已占用单元格
+            cells = [items for (cx, cy), items in self._cells.items()
+                     if cx0 <= cx <= cx1 and cy0 <= cy <= cy1]
+        else:
+            cells = [self._cells[(cx, cy)]
+                     for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)
+                     if (cx, cy) in self._cells]
+        return [key for items in cells for key, x, y in items
+                if minx <= x <= maxx and miny <= y <= maxy]
+
+
+class SpatialIndex:
+    """产线拓扑要素（工位、缓冲区、投料区、成品区）的空间索引"""
+
+    def __init__(self, topology, cell_size: Optional[float] = None):
+        """
+        :param topology: 编译后的拓扑
+        :param cell_size: 网格单元边长，默认按要素数使每个单元约一个要素
+        """
+        points = ([(('station', i), p) for i, p in enumerate(topology.station_positions)]
+                  + [(('buffer', i), p) for i, p in enumerate(topology.buffer_positions)]
+                  + [(('input', None), topology.input_position),
+                     (('output', None), topology.output_position)])
+        if cell_size is None:
+            minx, miny, maxx, maxy = topology.bounds
+            extent = max(maxx - minx, maxy - miny, 1.0)
+            cell_size = extent / max(1, math.ceil(math.sqrt(len(points))))
+        self.grid = GridIndex(cell_size)
+        for key, point in points:
+            self.grid.insert(key, point)
+
+    def query(self, bbox: BBox) -> Dict[str, Any]:
+        """矩形内的要素：工位ID、缓冲区ID及是否包含投料/成品区"""
+        hits = {'stations': [], 'buffers': [], 'input': False, 'output': False}
+        for kind, item_id in self.grid.query(bbox):
+            if kind == 'station':
+                hits['stations'].append(item_id)
+            elif kind == 'buffer':
+                hits['buffers'].append(item_id)
+            else:
+                hits[kind] = True
+        hits['stations'].sort()
+        hits['buffers'].sort()
+        return hits
+
+
+class Viewport:
+    """
+    客户端视口：物料事件按所在工位/缓冲区（索引查询结果）或坐标判断是否可见；
+    物料离开视口时仍转发其第一条视口外事件，客户端据此移走该物料
+    """
+
+    def __init__(self, bbox: BBox, index: Optional[SpatialIndex] = None):
+        self.bbox = bbox
+        hits = index.query(bbox) if index is not None else None
+        self.stations = set(hits['stations']) if hits else None
+        self.buffers = set(hits['buffers']) if hits else None
+        # 客户端当前显示在视口内的物料（由 ConnectionManager 在其锁内读写）
+        self.visible = set()
+
+    def contains(self, position) -> bool:
+        minx, miny, maxx, maxy = self.bbox
+        return minx <= position[0] <= maxx and miny <= position[1] <= maxy
+
+    def accepts(self, message: Dict[str, Any]) -> bool:
+        """物料事件是否转发给该客户端"""
+        data = message['data']
+        workstation_id = data.get('workstation_id')
+        buffer_id = data.get('buffer_id')
+        if workstation_id is not None and self.stations is not None:
+            inside = workstation_id in self.stations
+        elif buffer_id is not None and self.buffers is not None:
+            inside = buffer_id in self.buffers
+        else:
+            position = data.get('position')
+            if position is None:
+                return True
+            inside = self.contains(position)
+
+        part_id = data['part_id']
+        if message.get('type') in TERMINAL_EVENTS:
+            if part_id in self.visible:
+                self.visible.discard(part_id)
+                return True
+            return inside
+        if inside:
+            self.visible.add(part_id)
+            return True
+        if part_id in self.visible:
+            self.visible.discard(part_id)
+            return True
+        return False
+
+    def filter_snapshot(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """只保留视口内物料的快照/关键帧，并以此重置可见物料集合"""
+        data = snapshot['data']
+        parts = [part for part in data['parts']
+                 if part[2] is not None and self.contains(part[2:4])]
+        self.visible = {part[0] for part in parts}
+        return dict(snapshot, data=dict(data, parts=parts))
+
+    def describe(self) -> Dict[str, Any]:
+        """视口确认消息"""
+        return {
+            'type': MSG_VIEWPORT,
+            'data': {
+                'bbox': list(self.bbox),
+                'stations': sorted(self.stations) if self.stations is not None else None,
+                'buffers': sorted(self.buffers) if self.buffers is not None else None,
+            }
+        }
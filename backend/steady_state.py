@@ -0,0 +1,161 @@
+"""
+稳态分析
+预热截断（MSER-5自动确定截断点）、批均值置信区间，
+供 run() 的"置信区间半宽达标即停止"规则和统计输出使用
+"""
+
+import math
+from array import array
+from statistics import NormalDist
+from typing import Dict, Any, Optional, Sequence
+
+
+def t_critical(df: int, confidence: float = 0.95) -> float:
+    """
+    学生t分布双侧临界值
+    使用Cornish-Fisher展开由正态分位数近似，df>=3时误差小于1%
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    if df <= 0:
+        return float('inf')
+    if df == 1:
+        return math.tan(math.pi * confidence / 2)
+    if df == 2:
+        alpha = 1 - confidence
+        return math.sqrt(2 / (alpha * (2 - alpha)) - 2)
+
+    z3, z5, z7 = z ** 3, z ** 5, z ** 7
+    return (z
+            + (z3 + z) / (4 * df)
+            + (5 * z5 + 16 * z3 + 3 * z) / (96 * df ** 2)
+            + (3 * z7 + 19 * z5 + 17 * z3 - 15 * z) / (384 * df ** 3))
+
+
+def mser_truncation(values: Sequence[float]) -> int:
+    """
+    MSER截断点：在前一半中选择d，使 sum((x_i - mean_d)^2, i>=d) / (n-d)^2 最小
+    输入为批均值（批大小5即MSER-5），后缀和一次扫描，O(n)
+    """
+    n = len(values)
+    if n < 2:
+        return 0
+    best_d, best = 0, math.inf
+    s1 = s2 = 0.0
+    # 从尾部累加后缀和
+    for d in range(n - 1, -1, -1):
+        x = values[d]
+        s1 += x
+        s2 += x * x
+        if d <= n // 2:
+            m = n - d
+            mser = max(s2 - s1 * s1 / m, 0.0) / (m * m)
+            if mser <= best:
+                best_d, best = d, mser
+    return best_d
+
+
+def batch_means_interval(values: Sequence[float], num_batches: int = 20,
+                         confidence: float = 0.95) -> Optional[Dict[str, float]]:
+    """
+    批均值置信区间：把序列（丢弃最早的余数）合并为 num_batches 个等长批，
+    以批均值的样本方差估计均值的标准误差
+    """
+    k = min(num_batches, len(values))
+    if k < 2:
+        return None
+    size = len(values) // k
+    offset = len(values) - size * k
+    means = [sum(values[offset + i * size:offset + (i + 1) * size]) / size for i in range(k)]
+    mean = sum(means) / k
+    std = math.sqrt(sum((m - mean) ** 2 for m in means) / (k - 1))
+    half_width = t_critical(k - 1, confidence) * std / math.sqrt(k)
+    return {
+        'mean': mean,
+        'half_width': half_width,
+        'ci_low': mean - half_width,
+        'ci_high': mean + half_width,
+        'batches': k,
+    }
+
+
+class SteadyStateMonitor:
+    """
+    按完成顺序记录周期时间的批均值（默认每批5个），及每批结束时刻和在制品面积，
+    用于事后按MSER截断点重新计算周期时间、产能和平均在制品；
+    批数达到上限时相邻两批合并（批大小加倍），内存有界
+    """
+
+    def __init__(self, batch_size: int = 5, max_batches: int = 4096,
+                 now: float = 0.0, wip_area: float = 0.0):
+        if max_batches < 2 or max_batches % 2:
+            raise ValueError("max_batches must be an even number >= 2")
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.start = now
+        self.start_area = wip_area
+        self.means = array('d')
+        self.end_times = array('d')
+        self.end_areas = array('d')
+        self.count = 0
+        self._partial_sum = 0.0
+        self._partial_n = 0
+        self._truncation = (-1, 0)  # (批数, 截断点) 缓存
+
+    def observe(self, now: float, value: float, wip_area: float):
+        """记录一个完成物料的周期时间；wip_area 为截至now的在制品时间积分"""
+        self.count += 1
+        self._partial_sum += value
+        self._partial_n += 1
+        if self._partial_n == self.batch_size:
+            self.means.append(self._partial_sum / self.batch_size)
+            self.end_times.append(now)
+            self.end_areas.append(wip_area)
+            self._partial_sum = 0.0
+            self._partial_n = 0
+            if len(self.means) >= self.max_batches:
+                self._compact()
+
+    def _compact(self):
+        """相邻两批合并"""
+        half = len(self.means) // 2
+        self.means = array('d', ((self.means[2 * i] + self.means[2 * i + 1]) / 2
+                                 for i in range(half)))
+        self.end_times = array('d', (self.end_times[2 * i + 1] for i in range(half)))
+        self.end_areas = array('d', (self.end_areas[2 * i + 1] for i in range(half)))
+        self.batch_size *= 2
+        self._truncation = (-1, 0)
+
+    def truncation(self) -> int:
+        """MSER截断点（批下标），按批数缓存"""
+        n = len(self.means)
+        if self._truncation[0] != n:
+            self._truncation = (n, mser_truncation(self.means))
+        return self._truncation[1]
+
+    def confidence_interval(self, confidence: float = 0.95,
+                            num_batches: int = 20) -> Optional[Dict[str, float]]:
+        """截断后周期时间均值的批均值置信区间"""
+        return batch_means_interval(self.means[self.truncation():], num_batches, confidence)
+
+    def summary(self, now: float, wip_area: float, confidence: float = 0.95,
+                num_batches: int = 20) -> Dict[str, Any]:
+        """截断后的周期时间、产能、平均在制品及置信区间"""
+        n = len(self.means)
+        d = self.truncation()
+        if d == 0:
+            t_d, area_d = self.start, self.start_area
+        else:
+            t_d, area_d = self.end_times[d - 1], self.end_areas[d - 1]
+        elapsed = now - t_d
+        kept = self.means[d:]
+        return {
+            'truncation_time': t_d,
+            'truncated_observations': d * self.batch_size,
+            'batch_size': self.batch_size,
+            # 截断点落在搜索上限时说明序列尚未进入稳态（运行时长不足）
+            'steady_state_detected': n >= 4 and d < n // 2,
+            'avg_cycle_time': sum(kept) / len(kept) if kept else 0.0,
+            'throughput': (self.count - d * self.batch_size) / elapsed if elapsed > 0 else 0.0,
+            'avg_wip': (wip_area - area_d) / elapsed if elapsed > 0 else 0.0,
+            'cycle_time_ci': batch_means_interval(kept, num_batches, confidence),
+        }
@@ -0,0 +1,384 @@
+"""
+生产线拓扑
+工位、缓冲区、工序（含并列工位）及坐标由声明式配置（JSON，安装PyYAML时也支持YAML）描述，
+编译一次后生成带下标的路线表，同时驱动仿真模型和车间布局接口
+
+配置格式（见 topologies/default.json）:
+    stations  [{"id", "name", "position", "processing_time_mean"?, "processing_time_std"?}]
+    buffers   [{"id", "name", "position", "capacity"?}]
+    stages    [{"name", "stations": [工位id], "buffer_before": 缓冲区id|null, "buffer_after": 缓冲区id|null}]
+    input / output   {"name", "position", "zone"?: [minx, miny, maxx, maxy]}
+    bounds    [minx, miny, maxx, maxy]（可选）
+    paths     [{"name", "coordinates"}]（可选，缺省时按工序自动生成）
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple, Union
+
+try:
+    import yaml
+except ImportError:  # PyYAML为可选依赖
+    yaml = None
+
+TOPOLOGY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topologies')
+DEFAULT_TOPOLOGY = 'default'
+DEFAULT_BUFFER_CAPACITY = 5
+
+Point = Tuple[float, float]
+
+
+class Stage(NamedTuple):
+    """编译后的工序：可选工位和前后缓冲区均为下标"""
+    index: int
+    name: str
+    stations: Tuple[int, ...]
+    buffer_before: Optional[int]
+    buffer_after: Optional[int]
+
+
+class SerializedLayout(NamedTuple):
+    """预序列化的布局响应"""
+    body: bytes       # UTF-8 JSON
+    gzipped: bytes    # gzip压缩后的body
+    etag: str         # 强ETag（内容哈希）
+
+
+def load_spec(path: str) -> Dict[str, Any]:
+    """读取拓扑配置文件"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError("PyYAML is required to load YAML topologies")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _resolve_path(name: str) -> str:
+    """topologies/ 下的拓扑名 -> 文件路径（名称来自接口参数，不接受路径）"""
+    if not name or name.startswith('.') or any(sep in name for sep in ('/', '\\', os.sep)):
+        raise ValueError(f"Invalid topology name: {name}")
+    for ext in ('.json', '.yaml', '.yml'):
+        path = os.path.join(TOPOLOGY_DIR, name + ext)
+        if os.path.isfile(path):
+            return path
+    raise ValueError(f"Unknown topology: {name}")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_index(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _point(value, what: str) -> Point:
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(_is_number(v) for v in value)):
+        raise ValueError(f"{what}: position must be [x, y]")
+    return (value[0], value[1])
+
+
+def _box(value, what: str) -> List[float]:
+    if (not isinstance(value, (list, tuple)) or len(value) != 4
+            or not all(_is_number(v) for v in value)):
+        raise ValueError(f"{what} must be [minx, miny, maxx, maxy]")
+    return list(value)
+
+
+def _rect(zone) -> List[List[float]]:
+    """[minx, miny, maxx, maxy] -> 闭合多边形环"""
+    minx, miny, maxx, maxy = zone
+    return [[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]
+
+
+def _indexed(items: List[Dict[str, Any]], kind: str) -> List[Dict[str, Any]]:
+    """检查id为 0..n-1（缺省时按顺序编号）"""
+    if not isinstance(items, list):
+        raise ValueError(f"{kind}s must be a list")
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"{kind} {index} must be an object")
+        if item.get('id', index) != index:
+            raise ValueError(f"{kind} ids must be 0..{len(items) - 1} in order")
+    return items
+
+
+def _indexed_free(items, kind: str) -> List[Dict[str, Any]]:
+    """检查为对象列表（不要求id）"""
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f"{kind}s must be a list of objects")
+    return items
+
+
+class Topology:
+    """编译后的生产线拓扑（只读）"""
+
+    def __init__(self, spec: Dict[str, Any]):
+        if not isinstance(spec, dict):
+            raise ValueError("Topology spec must be an object")
+        self.spec = spec
+        self.name = spec.get('name', 'production line')
+
+        stations = _indexed(spec.get('stations') or [], 'station')
+        buffers = _indexed(spec.get('buffers') or [], 'buffer')
+        if not stations:
+            raise ValueError("Topology must define at least one station")
+
+        self.station_names = [s.get('name', f"工位{i + 1}") for i, s in enumerate(stations)]
+        self.station_positions = [_point(s.get('position'), f"station {i}")
+                                  for i, s in enumerate(stations)]
+        # 工位级加工时间，None表示使用仿真的全局参数
+        self.station_processing_mean = [s.get('processing_time_mean') for s in stations]
+        self.station_processing_std = [s.get('processing_time_std') for s in stations]
+        for i, value in enumerate(self.station_processing_mean + self.station_processing_std):
+            if value is not None and not _is_number(value):
+                raise ValueError(f"station {i % len(stations)}: processing time must be a number")
+
+        default_capacity = spec.get('default_buffer_capacity', DEFAULT_BUFFER_CAPACITY)
+        self.buffer_names = [b.get('name', f"缓存区{i + 1}") for i, b in enumerate(buffers)]
+        self.buffer_positions = [_point(b.get('position'), f"buffer {i}")
+                                 for i, b in enumerate(buffers)]
+        self.buffer_capacities = [b.get('capacity', default_capacity) for b in buffers]
+        for i, capacity in enumerate(self.buffer_capacities):
+            if not _is_index(capacity) or capacity <= 0:
+                raise ValueError(f"buffer {i}: capacity must be a positive integer")
+
+        # 工序 -> 路线表
+        stages = []
+        self.station_stage = [None] * len(stations)
+        for index, raw in enumerate(_indexed_free(spec.get('stages') or [], 'stage')):
+            name = raw.get('name', f"stage{index + 1}")
+            members = raw.get('stations') or ()
+            if not isinstance(members, (list, tuple)):
+                raise ValueError(f"Stage {name}: stations must be a list")
+            members = tuple(members)
+            if not members:
+                raise ValueError(f"Stage {name} has no stations")
+            for station_id in members:
+                if not _is_index(station_id) or not 0 <= station_id < len(stations):
+                    raise ValueError(f"Stage {name}: unknown station {station_id}")
+                if self.station_stage[station_id] is not None:
+                    raise ValueError(f"Station {station_id} belongs to more than one stage")
+                self.station_stage[station_id] = index
+            for key in ('buffer_before', 'buffer_after'):
+                buffer_id = raw.get(key)
+                if buffer_id is not None and (not _is_index(buffer_id)
+                                              or not 0 <= buffer_id < len(buffers)):
+                    raise ValueError(f"Stage {name}: unknown {key} {buffer_id}")
+            stages.append(Stage(index, name, members, raw.get('buffer_before'),
+                                raw.get('buffer_after')))
+        if not stages:
+            raise ValueError("Topology must define at least one stage")
+        # 缓冲区须把工序连成一条链：物料放入上一工序的 buffer_after，由下一工序从同一缓冲区取料
+        if stages[0].buffer_before is not None:
+            raise ValueError(f"Stage {stages[0].name}: first stage cannot have buffer_before")
+        if stages[-1].buffer_after is not None:
+            raise ValueError(f"Stage {stages[-1].name}: last stage cannot have buffer_after")
+        for previous, stage in zip(stages, stages[1:]):
+            if stage.buffer_before != previous.buffer_after:
+                raise ValueError(f"Stage {stage.name}: buffer_before must equal buffer_after "
+                                 f"of stage {previous.name}")
+        links = [stage.buffer_after for stage in stages if stage.buffer_after is not None]
+        if len(links) != len(set(links)):
+            raise ValueError("A buffer can link only one pair of stages")
+        self.stages: Tuple[Stage, ...] = tuple(stages)
+        self.stage_names = [stage.name for stage in stages]
+
+        io = {}
+        for key, default_name in (('input', '原料区'), ('output', '成品区')):
+            raw = spec.get(key) or {}
+            if not isinstance(raw, dict):
+                raise ValueError(f"{key} must be an object")
+            position = raw.get('position')
+            if position is None:
+                # 缺省时放在首/末工序左右两侧
+                edge = stages[0] if key == 'input' else stages[-1]
+                xs = [self.station_positions[s][0] for s in edge.stations]
+                ys = [self.station_positions[s][1] for s in edge.stations]
+                x = min(xs) - 5 if key == 'input' else max(xs) + 10
+                position = [x, sum(ys) / len(ys)]
+            position = _point(position, key)
+            zone = raw.get('zone') or [position[0] - 5, position[1] - 5,
+                                       position[0] + 5, position[1] + 5]
+            io[key] = (raw.get('name', default_name), position, _box(zone, f"{key} zone"))
+        self.input_name, self.input_position, self.input_zone = io['input']
+        self.output_name, self.output_position, self.output_zone = io['output']
+
+        self.bounds = _box(spec.get('bounds') or self._auto_bounds(), "bounds")
+        self.paths = spec.get('paths') or self._auto_paths()
+        for path in _indexed_free(self.paths, 'path'):
+            coordinates = path.get('coordinates')
+            if not isinstance(coordinates, list) or len(coordinates) < 2:
+                raise ValueError(f"Path {path.get('name')}: coordinates must list at least two points")
+            for point in coordinates:
+                _point(point, f"path {path.get('name')}")
+        # 预序列化布局缓存，键为缓冲区容量（拓扑本身不可变）
+        self._serialized: Dict[Tuple[int, ...], SerializedLayout] = {}
+
+    # ------------------------------------------------------------------
+    # 兼容视图
+    # ------------------------------------------------------------------
+    @property
+    def num_stations(self) -> int:
+        return len(self.station_positions)
+
+    @property
+    def num_buffers(self) -> int:
+        return len(self.buffer_positions)
+
+    @property
+    def routes(self) -> Dict[str, List[int]]:
+        """工序名 -> 可选工位（旧 process_routes 格式）"""
+        return {stage.name: list(stage.stations) for stage in self.stages}
+
+    # ------------------------------------------------------------------
+    # 布局
+    # ------------------------------------------------------------------
+    def _auto_bounds(self) -> List[float]:
+        points = (self.station_positions + self.buffer_positions
+                  + [self.input_zone[:2], self.input_zone[2:],
+                     self.output_zone[:2], self.output_zone[2:]])
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        return [min(xs), min(ys) - 10, max(xs), max(ys) + 10]
+
+    def _auto_paths(self) -> List[Dict[str, Any]]:
+        """主路径经过单工位工序和缓冲区，并列工位各自生成一条支路"""
+        main = [list(self.input_position)]
+        branches = []
+        previous = list(self.input_position)
+        for stage in self.stages:
+            if stage.buffer_before is not None:
+                previous = list(self.buffer_positions[stage.buffer_before])
+            after = (list(self.buffer_positions[stage.buffer_after])
+                     if stage.buffer_after is not None else list(self.output_position))
+            if len(stage.stations) == 1:
+                main.append(list(self.station_positions[stage.stations[0]]))
+            else:
+                for station_id in stage.stations:
+                    branches.append({
+                        'name': f"{self.station_names[station_id]}路径",
+                        'coordinates': [previous, list(self.station_positions[station_id]), after]
+                    })
+            if stage.buffer_after is not None:
+                main.append(after)
+            previous = after
+        main.append(list(self.output_position))
+        return [{'name': '主生产线路径', 'coordinates': main}] + branches
+
+    def layout(self, buffer_capacities: Optional[List[int]] = None) -> Dict[str, Any]:
+        """生成车间布局（GeoJSON FeatureCollection）"""
+        capacities = buffer_capacities or self.buffer_capacities
+        features = [{
+            "type": "Feature",
+            "properties": {"type": "boundary", "name": "车间边界"},
+            "geometry": {"type": "Polygon", "coordinates": [_rect(self.bounds)]}
+        }]
+        for station_id, (name, position) in enumerate(
+                zip(self.station_names, self.station_positions)):
+            features.append({
+                "type": "Feature",
+                "properties": {"type": "workstation", "id": station_id, "name": name,
+                               "status": "idle"},
+                "geometry": {"type": "Point", "coordinates": list(position)}
+            })
+        for buffer_id, (name, position) in enumerate(
+                zip(self.buffer_names, self.buffer_positions)):
+            features.append({
+                "type": "Feature",
+                "properties": {"type": "buffer", "id": buffer_id, "name": name,
+                               "capacity": capacities[buffer_id], "level": 0},
+                "geometry": {"type": "Point", "coordinates": list(position)}
+            })
+        for zone_type, name, zone in (('input_zone', self.input_name, self.input_zone),
+                                      ('output_zone', self.output_name, self.output_zone)):
+            features.append({
+                "type": "Feature",
+                "properties": {"type": zone_type, "name": name},
+                "geometry": {"type": "Polygon", "coordinates": [_rect(zone)]}
+            })
+        for path in self.paths:
+            features.append({
+                "type": "Feature",
+                "properties": {"type": "path", "name": path['name']},
+                "geometry": {"type": "LineString",
+                             "coordinates": [list(p) for p in path['coordinates']]}
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+    def serialized_layout(self, buffer_capacities: Optional[List[int]] = None) -> SerializedLayout:
+        """布局的预序列化字节、gzip字节和ETag，每种缓冲区容量只生成一次"""
+        key = tuple(buffer_capacities or self.buffer_capacities)
+        cached = self._serialized.get(key)
+        if cached is None:
+            body = json.dumps(self.layout(list(key)), ensure_ascii=False,
+                              separators=(',', ':')).encode('utf-8')
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            cached = SerializedLayout(body, gzip.compress(body, 9, mtime=0), etag)
+            self._serialized[key] = cached
+        return cached
+
+
+# 按名称加载的拓扑缓存: 名称 -> (文件修改时间, Topology)
+_cache: Dict[str, Tuple[float, Topology]] = {}
+
+
+def compile_topology(topology: Union[None, str, Dict[str, Any], Topology] = None) -> Topology:
+    """
+    编译拓扑
+    :param topology: Topology实例、配置字典或 topologies/ 下的拓扑名（不接受文件路径），
+                     None表示默认拓扑；按名称加载的拓扑会被缓存，配置文件修改后重新编译
+    """
+    if isinstance(topology, Topology):
+        return topology
+    if isinstance(topology, dict):
+        return Topology(topology)
+    name = topology or DEFAULT_TOPOLOGY
+    if not isinstance(name, str):
+        raise ValueError("Topology must be a name, path or spec object")
+    path = _resolve_path(name)
+    mtime = os.path.getmtime(path)
+    cached = _cache.get(name)
+    if cached is None or cached[0] != mtime:
+        cached = _cache[name] = (mtime, Topology(load_spec(path)))
+    return cached[1]
+
+
+def build_serial_line(num_stages: int, parallel: int = 1,
+                      buffer_capacity: int = DEFAULT_BUFFER_CAPACITY,
+                      spacing: float = 10.0) -> Dict[str, Any]:
+    """
+    生成串行产线配置（用于大规模产线测试）
+    :param num_stages: 工序数
+    :param parallel: 每道工序的并列工位数
+    :param spacing: 相邻工序的水平间距（米）
+    """
+    stations, buffers, stages = [], [], []
+    for stage_index in range(num_stages):
+        x = spacing * (stage_index + 1)
+        members = []
+        for k in range(parallel):
+            y = 20 + (k - (parallel - 1) / 2) * spacing
+            members.append(len(stations))
+            stations.append({'id': len(stations),
+                             'name': f"工位{len(stations) + 1}",
+                             'position': [x, y]})
+        buffer_after = None
+        if stage_index < num_stages - 1:
+            buffer_after = len(buffers)
+            buffers.append({'id': buffer_after, 'name': f"缓存区{buffer_after + 1}",
+                            'position': [x + spacing / 2, 20]})
+        stages.append({'name': f"stage{stage_index + 1}", 'stations': members,
+                       'buffer_before': stage_index - 1 if stage_index else None,
+                       'buffer_after': buffer_after})
+    return {
+        'name': f"{num_stages}x{parallel} serial line",
+        'default_buffer_capacity': buffer_capacity,
+        'stations': stations,
+        'buffers': buffers,
+        'stages': stages,
+    }
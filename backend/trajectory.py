@@ -0,0 +1,191 @@
+"""
+物料移动轨迹
+由拓扑的工序路线表得出投料区、缓冲区、工位、成品区之间的所有跳转，沿布局中的路径（path LineString）
+预先计算每一跳的折线并编号；推送时物料每换一个位置只发一条移动段消息
+（路线编号、起止点、起止仿真时刻），客户端按路线表在本地插值动画，
+停留在原位的状态事件（排队、开始/完成加工）不再逐条推送位置
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from live_state import TERMINAL_EVENTS
+
+MSG_ROUTES = 'routes'   # 路线表
+MSG_MOVE = 'move'       # 移动段
+
+# 物料在相邻位置之间移动的可视速度（米/仿真秒），仿真中的搬运本身不耗时
+DEFAULT_MOVE_SPEED = 5.0
+
+NODE_INPUT = 'input'
+NODE_OUTPUT = 'output'
+
+
+def station_node(station_id: int) -> str:
+    return f"station:{station_id}"
+
+
+def buffer_node(buffer_id: int) -> str:
+    return f"buffer:{buffer_id}"
+
+
+def event_node(event_type: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+    """物料事件所处的位置节点"""
+    if event_type == 'part_arrived':
+        return NODE_INPUT
+    if event_type == 'part_finished':
+        return NODE_OUTPUT
+    if data.get('buffer_id') is not None:
+        return buffer_node(data['buffer_id'])
+    if data.get('workstation_id') is not None:
+        return station_node(data['workstation_id'])
+    return None
+
+
+def polyline_length(coordinates: Sequence[Sequence[float]]) -> float:
+    return sum(math.hypot(b[0] - a[0], b[1] - a[1])
+               for a, b in zip(coordinates, coordinates[1:]))
+
+
+class RoutePlanner:
+    """拓扑中各位置节点之间的路线折线（构建后只读）"""
+
+    def __init__(self, topology, speed: float = DEFAULT_MOVE_SPEED):
+        """
+        :param topology: 编译后的拓扑
+        :param speed: 物料移动的可视速度（米/仿真秒）
+        """
+        if speed <= 0:
+            raise ValueError("Move speed must be positive")
+        self.speed = speed
+        self.positions: Dict[str, Tuple[float, float]] = {
+            NODE_INPUT: tuple(topology.input_position),
+            NODE_OUTPUT: tuple(topology.output_position),
+        }
+        for station_id, position in enumerate(topology.station_positions):
+            self.positions[station_node(station_id)] = tuple(position)
+        for buffer_id, position in enumerate(topology.buffer_positions):
+            self.positions[buffer_node(buffer_id)] = tuple(position)
+        self._paths = [[tuple(p) for p in path['coordinates']] for path in topology.paths]
+
+        self.routes: List[Dict[str, Any]] = []
+        self._route_ids: Dict[Tuple[str, str], int] = {}
+        for source, target in self._edges(topology):
+            self._add_route(source, target)
+
+    @staticmethod
+    def _edges(topology) -> List[Tuple[str, str]]:
+        """按工序路线表列出物料可能的跳转"""
+        edges = []
+        exits = [NODE_INPUT]
+        for stage in topology.stages:
+            if stage.buffer_before is not None:
+                entry = buffer_node(stage.buffer_before)
+                edges.extend((node, entry) for node in exits if node != entry)
+                exits = [entry]
+            stations = [station_node(s) for s in stage.stations]
+            edges.extend((node, station) for node in exits for station in stations)
+            if stage.buffer_after is not None:
+                after = buffer_node(stage.buffer_after)
+                edges.extend((station, after) for station in stations)
+                exits = [after]
+            else:
+                exits = stations
+        edges.extend((node, NODE_OUTPUT) for node in exits)
+        return list(dict.fromkeys(edges))
+
+    def _polyline(self, start: Tuple[float, float],
+                  end: Tuple[float, float]) -> List[List[float]]:
+        """布局路径中依次经过起点和终点的最短一段，没有时取直线"""
+        best = None
+        for path in self._paths:
+            if start not in path:
+                continue
+            i = path.index(start)
+            if end not in path[i + 1:]:
+                continue
+            segment = path[i:path.index(end, i + 1) + 1]
+            if best is None or polyline_length(segment) < polyline_length(best):
+                best = segment
+        return [list(p) for p in (best or [start, end])]
+
+    def _add_route(self, source: str, target: str) -> int:
+        coordinates = self._polyline(self.positions[source], self.positions[target])
+        route_id = len(self.routes)
+        self.routes.append({
+            'id': route_id,
+            'from': source,
+            'to': target,
+            'coordinates': coordinates,
+            'length': polyline_length(coordinates),
+        })
+        self._route_ids[(source, target)] = route_id
+        return route_id
+
+    def route(self, source: str, target: str) -> Optional[int]:
+        """两节点间的路线编号，不在路线表中的跳转返回None"""
+        return self._route_ids.get((source, target))
+
+    def describe(self) -> Dict[str, Any]:
+        """路线表消息"""
+        return {
+            'type': MSG_ROUTES,
+            'data': {'speed': self.speed, 'routes': self.routes}
+        }
+
+
+class TrajectoryTracker:
+    """
+    由物料事件生成移动段（非线程安全，由推送通道在其锁内调用）：
+    物料所在节点变化时返回一条 move 消息，原地状态变化返回None
+    """
+
+    def __init__(self, planner: RoutePlanner):
+        self.planner = planner
+        # 物料ID -> 当前节点
+        self._nodes: Dict[str, str] = {}
+        self.segments = 0
+
+    def reset(self):
+        self._nodes.clear()
+
+    def observe(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        event_type = message.get('type')
+        data = message['data']
+        part_id = data['part_id']
+        if event_type in TERMINAL_EVENTS:
+            source = self._nodes.pop(part_id, None)
+        else:
+            source = self._nodes.get(part_id)
+        target = event_node(event_type, data)
+        if target is None or target == source:
+            return None
+        if event_type not in TERMINAL_EVENTS:
+            self._nodes[part_id] = target
+
+        planner = self.planner
+        end = planner.positions.get(target) or data.get('position')
+        if source is None:
+            # 新出现的物料（如投料）停在所在位置
+            route_id, start, length = None, end, 0.0
+        else:
+            start = planner.positions.get(source)
+            route_id = planner.route(source, target)
+            if route_id is None:
+                length = math.hypot(end[0] - start[0], end[1] - start[1])
+            else:
+                length = planner.routes[route_id]['length']
+        t0 = message['timestamp']
+        self.segments += 1
+        return {
+            'type': MSG_MOVE,
+            'timestamp': t0,
+            'data': {
+                'part_id': part_id,
+                'route': route_id,
+                'start': list(start),
+                'end': list(end),
+                't1': t0 + length / planner.speed,
+                'status': data.get('status', event_type),
+            }
+        }
@@ -0,0 +1,343 @@
+"""
+仿真执行器
+thread 模式在API进程的线程中运行仿真；process 模式在子进程中运行，
+事件分批经有界队列传回父进程，避免CPU密集的仿真与请求处理争抢GIL；
+可按次开启采样分析器（profile=True），分析仿真所在线程的耗时分布
+"""
+
+import multiprocessing
+import queue
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Callable, Dict, Any, Optional
+
+from metrics import SamplingProfiler
+from pacing import EventPump
+from simulation import ProductionLineSimulation
+
+MODE_THREAD = 'thread'
+MODE_PROCESS = 'process'
+MODES = (MODE_THREAD, MODE_PROCESS)
+
+# 子进程 -> 父进程的消息类型
+MSG_EVENTS = 'events'
+MSG_STATS = 'stats'
+MSG_DONE = 'done'
+MSG_ERROR = 'error'
+MSG_PROFILE = 'profile'
+
+
+class SimulationWorker(ABC):
+    """执行器基类：运行一次仿真，推送事件，结束时推送完成/停止消息"""
+
+    def __init__(self, publish: Callable[[Dict[str, Any]], None],
+                 config: Dict[str, Any], duration: float, name: str = 'simulation',
+                 event_queue_size: int = 1000, profile: bool = False):
+        """
+        :param publish: 事件推送函数
+        :param config: ProductionLineSimulation 的构造参数
+        :param duration: 仿真时长
+        :param name: 名称（会话ID），附加在完成消息中
+        :param profile: 是否对本次运行开启采样分析
+        """
+        self.publish = publish
+        self.config = dict(config)
+        self.duration = duration
+        self.name = name
+        self.event_queue_size = event_queue_size
+        self.profile = profile
+        self.running = False
+        self.stopped_early = False
+        self.error: Optional[str] = None
+        self.finished_at: Optional[float] = None
+        # 墙钟计时（monotonic），用于事件速率和仿真/墙钟时间比
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def _final_message(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": "simulation_stopped" if self.stopped_early else "simulation_completed",
+            "session_id": self.name,
+            "data": stats
+        }
+
+    @property
+    def sim_time(self) -> float:
+        return self.get_statistics().get('simulation_time', 0.0)
+
+    @property
+    def wall_seconds(self) -> float:
+        """运行的墙钟时长（运行中为截至目前）"""
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.monotonic()) - self._started
+
+    @property
+    @abstractmethod
+    def events_published(self) -> int:
+        """已推送的事件数"""
+
+    @abstractmethod
+    def queue_metrics(self) -> Dict[str, int]:
+        """仿真与推送之间事件队列的深度、最大深度、阻塞次数"""
+
+    def metrics(self) -> Dict[str, Any]:
+        """运行指标（/api/metrics）"""
+        wall = self.wall_seconds
+        events = self.events_published
+        sim_time = self.sim_time
+        return dict(
+            self.queue_metrics(),
+            events=events,
+            events_per_second=events / wall if wall > 0 else 0.0,
+            sim_time=sim_time,
+            wall_seconds=wall,
+            sim_wall_ratio=sim_time / wall if wall > 0 else 0.0,
+        )
+
+    @abstractmethod
+    def profile_summary(self) -> Optional[Dict[str, Any]]:
+        """采样分析结果，未开启时为None"""
+
+    @abstractmethod
+    def start(self):
+        """启动仿真（非阻塞）"""
+
+    @abstractmethod
+    def request_stop(self):
+        """请求提前停止"""
+
+    @abstractmethod
+    def get_statistics(self) -> Dict[str, Any]:
+        """当前统计数据"""
+
+
+class ThreadWorker(SimulationWorker):
+    """在线程中运行仿真"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 仿真线程经有界队列把事件交给推送线程，队列满时仿真线程等待
+        self.pump = EventPump(self.publish, maxsize=self.event_queue_size,
+                              name=f"event-pump-{self.name}")
+        self.simulation = ProductionLineSimulation(callback=self.pump.put, **self.config)
+        self._thread = threading.Thread(target=self._run, name=f"simulation-{self.name}",
+                                        daemon=True)
+        self.profiler = SamplingProfiler() if self.profile else None
+
+    def start(self):
+        self.running = True
+        self._started = time.monotonic()
+        self.pump.start()
+        self._thread.start()
+
+    def _run(self):
+        if self.profiler is not None:
+            self.profiler.start(threading.get_ident())
+        try:
+            self.simulation.run(until=self.duration)
+        except Exception as e:
+            self.error = str(e)
+            raise
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            self.running = False
+            self.stopped_early = self.simulation.stopped_early
+            self._finished = time.monotonic()
+            self.finished_at = time.time()
+            # 结束消息经同一队列发送，保证在所有事件之后到达
+            self.pump.put(self._final_message(self.simulation.get_statistics()))
+            self.pump.close()
+
+    def request_stop(self):
+        self.simulation.request_stop()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return self.simulation.get_statistics()
+
+    @property
+    def sim_time(self) -> float:
+        return self.simulation.env.now
+
+    @property
+    def events_published(self) -> int:
+        return self.pump.published
+
+    def queue_metrics(self) -> Dict[str, int]:
+        return {
+            'queue_depth': self.pump.depth,
+            'queue_max_depth': self.pump.max_depth,
+            'blocked_puts': self.pump.blocked_puts,
+        }
+
+    def profile_summary(self) -> Optional[Dict[str, Any]]:
+        return self.profiler.summary() if self.profiler is not None else None
+
+
+def _process_main(config: Dict[str, Any], duration: float, out_queue,
+                  stop_event, batch_size: int, stats_interval: float,
+                  profile: bool = False):
+    """子进程入口：运行仿真，分批回传事件和统计快照（开启分析时结束前回传采样结果）"""
+    batch = []
+    last_stats = time.monotonic()
+    realtime = config.get('realtime_factor') is not None
+    # 实时回放时逐条回传，保证推送节奏；否则按批回传以减少进程间通信
+    flush_size = 1 if realtime else batch_size
+    sim: Optional[ProductionLineSimulation] = None
+    profiler = SamplingProfiler() if profile else None
+
+    def flush():
+        if batch:
+            out_queue.put((MSG_EVENTS, list(batch)))
+            batch.clear()
+
+    def on_event(event):
+        nonlocal last_stats
+        batch.append(event)
+        if len(batch) >= flush_size:
+            flush()
+        now = time.monotonic()
+        if now - last_stats >= stats_interval:
+            last_stats = now
+            flush()
+            out_queue.put((MSG_STATS, sim.get_statistics()))
+            if profiler is not None:
+                out_queue.put((MSG_PROFILE, profiler.summary()))
+
+    done = threading.Event()
+
+    def watch_stop():
+        # 父进程的停止请求通过 request_stop() 传入仿真
+        while not done.is_set():
+            if stop_event.wait(0.1):
+                sim.request_stop()
+                return
+
+    try:
+        sim = ProductionLineSimulation(callback=on_event, **config)
+        out_queue.put((MSG_STATS, sim.get_statistics()))
+        watcher = threading.Thread(target=watch_stop, daemon=True)
+        watcher.start()
+        if profiler is not None:
+            profiler.start()
+        sim.run(until=duration)
+        done.set()
+        flush()
+        if profiler is not None:
+            profiler.stop()
+            out_queue.put((MSG_PROFILE, profiler.summary()))
+        out_queue.put((MSG_DONE, sim.get_statistics(), sim.stopped_early))
+    except Exception as e:
+        done.set()
+        flush()
+        if profiler is not None:
+            profiler.stop()
+        out_queue.put((MSG_ERROR, repr(e), sim.get_statistics() if sim else {}))
+
+
+class ProcessWorker(SimulationWorker):
+    """在子进程中运行仿真"""
+
+    def __init__(self, *args, batch_size: int = 256, stats_interval: float = 0.5,
+                 start_method: str = 'spawn', **kwargs):
+        super().__init__(*args, **kwargs)
+        ctx = multiprocessing.get_context(start_method)
+        # 队列按批计数，满时子进程阻塞
+        self._queue = ctx.Queue(maxsize=max(1, self.event_queue_size // batch_size) + 4)
+        self._stop_event = ctx.Event()
+        self._process = ctx.Process(
+            target=_process_main,
+            args=(self.config, self.duration, self._queue, self._stop_event,
+                  batch_size, stats_interval, self.profile),
+            name=f"simulation-{self.name}",
+            daemon=True
+        )
+        self._reader = threading.Thread(target=self._read, name=f"reader-{self.name}",
+                                        daemon=True)
+        self._statistics: Dict[str, Any] = {}
+        self._profile: Optional[Dict[str, Any]] = None
+        self.events_received = 0
+        self._max_depth = 0
+
+    def start(self):
+        self.running = True
+        self._started = time.monotonic()
+        self._process.start()
+        self._reader.start()
+
+    def _read(self):
+        """读取子进程消息并推送事件"""
+        try:
+            while True:
+                try:
+                    message = self._queue.get(timeout=1.0)
+                except queue.Empty:
+                    if not self._process.is_alive():
+                        self.error = self.error or f"Worker exited with code {self._process.exitcode}"
+                        break
+                    continue
+
+                kind = message[0]
+                depth = self._queue_depth() + 1
+                if depth > self._max_depth:
+                    self._max_depth = depth
+                if kind == MSG_EVENTS:
+                    for event in message[1]:
+                        self.publish(event)
+                    self.events_received += len(message[1])
+                elif kind == MSG_STATS:
+                    self._statistics = message[1]
+                elif kind == MSG_PROFILE:
+                    self._profile = message[1]
+                elif kind == MSG_DONE:
+                    self._statistics, self.stopped_early = message[1], message[2]
+                    break
+                elif kind == MSG_ERROR:
+                    self.error, self._statistics = message[1], message[2]
+                    break
+        finally:
+            self.running = False
+            self._finished = time.monotonic()
+            self.finished_at = time.time()
+            self.publish(self._final_message(self._statistics))
+            self._process.join(timeout=5)
+
+    def request_stop(self):
+        self._stop_event.set()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return self._statistics
+
+    @property
+    def events_published(self) -> int:
+        return self.events_received
+
+    def _queue_depth(self) -> int:
+        try:
+            return self._queue.qsize()
+        except NotImplementedError:  # macOS 不支持 qsize
+            return 0
+
+    def queue_metrics(self) -> Dict[str, int]:
+        # 进程间队列按批计数，深度为排队的批数；子进程在队列满时阻塞，次数不可见
+        return {
+            'queue_depth': self._queue_depth(),
+            'queue_max_depth': self._max_depth,
+            'blocked_puts': 0,
+        }
+
+    def profile_summary(self) -> Optional[Dict[str, Any]]:
+        if not self.profile:
+            return None
+        return self._profile or {'samples': 0, 'running': self.running, 'functions': []}
+
+
+def create_worker(mode: str, *args, **kwargs) -> SimulationWorker:
+    """按模式创建执行器"""
+    if mode == MODE_THREAD:
+        return ThreadWorker(*args, **kwargs)
+    if mode == MODE_PROCESS:
+        return ProcessWorker(*args, **kwargs)
+    raise ValueError(f"Unknown execution mode: {mode}")
@@ -0,0 +1,59 @@
+"""
+快速模式基准测试
+对比完整事件模式（事件日志 + 回调）与快速模式的仿真耗时
+用法: python benchmarks/bench_fast_mode.py [仿真时长] [重复次数]
+"""
+
+import sys
+import os
+import time
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from simulation import ProductionLineSimulation
+
+
+def _noop_callback(event):
+    pass
+
+
+def time_run(repeats: int, until: float, **kwargs):
+    """多次运行取最短耗时，返回 (耗时, 统计数据)"""
+    best = float('inf')
+    stats = None
+    for _ in range(repeats):
+        sim = ProductionLineSimulation(seed=42, **kwargs)
+        start = time.perf_counter()
+        stats = sim.run(until=until)
+        best = min(best, time.perf_counter() - start)
+    return best, stats
+
+
+def main():
+    until = float(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    modes = [
+        ('完整模式（日志+回调）', {'callback': _noop_callback}),
+        ('仅事件日志', {}),
+        ('快速模式（无回调、不记录日志）', {'record_events': False}),
+    ]
+
+    print(f"仿真时长: {until:.0f}秒, 重复: {repeats}次")
+    results = {}
+    for name, kwargs in modes:
+        elapsed, stats = time_run(repeats, until, **kwargs)
+        results[name] = (elapsed, stats)
+        print(f"  {name:<16} {elapsed:8.3f}s  已生产 {stats['parts_produced']}件")
+
+    baseline = results[modes[0][0]][0]
+    fast_elapsed, fast_stats = results[modes[-1][0]]
+    print(f"快速模式加速比: {baseline / fast_elapsed:.2f}x")
+
+    # 相同种子下统计结果必须一致
+    assert fast_stats == results[modes[0][0]][1], "快速模式统计结果与完整模式不一致"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+性能基准套件
+测量仿真事件吞吐（不同时长和产线规模）、事件日志与统计的内存增长、
+get_statistics 延迟，以及 WebSocket 推送通道对 N 个本地模拟客户端的广播吞吐；
+整套测量重复 --runs 次，每个指标取各次中的最好值（干扰只会使测量变慢）后保存为JSON，并与基准结果对比，
+任一参与判定的指标劣化超过容差时以非零状态退出（尾延迟等波动大的指标只报告不判定）
+用法: python benchmarks/bench_suite.py [--quick] [--runs 3] [--output 结果.json]
+                                      [--baseline benchmarks/baseline.json]
+                                      [--save-baseline] [--tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from connections import ConnectionManager
+from simulation import ProductionLineSimulation
+from topology import build_serial_line
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# 指标方向：吞吐越高越好，耗时和内存越低越好
+HIGHER = 'higher'
+LOWER = 'lower'
+
+# 产线规模：名称 -> 拓扑（None为默认9工位产线）
+LINES = {
+    'default': None,
+    '10x2': build_serial_line(10, parallel=2),
+    '20x3': build_serial_line(20, parallel=3),
+}
+
+
+def metric(value: float, unit: str, better: str, gate: bool = True) -> Dict[str, Any]:
+    """
+    :param gate: 是否参与基准对比的劣化判定
+    """
+    return {'value': value, 'unit': unit, 'better': better, 'gate': gate}
+
+
+def best_results(runs: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """多次运行的逐指标最好值（吞吐取最大，耗时和内存取最小），保留各次取值"""
+    results = {}
+    for name, first in runs[0].items():
+        samples = [run[name]['value'] for run in runs]
+        best = max(samples) if first['better'] == HIGHER else min(samples)
+        results[name] = dict(first, value=best, samples=samples)
+    return results
+
+
+def best_of(repeats: int, func: Callable[[], Any]) -> float:
+    """多次运行取最短耗时"""
+    best = float('inf')
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_simulation(horizons: List[float], repeats: int) -> Dict[str, Dict[str, Any]]:
+    """仿真吞吐：完整事件模式的事件数/秒，快速模式的仿真秒/墙钟秒"""
+    results = {}
+    for line, topology in LINES.items():
+        for horizon in horizons:
+            # 短时长的单次测量只有百毫秒级，按比例增加重复次数以抑制调度噪声
+            horizon_repeats = repeats * max(1, round(max(horizons) / horizon))
+            counter = [0]
+
+            def count(event):
+                counter[0] += 1
+
+            def run_events():
+                counter[0] = 0
+                ProductionLineSimulation(callback=count, record_events=False, seed=42,
+                                         topology=topology).run(until=horizon)
+
+            def run_fast():
+                ProductionLineSimulation(record_events=False, seed=42,
+                                         topology=topology).run(until=horizon)
+
+            elapsed = best_of(horizon_repeats, run_events)
+            results[f'sim.events_per_second.{line}.h{horizon:g}'] = metric(
+                counter[0] / elapsed, 'events/s', HIGHER)
+            elapsed = best_of(horizon_repeats, run_fast)
+            results[f'sim.fast_mode_sim_seconds_per_second.{line}.h{horizon:g}'] = metric(
+                horizon / elapsed, 'sim-s/s', HIGHER)
+    return results
+
+
+def bench_memory(horizons: List[float]) -> Dict[str, Dict[str, Any]]:
+    """仿真结束后仿真对象保留的内存（事件日志不限容量/默认容量/快速模式）"""
+    variants = [
+        ('event_log_unbounded', {'event_log_capacity': None}),
+        ('event_log_bounded', {}),
+        ('fast_mode', {'record_events': False}),
+    ]
+    results = {}
+    for name, kwargs in variants:
+        for horizon in horizons:
+            gc.collect()
+            tracemalloc.start()
+            sim = ProductionLineSimulation(seed=42, **kwargs)
+            sim.run(until=horizon)
+            gc.collect()
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del sim
+            results[f'memory.{name}.h{horizon:g}'] = metric(
+                retained / 1024 / 1024, 'MiB', LOWER)
+    return results
+
+
+def bench_statistics(horizon: float, calls: int) -> Dict[str, Dict[str, Any]]:
+    """长时间运行后 get_statistics 的单次延迟"""
+    sim = ProductionLineSimulation(record_events=False, seed=42)
+    sim.run(until=horizon)
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        sim.get_statistics()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'stats.get_statistics_median': metric(statistics.median(samples) * 1e3, 'ms', LOWER),
+        # 尾延迟受调度和GC影响，单机上可相差一倍以上，只报告不判定
+        'stats.get_statistics_p99': metric(
+            samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e3, 'ms', LOWER,
+            gate=False),
+    }
+
+
+class _FakeWebSocket:
+    """本地模拟客户端：按真实发送路径序列化消息，但不经过网络"""
+
+    def __init__(self, query: Dict[str, str]):
+        self.query_params = query
+        self.bytes_sent = 0
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self.bytes_sent += len(json.dumps(message, ensure_ascii=False))
+
+    async def send_bytes(self, data: bytes):
+        self.bytes_sent += len(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def _fanout(events: List[Dict[str, Any]], num_clients: int,
+                  query: Dict[str, str]) -> float:
+    """从推送线程发布全部事件，返回所有客户端发送完成的耗时"""
+    manager = ConnectionManager()
+    query = dict(query, max_queue=str(len(events) + 1))
+    clients = [await manager.connect(_FakeWebSocket(query)) for _ in range(num_clients)]
+    writers = [asyncio.create_task(manager.serve(client)) for client in clients]
+    total = len(events)
+
+    start = time.perf_counter()
+    publisher = threading.Thread(target=lambda: [manager.publish(e) for e in events])
+    publisher.start()
+    while any(client.sent + client.dropped < total for client in clients):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    publisher.join()
+
+    for writer in writers:
+        writer.cancel()
+    await asyncio.gather(*writers, return_exceptions=True)
+    return elapsed
+
+
+def bench_broadcast(client_counts: List[int], num_events: int,
+                    repeats: int) -> Dict[str, Dict[str, Any]]:
+    """推送通道对 N 个客户端的投递吞吐（消息数/秒）；合帧大小随线程调度波动，取多次中最快的一次"""
+    events: List[Dict[str, Any]] = []
+    sim = ProductionLineSimulation(callback=events.append, record_events=False, seed=42)
+    while len(events) < num_events:
+        sim.run(until=sim.env.now + 500)
+    events = events[:num_events]
+
+    protocols = {
+        'json': {},
+        'binary': {'protocol': 'binary', 'batch_ms': '1'},
+    }
+    results = {}
+    for protocol, query in protocols.items():
+        for num_clients in client_counts:
+            elapsed = min(asyncio.run(_fanout(events, num_clients, query))
+                          for _ in range(repeats))
+            results[f'ws.messages_per_second.{protocol}.c{num_clients}'] = metric(
+                num_events * num_clients / elapsed, 'msg/s', HIGHER)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    """与基准对比，返回劣化超过容差的指标说明"""
+    regressions = []
+    print(f"\n与基准对比（容差 {tolerance:.0%}）:")
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None or not reference['value']:
+            print(f"  {name:<58} {'(无基准)':>12}")
+            continue
+        change = current['value'] / reference['value'] - 1
+        worse = -change if current['better'] == HIGHER else change
+        flag = ''
+        if not current.get('gate', True):
+            flag = '  (不参与判定)'
+        elif worse > tolerance:
+            flag = '  <-- 劣化'
+            regressions.append(f"{name}: {reference['value']:.4g} -> {current['value']:.4g} "
+                               f"{current['unit']}")
+        print(f"  {name:<58} {change:+11.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="仿真与推送性能基准套件")
+    parser.add_argument('--quick', action='store_true', help="缩短时长和规模（冒烟检查）")
+    parser.add_argument('--output', help="结果JSON文件路径")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基准结果JSON文件")
+    parser.add_argument('--save-baseline', action='store_true', help="将本次结果保存为基准")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="允许的相对劣化比例（默认0.25）")
+    parser.add_argument('--runs', type=int, default=3,
+                        help="整套测量的重复次数，各指标取最好值（默认3）")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    if args.quick:
+        horizons, memory_horizons, repeats = [1000, 5000], [1000, 5000], 1
+        client_counts, num_events, stat_calls = [1, 10], 2000, 200
+    else:
+        horizons, memory_horizons, repeats = [2000, 20000], [5000, 20000, 50000], 3
+        client_counts, num_events, stat_calls = [1, 10, 100], 5000, 1000
+
+    runs: List[Dict[str, Dict[str, Any]]] = []
+    for index in range(args.runs):
+        print(f"第 {index + 1}/{args.runs} 次:")
+        run_results: Dict[str, Dict[str, Any]] = {}
+        for title, run in [
+            ("仿真吞吐", lambda: bench_simulation(horizons, repeats)),
+            ("内存", lambda: bench_memory(memory_horizons)),
+            ("统计延迟", lambda: bench_statistics(max(horizons), stat_calls)),
+            ("WebSocket广播", lambda: bench_broadcast(client_counts, num_events, repeats)),
+        ]:
+            print(f"{title}:")
+            section = run()
+            for name, m in section.items():
+                print(f"  {name:<58} {m['value']:12.4g} {m['unit']}")
+            run_results.update(section)
+        runs.append(run_results)
+
+    results = best_results(runs)
+    if args.runs > 1:
+        print(f"\n{args.runs} 次中的最好值:")
+        for name, m in results.items():
+            print(f"  {name:<58} {m['value']:12.4g} {m['unit']}")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'runs': args.runs,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"基准已更新: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\n未找到基准文件 {args.baseline}，跳过对比（--save-baseline 生成）")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('quick') != args.quick:
+        print("\n基准与本次运行的规模不同（--quick），跳过对比")
+        return
+
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if regressions:
+        print("\n性能劣化:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n未发现超过容差的劣化")
+
+
+if __name__ == '__main__':
+    main()
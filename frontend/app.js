@@ -10,6 +10,8 @@ let partsLayer;
 let workshopLayer;
 let ws;
 let partFeatures = {};  // 存储物料要素
+let workstationFeatures = [];  // 工位要素（按工位ID索引，来自布局接口）
+let bufferFeatures = [];  // 缓冲区要素（按缓冲区ID索引）
 
 // 初始化地图
 function initMap() {
@@ -205,6 +207,17 @@ async function loadWorkshopLayout() {
         const features = new ol.format.GeoJSON().readFeatures(geojson);
         workshopLayer.getSource().addFeatures(features);
 
+        // 工位数量和名称由后端拓扑决定
+        workstationFeatures = [];
+        bufferFeatures = [];
+        features.forEach(f => {
+            if (f.get('type') === 'workstation') {
+                workstationFeatures[f.get('id')] = f;
+            } else if (f.get('type') === 'buffer') {
+                bufferFeatures[f.get('id')] = f;
+            }
+        });
+
         // 自适应缩放
         const extent = workshopLayer.getSource().getExtent();
         map.getView().fit(extent, {
@@ -217,12 +230,125 @@ async function loadWorkshopLayout() {
     }
 }
 
+// 二进制批量协议解码器（格式说明见 backend/protocol.py）
+class BinaryFrameDecoder {
+    constructor() {
+        this.strings = [];
+        this.textDecoder = new TextDecoder();
+    }
+
+    // 解码一帧，返回消息数组（压缩帧需要异步解压）
+    async decode(buffer) {
+        const header = new Uint8Array(buffer, 0, 2);
+        if (header[0] !== 0xB1) {
+            throw new Error('Not a binary event frame');
+        }
+        let payload = buffer.slice(2);
+        if (header[1] & 0x01) {
+            const stream = new Blob([payload]).stream()
+                .pipeThrough(new DecompressionStream('deflate'));
+            payload = await new Response(stream).arrayBuffer();
+        }
+        return this.decodePayload(payload);
+    }
+
+    decodePayload(payload) {
+        const view = new DataView(payload);
+        const bytes = new Uint8Array(payload);
+        let pos = 0;
+
+        const readVarint = () => {
+            let result = 0;
+            let shift = 0;
+            let byte;
+            do {
+                byte = bytes[pos++];
+                result += (byte & 0x7F) * Math.pow(2, shift);
+                shift += 7;
+            } while (byte & 0x80);
+            return result;
+        };
+        const readText = () => {
+            const length = readVarint();
+            const text = this.textDecoder.decode(bytes.subarray(pos, pos + length));
+            pos += length;
+            return text;
+        };
+        const readValue = () => {
+            const tag = bytes[pos++];
+            switch (tag) {
+                case 0x00: return null;
+                case 0x01: return true;
+                case 0x02: return false;
+                case 0x03: {
+                    const raw = readVarint();
+                    return raw % 2 === 0 ? raw / 2 : -(raw + 1) / 2;
+                }
+                case 0x04: {
+                    const value = view.getFloat64(pos, true);
+                    pos += 8;
+                    return value;
+                }
+                case 0x05: return this.strings[readVarint()];
+                case 0x06: {
+                    const point = [view.getFloat32(pos, true), view.getFloat32(pos + 4, true)];
+                    pos += 8;
+                    return point;
+                }
+                case 0x07: return JSON.parse(readText());
+                default: throw new Error(`Unknown value tag: ${tag}`);
+            }
+        };
+
+        const messages = [];
+        while (pos < bytes.length) {
+            const record = bytes[pos++];
+            switch (record) {
+                case 0x01: {
+                    const id = readVarint();
+                    this.strings[id] = readText();
+                    break;
+                }
+                case 0x02: {
+                    const timestamp = view.getFloat64(pos, true);
+                    pos += 8;
+                    const type = this.strings[readVarint()];
+                    const count = readVarint();
+                    const data = {};
+                    for (let i = 0; i < count; i++) {
+                        const key = this.strings[readVarint()];
+                        data[key] = readValue();
+                    }
+                    messages.push({ timestamp, type, data });
+                    break;
+                }
+                case 0x03:
+                    messages.push(JSON.parse(readText()));
+                    break;
+                case 0x04:
+                    this.strings = [];
+                    break;
+                default:
+                    throw new Error(`Unknown record type: ${record}`);
+            }
+        }
+        return messages;
+    }
+}
+
 // WebSocket连接
 function connectWebSocket() {
     // 自动适配协议：HTTPS使用wss://，HTTP使用ws://
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws`;
+    // 协商二进制批量协议，浏览器支持解压时启用压缩；订阅状态快照以便中途加入时同步
+    const compress = typeof DecompressionStream !== 'undefined' ? 1 : 0;
+    const wsUrl = `${protocol}//${window.location.host}/ws?protocol=binary&batch_ms=50&compress=${compress}&state=1`;
     ws = new WebSocket(wsUrl);
+    ws.binaryType = 'arraybuffer';
+
+    const decoder = new BinaryFrameDecoder();
+    // 保证异步解压后的帧按到达顺序处理
+    let frameChain = Promise.resolve();
 
     ws.onopen = () => {
         console.log('WebSocket connected');
@@ -230,8 +356,20 @@ function connectWebSocket() {
     };
 
     ws.onmessage = (event) => {
-        const message = JSON.parse(event.data);
-        handleSimulationEvent(message);
+        if (typeof event.data === 'string') {
+            // JSON格式（协议确认或兼容模式下的单条事件）
+            handleSimulationEvent(JSON.parse(event.data));
+            return;
+        }
+
+        const buffer = event.data;
+        frameChain = frameChain
+            .then(() => decoder.decode(buffer))
+            .then(messages => {
+                messages.forEach(applySimulationEvent);
+                updateStatistics();
+            })
+            .catch(error => console.error('Failed to decode frame:', error));
     };
 
     ws.onerror = (error) => {
@@ -247,8 +385,24 @@ function connectWebSocket() {
 
 // 处理仿真事件
 function handleSimulationEvent(event) {
+    applySimulationEvent(event);
+
+    // 更新统计信息
+    updateStatistics();
+}
+
+// 应用单条仿真事件到地图（批量帧中的每条事件逐一调用）
+function applySimulationEvent(event) {
     const { type, data, timestamp } = event;
 
+    if (type === 'protocol') {
+        return;
+    }
+    if (type === 'snapshot' || type === 'keyframe') {
+        applyStateSnapshot(data);
+        return;
+    }
+
     // 记录日志
     addLog(type, JSON.stringify(data), timestamp);
 
@@ -282,9 +436,39 @@ function handleSimulationEvent(event) {
             handleSimulationCompleted(data);
             break;
     }
+}
 
-    // 更新统计信息
-    updateStatistics();
+// 用状态快照/关键帧重建物料位置、工位状态和缓冲区水平
+function applyStateSnapshot(data) {
+    const present = new Set();
+    data.parts.forEach(([partId, status, x, y]) => {
+        if (x === null || y === null) {
+            return;
+        }
+        present.add(partId);
+        const feature = partFeatures[partId];
+        if (feature) {
+            feature.getGeometry().setCoordinates([x, y]);
+        } else {
+            createPartFeature({ part_id: partId, position: [x, y] });
+        }
+        partFeatures[partId].set('status', status);
+    });
+    Object.keys(partFeatures).forEach(partId => {
+        if (!present.has(partId)) {
+            removePartFeature(partId);
+        }
+    });
+
+    const busy = new Set(data.busy_stations);
+    workstationFeatures.forEach((feature, id) => {
+        feature.set('status', busy.has(id) ? 'busy' : 'idle');
+        feature.changed();
+    });
+    bufferFeatures.forEach((feature, id) => {
+        feature.set('level', data.buffer_levels[id] || 0);
+        feature.changed();
+    });
 }
 
 // 创建物料要素
@@ -354,10 +538,7 @@ function removePartFeature(partId) {
 
 // 更新工位状态
 function updateWorkstationStatus(workstationId, status) {
-    const features = workshopLayer.getSource().getFeatures();
-    const workstation = features.find(f =>
-        f.get('type') === 'workstation' && f.get('id') === workstationId
-    );
+    const workstation = workstationFeatures[workstationId];
 
     if (workstation) {
         workstation.set('status', status);
@@ -396,24 +577,13 @@ function updateWorkstationUtilization(utilization) {
     const container = document.getElementById('workstationStats');
     container.innerHTML = '';
 
-    // 9个工位的名称
-    const workstationNames = [
-        '工位1-预处理',
-        '工位2-粗加工A',
-        '工位3-粗加工B',
-        '工位4-精加工A',
-        '工位5-精加工B',
-        '工位6-组装',
-        '工位7-质检A',
-        '工位8-质检B',
-        '工位9-包装'
-    ];
-
     utilization.forEach((util, index) => {
+        const feature = workstationFeatures[index];
+        const name = feature ? feature.get('name') : `工位${index + 1}`;
         const div = document.createElement('div');
         div.className = 'workstation-status';
         div.innerHTML = `
-            <div class="workstation-name">${workstationNames[index]}</div>
+            <div class="workstation-name">${name}</div>
             <div class="workstation-util">利用率: ${(util * 100).toFixed(1)}%</div>
             <div class="utilization-bar">
                 <div class="utilization-fill" style="width: ${util * 100}%"></div>
@@ -458,6 +628,7 @@ function handleSimulationCompleted(stats) {
 // 开始仿真
 async function startSimulation() {
     const duration = parseFloat(document.getElementById('duration').value);
+    const speed = parseFloat(document.getElementById('speed').value);
 
     // 清空物料
     vectorSource.clear();
@@ -479,11 +650,11 @@ async function startSimulation() {
     document.getElementById('logContainer').innerHTML = '';
 
     try {
-        const response = await fetch(`/api/simulation/start?duration=${duration}`, {
+        const response = await fetch(`/api/simulation/start?duration=${duration}&speed=${speed}`, {
             method: 'POST'
         });
         const data = await response.json();
-        addLog('system', `启动仿真，时长: ${duration}秒`);
+        addLog('system', `启动仿真，时长: ${duration}秒，速度: ${speed > 0 ? speed + 'x' : '最快'}`);
     } catch (error) {
         console.error('Failed to start simulation:', error);
         addLog('error', '启动仿真失败');
@@ -87,6 +87,212 @@ print(f"   要素类型: FeatureCollection")
 print(f"   要素数量: {len(layout['features'])}")
 print()
 
+# 测试4: 事件回放定位
+print("📋 测试4: 事件回放定位")
+print("-" * 60)
+
+from live_state import LiveState
+from replay import ReplayIndex
+
+replay_events = [dict(e) for e in events_log if isinstance(e.get('data'), dict)
+                 and 'part_id' in e['data']]
+interval = 16
+replay_events = replay_events[:len(replay_events) // interval * interval]
+index = ReplayIndex(replay_events, keyframe_interval=interval)
+full_state = LiveState()
+for event in replay_events:
+    full_state.apply(event)
+# 事件数为关键帧间隔的整数倍时定位到末尾
+end_state = index.state_at(1e9)
+assert end_state.parts == full_state.parts, "末尾定位状态与完整重放不一致"
+assert end_state.buffer_levels == full_state.buffer_levels
+assert index.state_at(index.end_time).seq == len(replay_events)
+assert len(ReplayIndex([]).state_at(10).parts) == 0
+print(f"✅ 回放索引定位正确")
+print(f"   事件数: {len(index)}, 关键帧: {len(index.keyframes)}")
+print()
+
+# 测试5: 拓扑校验
+print("📋 测试5: 拓扑校验")
+print("-" * 60)
+
+from topology import compile_topology
+
+invalid_topologies = {
+    "下一工序不从上一工序的缓冲区取料": {
+        'stages': [{'stations': [0], 'buffer_after': 0}, {'stations': [1]}]},
+    "首道工序有 buffer_before": {
+        'stages': [{'stations': [0], 'buffer_before': 0, 'buffer_after': 1},
+                   {'stations': [1], 'buffer_before': 1}]},
+}
+for reason, stages in invalid_topologies.items():
+    spec = dict(stages,
+                stations=[{'position': [10, 20]}, {'position': [20, 20]}],
+                buffers=[{'position': [15, 20]}, {'position': [15, 25]}])
+    try:
+        compile_topology(spec)
+    except ValueError:
+        print(f"✅ 已拒绝: {reason}")
+    else:
+        raise AssertionError(f"未拒绝: {reason}")
+print()
+
+# 测试6: 检查点恢复
+print("📋 测试6: 检查点恢复")
+print("-" * 60)
+
+import pickle
+from dispatch import DISPATCH_POLICIES
+
+
+def statistics_key(stats):
+    return json.dumps(stats, sort_keys=True)
+
+
+for policy in DISPATCH_POLICIES:
+    config = {'seed': 7, 'dispatch_policy': policy, 'record_events': False}
+    continuous = ProductionLineSimulation(**config)
+    continuous.run(until=1500)
+    paused = ProductionLineSimulation(**config)
+    paused.run(until=500)
+    checkpoint = pickle.loads(pickle.dumps(paused.checkpoint()))
+    resumed = ProductionLineSimulation.from_checkpoint(checkpoint, record_events=False)
+    resumed.run(until=1500)
+    assert statistics_key(resumed.get_statistics()) == \
+        statistics_key(continuous.get_statistics()), f"{policy}: 恢复后结果与连续运行不一致"
+    print(f"✅ {policy}: 检查点恢复与连续运行一致")
+print()
+
+# 测试7: 线程/进程执行器
+print("📋 测试7: 线程/进程执行器")
+print("-" * 60)
+
+import multiprocessing
+import threading
+from workers import MODE_PROCESS, MODE_THREAD, create_worker
+
+worker_config = {'seed': 11, 'record_events': False}
+reference_events = []
+reference = ProductionLineSimulation(
+    callback=lambda e: reference_events.append((e['timestamp'], e['type'], e['data'])),
+    **worker_config)
+reference.run(until=300)
+
+
+def run_worker(mode, **kwargs):
+    messages = []
+    done = threading.Event()
+
+    def publish(message):
+        messages.append(message)
+        if message['type'] in ('simulation_completed', 'simulation_stopped'):
+            done.set()
+
+    worker = create_worker(mode, publish, worker_config, 300, **kwargs)
+    worker.start()
+    assert done.wait(60), f"{mode}: 执行器未结束"
+    return messages
+
+
+worker_modes = [(MODE_THREAD, {})]
+# 子进程以spawn启动时会重新执行本脚本，仅在支持fork的平台上测试进程模式
+if 'fork' in multiprocessing.get_all_start_methods():
+    worker_modes.append((MODE_PROCESS, {'start_method': 'fork'}))
+for mode, kwargs in worker_modes:
+    messages = run_worker(mode, **kwargs)
+    final = messages.pop()
+    assert [(e['timestamp'], e['type'], e['data']) for e in messages] == reference_events, \
+        f"{mode}: 事件流与直接运行不一致"
+    assert statistics_key(final['data']) == statistics_key(reference.get_statistics()), \
+        f"{mode}: 统计与直接运行不一致"
+    print(f"✅ {mode}: 事件流和统计与直接运行一致 ({len(messages)}条事件)")
+print()
+
+# 测试8: 二进制协议编解码
+print("📋 测试8: 二进制协议编解码")
+print("-" * 60)
+
+from protocol import FLAG_COMPRESSED, BinaryDecoder, BinaryEncoder
+
+protocol_messages = [
+    {'timestamp': 1.5, 'type': 'part_in_buffer',
+     'data': {'part_id': 'PART-0001', 'buffer_id': 3, 'buffer_level': -7, 'big': 2 ** 40,
+              'duration': 4.125, 'position': [10.5, -20.25], 'status': None,
+              'ok': True, 'failed': False, 'route': [[0, 0], [1, 2], [3, 4]],
+              'meta': {'stage': '工序1'}}},
+    {'type': 'statistics', 'data': {'throughput': 0.2}},
+    {'timestamp': 2.0, 'type': 'part_finished', 'data': {'part_id': 'PART-0001'}},
+]
+for compress in (False, True):
+    encoder = BinaryEncoder(compress=compress, compress_min_bytes=0)
+    decoder = BinaryDecoder()
+    frame = encoder.encode(protocol_messages)
+    assert bool(frame[1] & FLAG_COMPRESSED) == compress
+    assert decoder.decode(frame) == protocol_messages, "编解码结果不一致"
+    # 后续帧复用字符串表
+    assert decoder.decode(encoder.encode(protocol_messages[2:])) == protocol_messages[2:]
+
+# 字符串表达到上限时发送RESET，解码端同步清空
+encoder = BinaryEncoder(max_strings=8)
+decoder = BinaryDecoder()
+for i in range(20):
+    message = {'timestamp': float(i), 'type': 'part_arrived',
+               'data': {'part_id': f"PART-{i:04d}", 'status': 'arrived'}}
+    assert decoder.decode(encoder.encode([message])) == [message], "字符串表重建后解码不一致"
+    assert len(decoder._strings) == len(encoder._strings)
+# 20个不同的物料ID超过上限，字符串表必然重建过
+assert len(encoder._strings) <= 8
+print("✅ 压缩/非压缩帧、字符串表重建及各类字段值编解码一致")
+print()
+
+# 测试9: 随机数流与公共随机数
+print("📋 测试9: 随机数流与公共随机数")
+print("-" * 60)
+
+from experiments import run_comparison
+from rng import RNG_BACKENDS, RandomStreams, derive_seed, np
+
+assert derive_seed(3, 'arrivals') == derive_seed(3, 'arrivals')
+assert len({derive_seed(3, 'arrivals'), derive_seed(3, 'routing'),
+            derive_seed(4, 'arrivals')}) == 3
+for backend in RNG_BACKENDS:
+    if backend != 'python' and np is None:
+        continue
+    quiet = RandomStreams(3, 2, backend)
+    busy = RandomStreams(3, 2, backend)
+    arrivals = []
+    for _ in range(100):
+        arrivals.append(busy.arrivals.exponential(5.0))
+        # 其他用途的抽样不影响到达流
+        busy.routing.random()
+        busy.processing[0].normal(5.0, 1.0)
+    assert arrivals == [quiet.arrivals.exponential(5.0) for _ in range(100)], \
+        f"{backend}: 到达流受其他用途抽样影响"
+    assert [quiet.processing[0].random() for _ in range(10)] != \
+        [quiet.processing[1].random() for _ in range(10)], f"{backend}: 各工位流相同"
+print("✅ 子流可复现，且各用途互不影响")
+
+
+def arrival_times(**params):
+    times = []
+    sim = ProductionLineSimulation(
+        callback=lambda e: times.append(e['timestamp']) if e['type'] == 'part_arrived' else None,
+        record_events=False, seed=5, **params)
+    sim.run(until=500)
+    return times
+
+
+# 同一种子下，加工时间或派工策略不同的方案到达序列相同
+baseline_arrivals = arrival_times()
+assert baseline_arrivals == arrival_times(processing_time_mean=8.0)
+assert baseline_arrivals == arrival_times(dispatch_policy='shortest_queue')
+# 方案对比按种子配对：相同方案的配对差值恒为0
+comparison = run_comparison([{}, {}], replications=3, duration=300, max_workers=1)
+for key, difference in comparison['scenarios'][1]['difference'].items():
+    assert difference['mean'] == 0 and difference['std'] == 0, f"{key}: 配对差值不为0"
+print("✅ 各方案共享到达序列，方案对比按种子配对")
+print()
+
 # 测试总结
 print("=" * 60)
 print("✅ 所有测试通过！")